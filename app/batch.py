@@ -0,0 +1,124 @@
+import os
+import sys
+import asyncio
+import argparse
+import traceback
+from dotenv import load_dotenv
+from app.pipeline import run_upload_pipeline
+from app.ingest import read_text
+
+load_dotenv()
+
+# Number of files processed at the same time in a batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_EXTENSIONS = (".srt", ".vtt", ".txt", ".pdf")
+
+async def process_batch(items, options=None, concurrency=BATCH_CONCURRENCY, on_result=None):
+    """
+    Process many files through the upload pipeline with at most concurrency in flight.
+
+    items is a list of (filename, load) pairs, where load is a coroutine function
+    returning (content, is_binary); files are only loaded once a slot is free.
+    Each transcript is saved as soon as its own pipeline finishes.
+    on_result is an optional callable invoked with each file's status as it completes.
+
+    Returns a list of per-file status dicts in the order of items.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def process_one(filename, load):
+        async with semaphore:
+            try:
+                content, is_binary = await load()
+                result = await run_upload_pipeline(content, filename, options, is_binary=is_binary)
+                if result["transcript_id"] is None:
+                    status = {"filename": filename, "status": "failed", "transcript_id": None,
+                              "error": "Could not save transcript"}
+                else:
+                    status = {"filename": filename, "status": "completed",
+                              "transcript_id": result["transcript_id"], "error": result["metadata_error"]}
+            except Exception as e:
+                print(f"Error processing {filename} in batch: {e}")
+                print(traceback.format_exc())
+                status = {"filename": filename, "status": "failed", "transcript_id": None, "error": str(e)}
+        if on_result:
+            on_result(status)
+        return status
+
+    return await asyncio.gather(*(process_one(filename, load) for filename, load in items))
+
+def _file_loader(path):
+    """Return a coroutine function that reads a local transcript file"""
+    async def load():
+        is_binary = path.lower().endswith(".pdf")
+        if is_binary:
+            return await asyncio.to_thread(_read_bytes, path), True
+        return await asyncio.to_thread(_read_text, path), False
+    return load
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def _read_text(path):
+    # Same encoding detection as uploads, for captions exported in other encodings
+    with open(path, "rb") as f:
+        return read_text(f)
+
+def collect_files(directory, recursive=False):
+    """List the transcript files (SRT, VTT, TXT, PDF) in a directory"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(BATCH_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+        if not recursive:
+            break
+    return sorted(paths)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process a directory of transcripts")
+    parser.add_argument("directory", help="Directory containing SRT, VTT, TXT or PDF files")
+    parser.add_argument("--recursive", action="store_true", help="Include subdirectories")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Files processed at the same time")
+    parser.add_argument("--format-style", default="Article", choices=["Article", "Transcript", "Meeting Notes", "Academic"])
+    parser.add_argument("--rewrite-options", default="", help="Comma-separated rewrite options")
+    parser.add_argument("--temperature", type=float, default=0.3)
+    parser.add_argument("--no-paragraphs", action="store_true")
+    parser.add_argument("--no-headings", action="store_true")
+    parser.add_argument("--no-grammar", action="store_true")
+    parser.add_argument("--no-highlights", action="store_true")
+    parser.add_argument("--no-cleanup", action="store_true", help="Skip caption dedup and filler removal")
+    args = parser.parse_args(argv)
+
+    paths = collect_files(args.directory, args.recursive)
+    if not paths:
+        print(f"No SRT, VTT, TXT or PDF files found in {args.directory}")
+        return 1
+
+    options = {
+        "add_paragraphs": not args.no_paragraphs,
+        "add_headings": not args.no_headings,
+        "fix_grammar": not args.no_grammar,
+        "highlight_key_points": not args.no_highlights,
+        "format_style": args.format_style,
+        "rewrite_options": [opt.strip() for opt in args.rewrite_options.split(",") if opt.strip()],
+        "temperature": args.temperature,
+        "cleanup": not args.no_cleanup,
+    }
+
+    def report(status):
+        detail = f"transcript {status['transcript_id']}" if status["status"] == "completed" else status["error"]
+        print(f"[{status['status']}] {status['filename']}: {detail}")
+
+    print(f"Processing {len(paths)} files with concurrency {args.concurrency}")
+    items = [(os.path.relpath(path, args.directory), _file_loader(path)) for path in paths]
+    results = asyncio.run(process_batch(items, options, args.concurrency, on_result=report))
+
+    failed = [r for r in results if r["status"] != "completed"]
+    print(f"Done: {len(results) - len(failed)} completed, {len(failed)} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    # python -m app.batch path/to/course_folder
+    sys.exit(main())
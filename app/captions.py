@@ -0,0 +1,98 @@
+import io
+import re
+import html
+from collections import namedtuple
+
+# One caption cue; start_ms and end_ms are None when the timing line could not be read
+Cue = namedtuple("Cue", ["index", "start_ms", "end_ms", "text"])
+
+CAPTION_EXTENSIONS = (".srt", ".vtt")
+
+_TIMESTAMP = r"(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+_TIMING_RE = re.compile(_TIMESTAMP + r"\s*-->\s*" + _TIMESTAMP)
+# HTML-like tags (<i>, <c.yellow>, <00:01:02.000>) and SSA overrides ({\an8})
+_TAG_RE = re.compile(r"<[^>]*>|\{\\[^}]*\}")
+# WebVTT blocks that are not cues
+_VTT_BLOCKS = ("WEBVTT", "NOTE", "STYLE", "REGION")
+
+def _to_ms(hours, minutes, seconds, fraction):
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(fraction.ljust(3, "0"))
+
+def _parse_timing(line):
+    """Return (start_ms, end_ms) for a cue timing line, (None, None) if it is garbled"""
+    match = _TIMING_RE.search(line)
+    if not match:
+        return None, None
+    groups = match.groups()
+    return _to_ms(*groups[:4]), _to_ms(*groups[4:])
+
+def clean_cue_line(line):
+    """Strip markup and decode entities in one line of cue text"""
+    return html.unescape(_TAG_RE.sub("", line)).strip()
+
+def iter_cues(lines):
+    """
+    Parse SRT or WebVTT captions in a single pass, yielding Cue tuples.
+
+    lines is any iterable of lines (an open file, or io.StringIO for a string),
+    so only the current cue is held in memory. Parsing is forgiving: cue numbers
+    are optional, missing blank lines between cues are tolerated, unreadable
+    timings yield a cue with None times and stray text outside cues is skipped.
+    """
+    index = 0
+    timing = None
+    text = []
+    pending_number = None
+    skipping_block = False
+
+    for raw_line in lines:
+        line = raw_line.strip().lstrip("\ufeff")
+
+        if not line:
+            if pending_number is not None:
+                text.append(pending_number)
+            if timing is not None and text:
+                index += 1
+                yield Cue(index, timing[0], timing[1], " ".join(text))
+            timing, text, pending_number = None, [], None
+            skipping_block = False
+            continue
+
+        if skipping_block:
+            continue
+
+        if "-->" in line:
+            # A new cue starts, even if the previous one was not closed by a blank line
+            if timing is not None and text:
+                index += 1
+                yield Cue(index, timing[0], timing[1], " ".join(text))
+            timing, text, pending_number = _parse_timing(line), [], None
+            continue
+
+        if timing is None:
+            # Outside a cue: cue numbers, WebVTT header/NOTE/STYLE blocks, or junk
+            if line.split(" ", 1)[0] in _VTT_BLOCKS:
+                skipping_block = True
+            continue
+
+        if line.isdigit() and pending_number is None:
+            # Might be the number of a following cue with no blank line before it
+            pending_number = line
+            continue
+        if pending_number is not None:
+            text.append(pending_number)
+            pending_number = None
+
+        cleaned = clean_cue_line(line)
+        if cleaned:
+            text.append(cleaned)
+
+    if pending_number is not None:
+        text.append(pending_number)
+    if timing is not None and text:
+        index += 1
+        yield Cue(index, timing[0], timing[1], " ".join(text))
+
+def iter_cues_from_string(content):
+    """iter_cues over caption content already held in a string"""
+    return iter_cues(io.StringIO(content))
@@ -0,0 +1,170 @@
+import os
+import re
+import zlib
+
+# Chunked formatting settings (token counts are estimates, see estimate_tokens)
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "2000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "120"))
+CHUNK_MAX_WORKERS = int(os.getenv("CHUNK_MAX_WORKERS", "4"))
+CHUNKED_THRESHOLD_TOKENS = int(os.getenv("CHUNKED_THRESHOLD_TOKENS", "6000"))
+# Cut chunks where the content says so (see _is_boundary) rather than wherever the budget
+# fills up, so an edit only moves the boundaries of the chunk it is in
+CHUNK_CONTENT_DEFINED = os.getenv("CHUNK_CONTENT_DEFINED", "true").lower() == "true"
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken is optional, fall back to the ~4 characters per token rule of thumb
+    _encoding = None
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+_HEADING = re.compile(r'^#{1,6}\s+(.*\S)\s*$')
+
+def estimate_tokens(text):
+    """Estimate the number of tokens the model will see for text"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def should_chunk(text, threshold=None):
+    """Return True if text is large enough to be formatted in chunks"""
+    threshold = CHUNKED_THRESHOLD_TOKENS if threshold is None else threshold
+    return estimate_tokens(text) > threshold
+
+def split_segments(text):
+    """
+    Split text into natural segments for chunking.
+    Paragraphs (blank-line separated) are preferred; a single wall of text
+    is split into sentences instead.
+    """
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+    if len(paragraphs) > 1:
+        return paragraphs, "\n\n"
+    return [s for s in _SENTENCE_SPLIT.split(text.strip()) if s], " "
+
+def _split_oversized(segment, token_budget):
+    """Break a single segment that exceeds the budget into sentence or word runs"""
+    pieces = [s for s in _SENTENCE_SPLIT.split(segment) if s]
+    if len(pieces) == 1:
+        pieces = segment.split()
+    parts, current, current_tokens = [], [], 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > token_budget:
+            parts.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        parts.append(" ".join(current))
+    return parts
+
+def _tail(text, overlap_tokens):
+    """Return roughly the last overlap_tokens worth of words from text"""
+    if overlap_tokens <= 0:
+        return ""
+    words = text.split()
+    tail, tokens = [], 0
+    for word in reversed(words):
+        tokens += estimate_tokens(word + " ")
+        if tokens > overlap_tokens:
+            break
+        tail.append(word)
+    return " ".join(reversed(tail))
+
+def _is_boundary(piece, piece_tokens, current_tokens, token_budget):
+    """
+    Decide from the content of a piece whether a chunk may end after it.
+    Past half the budget each piece ends the chunk with a probability proportional
+    to its size (from a hash of its text), so chunks average about three quarters of
+    the budget and the same text always yields the same boundaries.
+    """
+    if current_tokens < token_budget // 2:
+        return False
+    threshold = min(1.0, 4.0 * piece_tokens / max(1, token_budget))
+    return zlib.crc32(piece.lower().encode("utf-8")) < threshold * 0xFFFFFFFF
+
+def pack_chunks(segments, token_budget=None, overlap_tokens=None, joiner="\n\n", content_defined=None):
+    """
+    Pack segments (SRT cues, paragraphs or sentences) into chunks that stay
+    within token_budget. Chunks never split a segment unless the segment alone
+    is over budget. With content_defined (default CHUNK_CONTENT_DEFINED) chunks
+    also end on content-defined boundaries, so editing one part of a transcript
+    leaves the chunks around it unchanged.
+
+    Returns a list of dicts with:
+        text: the chunk content to format
+        context: the tail of the previous chunk, passed for continuity only
+    """
+    token_budget = CHUNK_TOKEN_BUDGET if token_budget is None else token_budget
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    content_defined = CHUNK_CONTENT_DEFINED if content_defined is None else content_defined
+
+    texts, current, current_tokens = [], [], 0
+    for segment in segments:
+        segment = segment.strip()
+        if not segment:
+            continue
+        segment_tokens = estimate_tokens(segment)
+        if segment_tokens > token_budget:
+            pieces = _split_oversized(segment, token_budget)
+        else:
+            pieces = [segment]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > token_budget:
+                texts.append(joiner.join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+            if content_defined and _is_boundary(piece, piece_tokens, current_tokens, token_budget):
+                texts.append(joiner.join(current))
+                current, current_tokens = [], 0
+    if current:
+        texts.append(joiner.join(current))
+
+    chunks = []
+    for i, chunk_text in enumerate(texts):
+        context = _tail(texts[i - 1], overlap_tokens) if i > 0 else ""
+        chunks.append({"text": chunk_text, "context": context})
+    return chunks
+
+def last_heading(text):
+    """Return the normalized text of the last markdown heading in text, if any"""
+    heading = None
+    for line in text.splitlines():
+        match = _HEADING.match(line)
+        if match:
+            heading = match.group(1).strip().lower()
+    return heading
+
+def strip_repeated_heading(output, previous_heading):
+    """
+    Drop leading blank lines and a leading heading that repeats previous_heading
+    (the model re-announcing the section the previous chunk ended in)
+    """
+    lines = output.strip().splitlines()
+    if lines and previous_heading is not None:
+        match = _HEADING.match(lines[0])
+        if match and match.group(1).strip().lower() == previous_heading:
+            lines.pop(0)
+    return "\n".join(lines).strip()
+
+def stitch_chunks(outputs):
+    """
+    Join formatted chunk outputs into one document.
+    A heading repeated across a chunk boundary is dropped so the document
+    keeps one heading per section.
+    """
+    parts = []
+    previous_heading = None
+    for output in outputs:
+        part = strip_repeated_heading(output, previous_heading)
+        if not part:
+            continue
+        parts.append(part)
+        previous_heading = last_heading(part) or previous_heading
+    return "\n\n".join(parts)
@@ -0,0 +1,166 @@
+import os
+import re
+from dotenv import load_dotenv
+from app.chunking import estimate_tokens
+
+load_dotenv()
+
+# Deterministic cleanup run on transcripts before they are sent to the LLM
+CLEANUP_ENABLED = os.getenv("CLEANUP_ENABLED", "true").lower() == "true"
+CLEANUP_DEDUP_CAPTIONS = os.getenv("CLEANUP_DEDUP_CAPTIONS", "true").lower() == "true"
+CLEANUP_REMOVE_FILLERS = os.getenv("CLEANUP_REMOVE_FILLERS", "true").lower() == "true"
+# Shortest word overlap between consecutive cues treated as a rolling-caption repeat
+CLEANUP_MIN_OVERLAP_WORDS = int(os.getenv("CLEANUP_MIN_OVERLAP_WORDS", "2"))
+# Share of consecutive cue pairs that must overlap before captions are treated as rolling
+CLEANUP_ROLLING_MIN_SHARE = float(os.getenv("CLEANUP_ROLLING_MIN_SHARE", "0.8"))
+
+# Fewest consecutive cue pairs needed to call captions rolling; shorter files are left alone
+_ROLLING_MIN_PAIRS = 3
+
+# Words of previously kept caption text compared against the next cue
+_OVERLAP_WINDOW = 50
+
+_WORD_RE = re.compile(r"\S+")
+# Fillers in lowercase or sentence case only, so acronyms such as "UM" survive.
+# "mm" on its own is a unit, so a bare m-filler needs an "h" or at least three m's
+_FILLER_RE = re.compile(
+    r"(?P<lead>[ \t]*)(?<![\w'-])(?:[Uu]u*m+|[Uu]u*h+|[Ee]e*r+m+|[Hh]h*m+|[Mm]m*h+m+|[Mm]m{2,})(?![\w'-])"
+    r"(?P<punct>[,.;:!?]?)(?P<trail>[ \t]*)"
+)
+# Sound annotations in auto captions, e.g. [Music] or (applause)
+_SOUND_TAG_RE = re.compile(r"[\[(](?:music|applause|laughter|laughs|inaudible|silence|noise)[\])][ \t]*", re.IGNORECASE)
+# Stutters: the same word repeated on one line, separated only by spaces or commas
+_REPEATED_WORD_RE = re.compile(r"\b([^\W\d_]+)((?:[ ,]+\1\b)+)")
+# Words that are doubled in ordinary grammar ("that that", "had had"); only collapsed when said three or more times
+_GRAMMATICAL_REPEATS = {"that", "had", "is", "was", "do", "does", "it", "in", "so", "very", "no", "well", "bye"}
+_SPACES_RE = re.compile("[ \t\u00a0]+")
+_SPACE_BEFORE_PUNCT_RE = re.compile(r" +([,.;:!?])")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n\s*\n+")
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+def _overlap(tail, words):
+    """Number of leading words that repeat the end of tail"""
+    for size in range(min(len(tail), len(words)), 0, -1):
+        if tail[-size:] == words[:size]:
+            return size
+    return 0
+
+def is_rolling(cues, min_overlap=None, min_share=None):
+    """
+    Whether captions scroll, i.e. most consecutive cues start with the words
+    the cue before ended on. Ordinary captions only overlap by chance, and
+    dedup would delete real words from them.
+    """
+    min_overlap = CLEANUP_MIN_OVERLAP_WORDS if min_overlap is None else min_overlap
+    min_share = CLEANUP_ROLLING_MIN_SHARE if min_share is None else min_share
+    pairs = rolled = 0
+    previous = None
+    for cue in cues:
+        words = [_normalize_word(word) for word in _WORD_RE.findall(cue)]
+        if previous and words:
+            pairs += 1
+            if _overlap(previous, words) >= min(min_overlap, len(words)):
+                rolled += 1
+        previous = words or previous
+    return pairs >= _ROLLING_MIN_PAIRS and rolled >= min_share * pairs
+
+def dedup_rolling_captions(cues, min_overlap=None):
+    """
+    Remove the words each cue repeats from the end of the text before it.
+    Auto-generated captions scroll, so every line shows up in two or three
+    consecutive cues; only the new words of each cue are kept and cues that
+    add nothing are dropped.
+    """
+    min_overlap = CLEANUP_MIN_OVERLAP_WORDS if min_overlap is None else min_overlap
+    kept = []
+    tail = []
+    for cue in cues:
+        words = _WORD_RE.findall(cue)
+        normalized = [_normalize_word(word) for word in words]
+        overlap = _overlap(tail, normalized)
+        if overlap < min_overlap and overlap < len(words):
+            overlap = 0
+        new_words = words[overlap:]
+        if new_words:
+            kept.append(" ".join(new_words))
+            tail = (tail + normalized[overlap:])[-_OVERLAP_WINDOW:]
+    return kept
+
+def dedup_repeated_lines(text):
+    """Drop lines that repeat the line right before them (rolling captions saved as text)"""
+    lines = []
+    previous = None
+    for line in text.split("\n"):
+        key = line.strip().lower()
+        if key and key == previous:
+            continue
+        lines.append(line)
+        previous = key if key else previous
+    return "\n".join(lines)
+
+def _collapse_repeat(match):
+    word = match.group(1)
+    if word.lower() in _GRAMMATICAL_REPEATS and len(re.findall(r"[ ,]+", match.group(2))) < 2:
+        return match.group(0)
+    return word
+
+def _drop_filler(match):
+    lead, punct, trail = match.group("lead", "punct", "trail")
+    before = match.string[:match.start()].rstrip(" \t")
+    if not before or before[-1] in ".!?\n":
+        # Opens a sentence ("Um, so", "Hmm. OK"): drop it with its punctuation
+        return lead
+    if punct and punct != ",":
+        # Ends a sentence or clause ("I said um. Then"): keep the boundary
+        return punct + trail
+    return lead if trail else ""
+
+def remove_fillers(text):
+    """Remove disfluencies ("um", "uh"), stuttered repeated words and caption sound tags"""
+    text = _SOUND_TAG_RE.sub("", text)
+    text = _FILLER_RE.sub(_drop_filler, text)
+    return _REPEATED_WORD_RE.sub(_collapse_repeat, text)
+
+def normalize_whitespace(text):
+    """Collapse runs of spaces, trim lines and keep at most one blank line between paragraphs"""
+    text = _SPACES_RE.sub(" ", text)
+    text = _SPACE_BEFORE_PUNCT_RE.sub(r"\1", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+def clean_transcript(text, segments=None, joiner=None, dedup=None, fillers=None):
+    """
+    Clean transcript text before formatting.
+    segments are the caption cues when available; they are cleaned individually,
+    and deduplicated when they roll, so chunking can still cut on cue boundaries.
+
+    Returns (text, segments, joiner, report) where report holds the token
+    counts before and after cleanup.
+    """
+    dedup = CLEANUP_DEDUP_CAPTIONS if dedup is None else dedup
+    fillers = CLEANUP_REMOVE_FILLERS if fillers is None else fillers
+    tokens_before = estimate_tokens(text)
+
+    def clean(piece):
+        return normalize_whitespace(remove_fillers(piece) if fillers else piece)
+
+    if segments is not None:
+        # Clean first so fillers and sound tags do not hide overlaps between cues
+        segments = [cleaned for cleaned in (clean(segment) for segment in segments) if cleaned]
+        if dedup and is_rolling(segments):
+            segments = dedup_rolling_captions(segments)
+        text = (joiner or " ").join(segments)
+    else:
+        if dedup:
+            text = dedup_repeated_lines(text)
+        text = clean(text)
+
+    tokens_after = estimate_tokens(text)
+    report = {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "reduction_pct": round(100.0 * (tokens_before - tokens_after) / tokens_before, 1) if tokens_before else 0.0,
+    }
+    return text, segments, joiner, report
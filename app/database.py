@@ -1,7 +1,13 @@
 import os
+import time
 import datetime
 import json
+import threading
+from collections import deque
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,8 +19,16 @@ DB_NAME = os.getenv("DB_NAME", "transcripts")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
 
+# Connection pool: connections opened up front, the most kept open per process, and how
+# long a caller waits for a free connection before the call fails
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+# Connections idle for longer than this are checked with SELECT 1 before being handed out
+DB_POOL_CHECK_IDLE_SECONDS = float(os.getenv("DB_POOL_CHECK_IDLE_SECONDS", "30"))
+
 def get_connection():
-    """Get a database connection"""
+    """Open a new database connection, outside the pool"""
     conn = psycopg2.connect(
         host=DB_HOST,
         port=DB_PORT,
@@ -24,581 +38,1588 @@ def get_connection():
     )
     return conn
 
+class PoolTimeout(Exception):
+    """No pooled connection became free within the pool timeout"""
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+    Idle connections are reused most recently used first; connections that have
+    sat idle for a while are health checked on checkout and replaced when broken.
+    When max_size connections are checked out, callers wait up to timeout seconds.
+    """
+
+    def __init__(self, min_size=1, max_size=10, timeout=30.0, check_idle_seconds=30.0, connect=get_connection):
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.check_idle_seconds = check_idle_seconds
+        self._connect = connect
+        self._closed = False
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        # (connection, time it was returned) for each idle connection
+        self._idle = deque()
+        # Open connections, idle or checked out
+        self._size = 0
+        # Checkout time of each connection in use, by id
+        self._checked_out = {}
+        self._pid = os.getpid()
+        self._started_at = time.monotonic()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "timeouts": 0,
+            "opened": 0,
+            "replaced": 0,
+            "busy_seconds": 0.0,
+        }
+
+    def _check_pid(self):
+        # Connections cannot be shared across a fork; a child starts with an empty pool
+        # and leaves the parent's connections alone
+        if self._pid != os.getpid():
+            self._reset()
+
+    def fill(self):
+        """Open connections until min_size are open"""
+        while True:
+            with self._cond:
+                self._check_pid()
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["opened"] += 1
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle_seconds:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Check a connection out; raises PoolTimeout when none becomes free in time"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                self._check_pid()
+                while True:
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"No database connection free after {self.timeout:g}s")
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                opened = True
+            elif self._healthy(conn, idle_since):
+                opened = False
+            else:
+                # Broken idle connection: drop it and try the next one
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                    self._stats["replaced"] += 1
+                continue
+
+            now = time.monotonic()
+            with self._cond:
+                self._checked_out[id(conn)] = now
+                self._stats["checkouts"] += 1
+                self._stats["opened"] += opened
+                if waited:
+                    self._stats["waits"] += 1
+                    self._stats["wait_seconds"] += now - started
+                    self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], now - started)
+            return conn
+
+    def putconn(self, conn):
+        """
+        Return a connection to the pool. An open transaction is rolled back;
+        closed or unusable connections are discarded.
+        """
+        keep = not conn.closed
+        if keep and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                keep = False
+        with self._cond:
+            checked_out_at = self._checked_out.pop(id(conn), None)
+            if checked_out_at is None:
+                # Checked out before a fork, or not from this pool
+                keep = False
+            else:
+                self._stats["busy_seconds"] += time.monotonic() - checked_out_at
+                if keep and not self._closed:
+                    self._idle.append((conn, time.monotonic()))
+                else:
+                    self._size -= 1
+                    keep = False
+            self._cond.notify()
+        if not keep and checked_out_at is not None:
+            self._discard(conn)
+
+    def close(self):
+        """Close the idle connections; checked out ones are closed when returned"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """
+        Size, wait times and utilization of the pool.
+        utilization is the share of connection time spent checked out since the pool
+        started (against max_size connections); current_utilization is the share of
+        max_size checked out right now.
+        """
+        with self._cond:
+            self._check_pid()
+            stats = dict(self._stats)
+            size, idle, in_use = self._size, len(self._idle), len(self._checked_out)
+        uptime = time.monotonic() - self._started_at
+        checkouts = stats["checkouts"]
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "idle": idle,
+            "in_use": in_use,
+            "checkouts": checkouts,
+            "waits": stats["waits"],
+            "timeouts": stats["timeouts"],
+            "opened": stats["opened"],
+            "replaced": stats["replaced"],
+            "avg_wait_ms": round(stats["wait_seconds"] * 1000 / checkouts, 3) if checkouts else 0.0,
+            "max_wait_ms": round(stats["max_wait_seconds"] * 1000, 3),
+            "current_utilization": round(in_use / self.max_size, 3),
+            "utilization": round(stats["busy_seconds"] / (self.max_size * uptime), 4) if uptime > 0 else 0.0,
+        }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, created (and filled to DB_POOL_MIN_SIZE) on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT_SECONDS, DB_POOL_CHECK_IDLE_SECONDS
+            )
+            try:
+                _pool.fill()
+            except Exception as e:
+                print(f"Error opening database connections: {e}")
+        return _pool
+
+def close_pool():
+    """Close the pooled connections, e.g. at shutdown"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+def pool_stats():
+    """Size, wait times and utilization of the connection pool"""
+    return get_pool().stats()
+
+@contextmanager
+def connection():
+    """
+    Check a connection out of the pool for a with block and return it afterwards.
+    Commit inside the block; anything left uncommitted is rolled back on return.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
 def save_transcript(filename, original_content, processed_content, format_style, source_type="transcript"):
     """Save a transcript to the database"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO transcripts (filename, original_content, processed_content, format_style, source_type) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-            (filename, original_content, processed_content, format_style, source_type)
-        )
-        transcript_id = cursor.fetchone()[0]
-        conn.commit()
-        return transcript_id
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO transcripts (filename, original_content, processed_content, format_style, source_type) VALUES (%s, %s, %s, %s, %s) RETURNING id",
+                (filename, original_content, processed_content, format_style, source_type)
+            )
+            transcript_id = cursor.fetchone()[0]
+            conn.commit()
+            return transcript_id
     except Exception as e:
         print(f"Error saving transcript: {e}")
         import traceback
         print(traceback.format_exc())  # Add this to get detailed error info
-        if conn:
-            conn.rollback()
         return None
-    finally:
-        if conn:
-            conn.close()
 
 def update_transcript(transcript_id, processed_content):
     """Update the processed content of an existing transcript"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE transcripts SET processed_content = %s WHERE id = %s",
-            (processed_content, transcript_id)
-        )
-        conn.commit()
-        return True
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE transcripts SET processed_content = %s WHERE id = %s",
+                (processed_content, transcript_id)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error updating transcript: {e}")
+        return False
+
+def update_transcript_source(transcript_id, original_content, processed_content, format_style):
+    """Replace the source, processed content and style of a transcript after reprocessing"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE transcripts SET original_content = %s, processed_content = %s, format_style = %s WHERE id = %s",
+                (original_content, processed_content, format_style, transcript_id)
+            )
+            conn.commit()
+            return True
     except Exception as e:
         print(f"Error updating transcript: {e}")
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
+
+def get_transcript_chunks(transcript_id):
+    """Return the stored chunk outputs of a transcript as a dict of chunk key to output"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT chunk_key, output_text FROM transcript_chunks WHERE transcript_id = %s",
+                (transcript_id,)
+            )
+            return {key: output for key, output in cursor.fetchall()}
+    except Exception as e:
+        print(f"Error retrieving transcript chunks: {e}")
+        return {}
+
+def save_transcript_chunks(transcript_id, chunks, max_rows):
+    """
+    Store the chunks of a formatting run (see processor.aformat_text_incremental)
+    and keep only the max_rows most recently used chunks of the transcript
+    """
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                """
+                INSERT INTO transcript_chunks (transcript_id, chunk_key, chunk_index, position, input_text, output_text)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (transcript_id, chunk_key) DO UPDATE
+                SET chunk_index = EXCLUDED.chunk_index,
+                    position = EXCLUDED.position,
+                    output_text = EXCLUDED.output_text,
+                    last_used_at = CURRENT_TIMESTAMP
+                """,
+                [
+                    (transcript_id, chunk["key"], index, chunk["position"], chunk["input"], chunk["output"])
+                    for index, chunk in enumerate(chunks)
+                ]
+            )
+            cursor.execute(
+                """
+                DELETE FROM transcript_chunks
+                WHERE transcript_id = %s AND chunk_key NOT IN (
+                    SELECT chunk_key FROM transcript_chunks
+                    WHERE transcript_id = %s
+                    ORDER BY last_used_at DESC
+                    LIMIT %s
+                )
+                """,
+                (transcript_id, transcript_id, max(max_rows, len(chunks)))
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error saving transcript chunks: {e}")
+        return False
 
 def get_transcript(transcript_id):
     """Retrieve a transcript by ID"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, filename, original_content, processed_content, format_style FROM transcripts WHERE id = %s", (transcript_id,))
-        result = cursor.fetchone()
-        if result:
-            return {
-                "id": result[0],
-                "filename": result[1],
-                "original_content": result[2],
-                "processed_content": result[3],
-                "format_style": result[4]
-            }
-        else:
-            return None
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, filename, original_content, processed_content, format_style, source_type FROM transcripts WHERE id = %s",
+                (transcript_id,)
+            )
+            result = cursor.fetchone()
+            if result:
+                return {
+                    "id": result[0],
+                    "filename": result[1],
+                    "original_content": result[2],
+                    "processed_content": result[3],
+                    "format_style": result[4],
+                    "source_type": result[5]
+                }
+            else:
+                return None
     except Exception as e:
         print(f"Error retrieving transcript: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
 
 def get_all_transcripts():
     """Retrieve all transcripts"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, filename, original_content, processed_content, format_style FROM transcripts ORDER BY created_at DESC")
-        transcripts = cursor.fetchall()
-        return [
-            {
-                "id": t[0],
-                "filename": t[1],
-                "original_content": t[2],
-                "processed_content": t[3],
-                "format_style": t[4]
-            }
-            for t in transcripts
-        ]
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, filename, original_content, processed_content, format_style FROM transcripts ORDER BY created_at DESC")
+            transcripts = cursor.fetchall()
+            return [
+                {
+                    "id": t[0],
+                    "filename": t[1],
+                    "original_content": t[2],
+                    "processed_content": t[3],
+                    "format_style": t[4]
+                }
+                for t in transcripts
+            ]
     except Exception as e:
         print(f"Error retrieving all transcripts: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
+
+# Fields the transcript listing can return, as SQL expressions; bodies are not listed,
+# they are fetched one transcript at a time with get_transcript
+TRANSCRIPT_LIST_FIELDS = {
+    "id": "id",
+    "filename": "filename",
+    "format_style": "format_style",
+    "source_type": "source_type",
+    "created_at": "created_at",
+    # octet_length reads the stored size without decompressing the body
+    "size": "octet_length(processed_content)",
+    "original_size": "octet_length(original_content)",
+    # substr only decompresses the start of the body
+    "preview": "substr(processed_content, 1, %(preview_chars)s)",
+}
+TRANSCRIPT_LIST_DEFAULT_FIELDS = ("id", "filename", "format_style", "created_at", "size", "preview")
+# Below this estimated row count the listing total is counted exactly
+_EXACT_COUNT_ROWS = 10000
+
+def encode_list_cursor(created_at, transcript_id):
+    """Opaque cursor for the transcript listing, pointing after a (created_at, id) row"""
+    return f"{created_at.isoformat()}~{transcript_id}"
+
+def decode_list_cursor(cursor_value):
+    """Return the (created_at, id) pair of a listing cursor; raises ValueError when malformed"""
+    created_at, _, transcript_id = cursor_value.rpartition("~")
+    return datetime.datetime.fromisoformat(created_at), int(transcript_id)
+
+def list_transcripts(limit=50, after=None, fields=None, preview_chars=200):
+    """
+    One page of transcripts, newest first, with keyset pagination on (created_at, id).
+    after is the next_cursor of the previous page; fields selects from
+    TRANSCRIPT_LIST_FIELDS (unknown fields raise ValueError).
+    Returns a dict with the items, next_cursor (None on the last page) and a total
+    row count, estimated from table statistics on large tables (total_is_estimate).
+    """
+    fields = list(fields or TRANSCRIPT_LIST_DEFAULT_FIELDS)
+    unknown = [field for field in fields if field not in TRANSCRIPT_LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    position = decode_list_cursor(after) if after else None
+    # created_at and id are always read to build the next cursor
+    columns = ["created_at", "id"] + [f"{TRANSCRIPT_LIST_FIELDS[field]} AS {field}" for field in fields]
+    params = {"preview_chars": preview_chars, "limit": limit + 1}
+    where = ""
+    if position:
+        where = "WHERE (created_at, id) < (%(after_created_at)s, %(after_id)s)"
+        params.update(after_created_at=position[0], after_id=position[1])
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {', '.join(columns)} FROM transcripts {where} "
+                "ORDER BY created_at DESC, id DESC LIMIT %(limit)s",
+                params
+            )
+            rows = cursor.fetchall()
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'transcripts'::regclass")
+            total = cursor.fetchone()[0]
+            estimated = total >= _EXACT_COUNT_ROWS
+            if not estimated:
+                cursor.execute("SELECT count(*) FROM transcripts")
+                total = cursor.fetchone()[0]
+
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_list_cursor(rows[-1][0], rows[-1][1])
+            items = []
+            for row in rows:
+                item = dict(zip(fields, row[2:]))
+                if "created_at" in item and item["created_at"]:
+                    item["created_at"] = item["created_at"].isoformat()
+                items.append(item)
+            return {
+                "items": items,
+                "next_cursor": next_cursor,
+                "total": total,
+                "total_is_estimate": estimated,
+            }
+    except Exception as e:
+        print(f"Error listing transcripts: {e}")
+        return {"items": [], "next_cursor": None, "total": 0, "total_is_estimate": False}
 
 def delete_transcript(transcript_id):
     """Delete a transcript by ID"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM transcripts WHERE id = %s", (transcript_id,))
-        conn.commit()
-        return True
+        with connection() as conn:
+            cursor = conn.cursor()
+            # Its analytics events and metadata are deleted with it; take them out of the rollups first
+            cursor.execute("SELECT id FROM transcripts WHERE id = %s FOR UPDATE", (transcript_id,))
+            params = {"transcript_id": transcript_id}
+            _update_rollups(
+                cursor, _ANALYTICS_ROLLUP_ROWS.format(source="analytics", where="a.transcript_id = %(transcript_id)s"),
+                -1, params
+            )
+            _update_rollups(cursor, _METADATA_ROLLUP_ROWS.format(where="m.transcript_id = %(transcript_id)s"), -1, params)
+            cursor.execute("DELETE FROM transcripts WHERE id = %s", (transcript_id,))
+            conn.commit()
+            return True
     except Exception as e:
         print(f"Error deleting transcript: {e}")
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def save_post_ideas(transcript_id, content):
     """Save post ideas to the database"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        with connection() as conn:
+            cursor = conn.cursor()
         
-        # Debug print to verify content
-        print(f"DEBUG: Saving post ideas. Content type: {type(content)}, length: {len(content)}")
+            # Debug print to verify content
+            print(f"DEBUG: Saving post ideas. Content type: {type(content)}, length: {len(content)}")
         
-        # Check if post ideas already exist for this transcript
-        cursor.execute(
-            "SELECT id FROM post_ideas WHERE transcript_id = %s",
-            (transcript_id,)
-        )
-        result = cursor.fetchone()
-        
-        if result:
-            # Update existing post ideas
-            cursor.execute(
-                "UPDATE post_ideas SET content = %s, created_at = CURRENT_TIMESTAMP WHERE transcript_id = %s",
-                (content, transcript_id)
-            )
-        else:
-            # Insert new post ideas
+            # Check if post ideas already exist for this transcript
             cursor.execute(
-                "INSERT INTO post_ideas (transcript_id, content) VALUES (%s, %s)",
-                (transcript_id, content)
+                "SELECT id FROM post_ideas WHERE transcript_id = %s",
+                (transcript_id,)
             )
+            result = cursor.fetchone()
         
-        conn.commit()
-        return True
+            if result:
+                # Update existing post ideas
+                cursor.execute(
+                    "UPDATE post_ideas SET content = %s, created_at = CURRENT_TIMESTAMP WHERE transcript_id = %s",
+                    (content, transcript_id)
+                )
+            else:
+                # Insert new post ideas
+                cursor.execute(
+                    "INSERT INTO post_ideas (transcript_id, content) VALUES (%s, %s)",
+                    (transcript_id, content)
+                )
+        
+            conn.commit()
+            return True
     except Exception as e:
         print(f"Error saving post ideas: {e}")
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def get_post_ideas(transcript_id):
     """Get post ideas for a transcript"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT content FROM post_ideas WHERE transcript_id = %s",
-            (transcript_id,)
-        )
-        result = cursor.fetchone()
-        # Return just the content string, not the whole tuple
-        return result[0] if result else None
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT content FROM post_ideas WHERE transcript_id = %s",
+                (transcript_id,)
+            )
+            result = cursor.fetchone()
+            # Return just the content string, not the whole tuple
+            return result[0] if result else None
     except Exception as e:
         print(f"Error retrieving post ideas: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
 
 def delete_post_ideas(transcript_id):
     """Delete post ideas for a transcript"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM post_ideas WHERE transcript_id = %s", (transcript_id,))
-        conn.commit()
-        return True
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM post_ideas WHERE transcript_id = %s", (transcript_id,))
+            conn.commit()
+            return True
     except Exception as e:
         print(f"Error deleting post ideas: {e}")
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def save_rewrite(transcript_id, content, options):
     """Save a rewritten transcript version to the database"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        options_str = ",".join(options) if isinstance(options, list) else options
+        with connection() as conn:
+            cursor = conn.cursor()
+            options_str = ",".join(options) if isinstance(options, list) else options
         
-        # First, check if a rewrite exists for this transcript
-        cursor.execute("SELECT id FROM rewrites WHERE transcript_id = %s", (transcript_id,))
-        existing_rewrite = cursor.fetchone()
+            # First, check if a rewrite exists for this transcript
+            cursor.execute("SELECT id FROM rewrites WHERE transcript_id = %s", (transcript_id,))
+            existing_rewrite = cursor.fetchone()
         
-        if existing_rewrite:
-            # Update existing rewrite
-            cursor.execute(
-                "UPDATE rewrites SET content = %s, options = %s WHERE transcript_id = %s",
-                (content, options_str, transcript_id)
-            )
-        else:
-            # Insert new rewrite
-            cursor.execute(
-                "INSERT INTO rewrites (transcript_id, content, options) VALUES (%s, %s, %s)",
-                (transcript_id, content, options_str)
-            )
+            if existing_rewrite:
+                # Update existing rewrite
+                cursor.execute(
+                    "UPDATE rewrites SET content = %s, options = %s WHERE transcript_id = %s",
+                    (content, options_str, transcript_id)
+                )
+            else:
+                # Insert new rewrite
+                cursor.execute(
+                    "INSERT INTO rewrites (transcript_id, content, options) VALUES (%s, %s, %s)",
+                    (transcript_id, content, options_str)
+                )
         
-        conn.commit()
-        return True
+            conn.commit()
+            return True
     except Exception as e:
         print(f"Error saving rewrite: {e}")
         import traceback
         print(traceback.format_exc())
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def get_rewrite(transcript_id):
     """Retrieve a rewritten transcript"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT content, options FROM rewrites WHERE transcript_id = %s", (transcript_id,))
-        result = cursor.fetchone()
-        if result:
-            content, options_str = result
-            options = options_str.split(",") if options_str else []
-            return {"content": content, "options": options}
-        else:
-            return None
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT content, options FROM rewrites WHERE transcript_id = %s", (transcript_id,))
+            result = cursor.fetchone()
+            if result:
+                content, options_str = result
+                options = options_str.split(",") if options_str else []
+                return {"content": content, "options": options}
+            else:
+                return None
     except Exception as e:
         print(f"Error retrieving rewrite: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
 
 def delete_rewrite(transcript_id):
     """Delete a rewritten transcript"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM rewrites WHERE transcript_id = %s", (transcript_id,))
-        conn.commit()
-        return True
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM rewrites WHERE transcript_id = %s", (transcript_id,))
+            conn.commit()
+            return True
     except Exception as e:
         print(f"Error deleting rewrite: {e}")
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def save_transcript_metadata(transcript_id, metadata):
     """Save transcript metadata to the database"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Convert Python objects to JSON strings
-        topics = json.dumps(metadata.get("topics", []))
-        keywords = json.dumps(metadata.get("keywords", []))
-        sentiment = json.dumps(metadata.get("sentiment", {}))
-        tags = json.dumps(metadata.get("tags", []))
+        with connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute(
-            """
-            INSERT INTO transcript_metadata (transcript_id, topics, keywords, sentiment, tags)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (transcript_id) DO UPDATE
-            SET topics = EXCLUDED.topics, 
-                keywords = EXCLUDED.keywords, 
-                sentiment = EXCLUDED.sentiment, 
-                tags = EXCLUDED.tags
-            """,
-            (transcript_id, topics, keywords, sentiment, tags)
-        )
-        conn.commit()
-        return True
+            # Convert Python objects to JSON strings
+            topics = json.dumps(metadata.get("topics", []))
+            keywords = json.dumps(metadata.get("keywords", []))
+            sentiment = json.dumps(metadata.get("sentiment", {}))
+            tags = json.dumps(metadata.get("tags", []))
+
+            # Replace the previous metadata's topic and sentiment counts in the rollups;
+            # the transcript row lock keeps concurrent saves for it from interleaving
+            cursor.execute("SELECT id FROM transcripts WHERE id = %s FOR NO KEY UPDATE", (transcript_id,))
+            rollup_rows = _METADATA_ROLLUP_ROWS.format(where="m.transcript_id = %(transcript_id)s")
+            _update_rollups(cursor, rollup_rows, -1, {"transcript_id": transcript_id})
+            cursor.execute(
+                """
+                INSERT INTO transcript_metadata (transcript_id, topics, keywords, sentiment, tags)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (transcript_id) DO UPDATE
+                SET topics = EXCLUDED.topics, 
+                    keywords = EXCLUDED.keywords, 
+                    sentiment = EXCLUDED.sentiment, 
+                    tags = EXCLUDED.tags
+                """,
+                (transcript_id, topics, keywords, sentiment, tags)
+            )
+            _update_rollups(cursor, rollup_rows, 1, {"transcript_id": transcript_id})
+            conn.commit()
+            return True
     except Exception as e:
         print(f"Error saving transcript metadata: {e}")
         import traceback
         print(traceback.format_exc())
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def get_transcript_metadata(transcript_id):
     """Retrieve transcript metadata by ID"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT topics, keywords, sentiment, tags FROM transcript_metadata WHERE transcript_id = %s",
-            (transcript_id,),
-        )
-        result = cursor.fetchone()
-        if result:
-            topics, keywords, sentiment, tags = result
-            
-            # More robust handling of JSON parsing
-            try:
-                topics = json.loads(topics) if isinstance(topics, str) else (topics or [])
-                keywords = json.loads(keywords) if isinstance(keywords, str) else (keywords or [])
-                sentiment = json.loads(sentiment) if isinstance(sentiment, str) else (sentiment or {})
-                tags = json.loads(tags) if isinstance(tags, str) else (tags or [])
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error in metadata: {e}")
-                # Provide default values if JSON parsing fails
-                topics = topics if isinstance(topics, list) else []
-                keywords = keywords if isinstance(keywords, list) else []
-                sentiment = sentiment if isinstance(sentiment, dict) else {}
-                tags = tags if isinstance(tags, list) else []
-            
-            return {
-                "topics": topics,
-                "keywords": keywords,
-                "sentiment": sentiment,
-                "tags": tags,
-            }
-        else:
-            return None
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT topics, keywords, sentiment, tags FROM transcript_metadata WHERE transcript_id = %s",
+                (transcript_id,),
+            )
+            result = cursor.fetchone()
+            if result:
+                return _metadata_from_row(*result)
+            else:
+                return None
     except Exception as e:
         print(f"Error retrieving transcript metadata: {e}")
         import traceback
         print(traceback.format_exc())  # Add full traceback
         return None
-    finally:
-        if conn:
-            conn.close()
+
+def _metadata_from_row(topics, keywords, sentiment, tags):
+    """Build the metadata dict from the JSON columns of a transcript_metadata row"""
+    # More robust handling of JSON parsing
+    try:
+        topics = json.loads(topics) if isinstance(topics, str) else (topics or [])
+        keywords = json.loads(keywords) if isinstance(keywords, str) else (keywords or [])
+        sentiment = json.loads(sentiment) if isinstance(sentiment, str) else (sentiment or {})
+        tags = json.loads(tags) if isinstance(tags, str) else (tags or [])
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error in metadata: {e}")
+        # Provide default values if JSON parsing fails
+        topics = topics if isinstance(topics, list) else []
+        keywords = keywords if isinstance(keywords, list) else []
+        sentiment = sentiment if isinstance(sentiment, dict) else {}
+        tags = tags if isinstance(tags, list) else []
+
+    return {
+        "topics": topics,
+        "keywords": keywords,
+        "sentiment": sentiment,
+        "tags": tags,
+    }
+
+def get_transcript_details(transcript_ids, include_bodies=True):
+    """
+    Retrieve transcripts with their metadata, post ideas and latest rewrite in one
+    query, for one or many ids.
+    Returns a dict of transcript id to {"transcript", "metadata", "post_ideas", "rewrite"};
+    ids that do not exist are left out. Without include_bodies the transcript and
+    rewrite contents are not read.
+    """
+    ids = list(dict.fromkeys(int(transcript_id) for transcript_id in transcript_ids))
+    if not ids:
+        return {}
+    bodies = "t.original_content, t.processed_content, r.content" if include_bodies else "NULL, NULL, NULL"
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT t.id, t.filename, t.format_style, t.source_type, t.created_at, {bodies},
+                       r.options, r.transcript_id IS NOT NULL, p.content,
+                       m.transcript_id IS NOT NULL, m.topics, m.keywords, m.sentiment, m.tags
+                FROM transcripts t
+                LEFT JOIN post_ideas p ON p.transcript_id = t.id
+                LEFT JOIN transcript_metadata m ON m.transcript_id = t.id
+                -- rewrites may hold several rows per transcript; only the latest is returned
+                LEFT JOIN LATERAL (
+                    SELECT transcript_id, content, options FROM rewrites
+                    WHERE transcript_id = t.id
+                    ORDER BY id DESC
+                    LIMIT 1
+                ) r ON TRUE
+                WHERE t.id = ANY(%s)
+                """,
+                (ids,)
+            )
+            details = {}
+            for row in cursor.fetchall():
+                (transcript_id, filename, format_style, source_type, created_at, original, processed,
+                 rewrite_content, rewrite_options, has_rewrite, post_ideas,
+                 has_metadata, topics, keywords, sentiment, tags) = row
+                transcript = {
+                    "id": transcript_id,
+                    "filename": filename,
+                    "format_style": format_style,
+                    "source_type": source_type,
+                    "created_at": created_at.isoformat() if created_at else None,
+                }
+                rewrite = None
+                if has_rewrite:
+                    rewrite = {"options": rewrite_options.split(",") if rewrite_options else []}
+                if include_bodies:
+                    transcript.update(original_content=original, processed_content=processed)
+                    if rewrite:
+                        rewrite["content"] = rewrite_content
+                details[transcript_id] = {
+                    "transcript": transcript,
+                    "metadata": _metadata_from_row(topics, keywords, sentiment, tags) if has_metadata else None,
+                    "post_ideas": post_ideas,
+                    "rewrite": rewrite,
+                }
+            return details
+    except Exception as e:
+        print(f"Error retrieving transcript details: {e}")
+        return {}
+
+def get_metadata_term_counts():
+    """
+    Return (counts, size): the number of transcripts using each keyword or tag
+    (lowercased), and the number of transcripts with metadata
+    """
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                WITH terms AS (
+                    SELECT transcript_id, lower(jsonb_array_elements_text(keywords)) AS term
+                    FROM transcript_metadata
+                    WHERE jsonb_typeof(keywords) = 'array'
+                    UNION
+                    SELECT transcript_id, lower(jsonb_array_elements_text(tags)) AS term
+                    FROM transcript_metadata
+                    WHERE jsonb_typeof(tags) = 'array'
+                )
+                SELECT term, COUNT(*) FROM terms GROUP BY term
+            """)
+            counts = dict(cursor.fetchall())
+            cursor.execute("SELECT COUNT(*) FROM transcript_metadata")
+            return counts, cursor.fetchone()[0]
+    except Exception as e:
+        print(f"Error retrieving metadata term counts: {e}")
+        return {}, 0
+
+def get_transcripts_for_metadata(after_id, limit, missing_only=True):
+    """
+    Return up to limit (id, text) pairs of transcripts with an id above after_id,
+    in id order, where text is the processed content (or the original if empty).
+    With missing_only, transcripts that already have metadata are skipped.
+    """
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            missing = "AND NOT EXISTS (SELECT 1 FROM transcript_metadata m WHERE m.transcript_id = t.id)" if missing_only else ""
+            cursor.execute(
+                f"""
+                SELECT t.id, COALESCE(NULLIF(t.processed_content, ''), t.original_content)
+                FROM transcripts t
+                WHERE t.id > %s {missing}
+                ORDER BY t.id
+                LIMIT %s
+                """,
+                (after_id, limit)
+            )
+            return cursor.fetchall()
+    except Exception as e:
+        print(f"Error retrieving transcripts for metadata: {e}")
+        return []
+
+def save_timestamp_index(transcript_id, cue_text, index_data, cue_count):
+    """Store the cue timestamp index (see timestamps.TimestampIndex) of a transcript"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO transcript_timestamps (transcript_id, cue_count, cue_text, index_data)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (transcript_id) DO UPDATE
+                SET cue_count = EXCLUDED.cue_count,
+                    cue_text = EXCLUDED.cue_text,
+                    index_data = EXCLUDED.index_data,
+                    created_at = CURRENT_TIMESTAMP
+                """,
+                (transcript_id, cue_count, cue_text, psycopg2.Binary(index_data))
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error saving timestamp index: {e}")
+        return False
+
+def get_timestamp_index(transcript_id):
+    """Return (cue_text, index_data) for a transcript, or None if it has no index"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT cue_text, index_data FROM transcript_timestamps WHERE transcript_id = %s",
+                (transcript_id,)
+            )
+            result = cursor.fetchone()
+            return (result[0], bytes(result[1])) if result else None
+    except Exception as e:
+        print(f"Error retrieving timestamp index: {e}")
+        return None
 
 def log_analytics_event(transcript_id, action_type, details=None):
-    """Log an analytics event"""
-    conn = None
+    """Log an analytics event right away (event_sink.record_event buffers it instead)"""
+    return save_analytics_events([{"transcript_id": transcript_id, "action_type": action_type, "details": details}])
+
+# --- Analytics rollups ---
+# analytics_rollups holds counts per (day, dimension, value) so the summary does not scan
+# the event and metadata history. Writers keep it current in the same transaction:
+# new events add their counts, metadata changes replace the old counts and deleted
+# transcripts remove theirs. rebuild_analytics_rollups recomputes it from scratch.
+
+# Rollup rows contributed by analytics events: their action type, the format style of
+# format events and each option of rewrite events
+_ANALYTICS_ROLLUP_ROWS = """
+    SELECT a.created_at::date AS day, d.dimension, d.value
+    FROM {source} a
+    CROSS JOIN LATERAL (
+        SELECT 'action_type', COALESCE(a.action_type, 'unknown')
+        UNION ALL
+        SELECT 'format_style', a.action_details->>'format_style'
+        WHERE a.action_type = 'format' AND a.action_details->>'format_style' IS NOT NULL
+        UNION ALL
+        SELECT 'rewrite_option', rewrite_option
+        FROM regexp_split_to_table(a.action_details->>'options', ',') AS rewrite_option
+        WHERE a.action_type = 'rewrite'
+    ) AS d(dimension, value)
+    WHERE a.created_at IS NOT NULL AND {where}
+"""
+# Rollup rows contributed by transcript metadata: each topic and the sentiment
+_METADATA_ROLLUP_ROWS = """
+    SELECT m.created_at::date AS day, d.dimension, d.value
+    FROM transcript_metadata m
+    CROSS JOIN LATERAL (
+        SELECT 'topic', topic
+        FROM jsonb_array_elements_text(CASE WHEN jsonb_typeof(m.topics) = 'array' THEN m.topics ELSE '[]'::jsonb END) AS topic
+        UNION ALL
+        SELECT 'sentiment', m.sentiment->>'classification'
+        WHERE m.sentiment->>'classification' IS NOT NULL
+    ) AS d(dimension, value)
+    WHERE m.created_at IS NOT NULL AND {where}
+"""
+_ROLLUP_UPSERT = """
+    INSERT INTO analytics_rollups (day, dimension, value, count)
+    SELECT day, dimension, value, {sign} * count(*) FROM ({rows}) AS r
+    GROUP BY day, dimension, value
+    -- A fixed order keeps concurrent writers from deadlocking on the same rollup rows
+    ORDER BY day, dimension, value
+    ON CONFLICT (day, dimension, value) DO UPDATE SET count = analytics_rollups.count + EXCLUDED.count
+"""
+
+def _update_rollups(cursor, rows, sign, params=None):
+    """Add (sign 1) or subtract (sign -1) the counts of a rollup rows query"""
+    cursor.execute(_ROLLUP_UPSERT.format(sign=int(sign), rows=rows), params)
+
+def _age_seconds(row):
+    # Buffered rows carry recorded_at, a time.monotonic() value; created_at is set from
+    # their age so it is in the database's clock, not the time the batch was written
+    recorded_at = row.get("recorded_at")
+    return max(0.0, time.monotonic() - recorded_at) if recorded_at is not None else 0.0
+
+def save_analytics_events(events):
+    """
+    Store a batch of analytics events (see event_sink.record_event) with one
+    multi-row INSERT, adding them to the rollups in the same statement.
+    Events of transcripts deleted in the meantime are skipped.
+    """
+    inserted = """
+        INSERT INTO analytics (transcript_id, action_type, action_details, created_at)
+        SELECT v.transcript_id, v.action_type, v.action_details,
+               CURRENT_TIMESTAMP - make_interval(secs => v.age_seconds)
+        FROM (VALUES %s) AS v(transcript_id, action_type, action_details, age_seconds)
+        WHERE v.transcript_id IS NULL OR EXISTS (SELECT 1 FROM transcripts t WHERE t.id = v.transcript_id)
+        RETURNING transcript_id, action_type, action_details, created_at
+    """
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        action_details = json.dumps(details) if details else '{}'
-        cursor.execute(
-            """
-            INSERT INTO analytics (transcript_id, action_type, action_details)
-            VALUES (%s, %s, %s)
-            """,
-            (transcript_id, action_type, action_details),
-        )
-        conn.commit()
-        return True
+        with connection() as conn:
+            cursor = conn.cursor()
+            psycopg2.extras.execute_values(
+                cursor,
+                f"WITH inserted AS ({inserted}) "
+                + _ROLLUP_UPSERT.format(sign=1, rows=_ANALYTICS_ROLLUP_ROWS.format(source="inserted", where="TRUE")),
+                [
+                    (event["transcript_id"], event["action_type"], json.dumps(event.get("details") or {}), _age_seconds(event))
+                    for event in events
+                ],
+                template="(%s::integer, %s, %s::jsonb, %s::double precision)",
+                page_size=len(events)
+            )
+            conn.commit()
+            return True
     except Exception as e:
-        print(f"Error logging analytics: {e}")
-        if conn:
-            conn.rollback()
+        print(f"Error logging analytics events: {e}")
         return False
-    finally:
-        if conn:
-            conn.close()
 
-def get_analytics_summary():
-    """Get summary analytics data"""
-    conn = None
+def rebuild_analytics_rollups():
+    """Recompute analytics_rollups from the analytics and transcript_metadata tables"""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Popular rewrite options - Use unnest to handle comma-separated values
-        cursor.execute("""
-            WITH option_values AS (
-                SELECT 
-                    transcript_id, 
-                    regexp_split_to_table(action_details->>'options', ',') AS option_value
-                FROM analytics
-                WHERE action_type = 'rewrite' AND action_details->>'options' IS NOT NULL
-            )
-            SELECT 
-                option_value AS "Options",
-                COUNT(*) AS "Count"
-            FROM option_values
-            GROUP BY option_value
-            ORDER BY "Count" DESC
-            LIMIT 10
-        """)
-        popular_options = cursor.fetchall()
-        
-        # Popular format styles
-        cursor.execute("""
-            SELECT 
-                action_details->>'format_style' AS "Format",
-                COUNT(*) AS "Count"
-            FROM analytics
-            WHERE action_type = 'format' AND action_details->>'format_style' IS NOT NULL
-            GROUP BY action_details->>'format_style'
-            ORDER BY "Count" DESC
-        """)
-        popular_formats = cursor.fetchall()
-        
-        # Action counts by type - ensure column names are correct
-        cursor.execute("""
-            SELECT 
-                COALESCE(action_type, 'unknown') as action_type,  -- Ensure no NULL values
-                COUNT(*) as count
-            FROM analytics
-            GROUP BY action_type
-            ORDER BY count DESC
-        """)
-        action_counts = cursor.fetchall()
-
-        # Print for debugging
-        print("Action counts from database:", action_counts)
-        
-        # Get common topics from metadata
-        cursor.execute("""
-            WITH topic_values AS (
-                SELECT jsonb_array_elements_text(topics) as topic
-                FROM transcript_metadata
-                WHERE topics IS NOT NULL
-            )
-            SELECT 
-                topic AS "Topic",
-                COUNT(*) AS "Count"
-            FROM topic_values
-            GROUP BY topic
-            ORDER BY "Count" DESC
-            LIMIT 10
-        """)
-        common_topics = cursor.fetchall()
-        
-        # Get sentiment distribution
-        cursor.execute("""
-            WITH sentiment_values AS (
-                SELECT 
-                    sentiment->>'classification' as sentiment_type
-                FROM transcript_metadata
-                WHERE sentiment IS NOT NULL AND sentiment->>'classification' IS NOT NULL
-            )
-            SELECT 
-                COALESCE(sentiment_type, 'neutral') AS "Sentiment",
-                COUNT(*) AS "Count"
-            FROM sentiment_values
-            GROUP BY sentiment_type
-            ORDER BY "Count" DESC
-        """)
-        sentiment_distribution = cursor.fetchall()
-        
-        # Return all data
-        return {
-            "popular_options": popular_options,
-            "popular_formats": popular_formats,
-            "action_counts": action_counts,
-            "common_topics": common_topics,
-            "sentiment_distribution": sentiment_distribution
-        }
+        with connection() as conn:
+            cursor = conn.cursor()
+            # Writers wait until the rebuild commits and then apply their changes on top of it.
+            # analytics_rollups is locked first, in the order writers take these tables.
+            cursor.execute(
+                "LOCK TABLE analytics_rollups, analytics, transcript_metadata IN SHARE ROW EXCLUSIVE MODE"
+            )
+            cursor.execute("DELETE FROM analytics_rollups")
+            _update_rollups(cursor, _ANALYTICS_ROLLUP_ROWS.format(source="analytics", where="TRUE"), 1)
+            _update_rollups(cursor, _METADATA_ROLLUP_ROWS.format(where="TRUE"), 1)
+            cursor.execute(
+                """
+                INSERT INTO analytics_rollup_state (id, built_at) VALUES (TRUE, CURRENT_TIMESTAMP)
+                ON CONFLICT (id) DO UPDATE SET built_at = EXCLUDED.built_at
+                """
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error rebuilding analytics rollups: {e}")
+        return False
+
+def _analytics_rollups_built():
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT built_at FROM analytics_rollup_state")
+            return cursor.fetchone() is not None
+    except Exception as e:
+        print(f"Error reading analytics rollup state: {e}")
+        return False
+
+def get_analytics_summary(days=None):
+    """
+    Get summary analytics data from the rollups, optionally limited to the last
+    days days; the rollups are built on first use
+    """
+    try:
+        if not _analytics_rollups_built():
+            rebuild_analytics_rollups()
+        with connection() as conn:
+            cursor = conn.cursor()
+            since = "day > CURRENT_DATE - %s" if days else "TRUE"
+            cursor.execute(
+                f"""
+                SELECT dimension, value, sum(count)::bigint
+                FROM analytics_rollups
+                WHERE {since}
+                GROUP BY dimension, value
+                HAVING sum(count) > 0
+                """,
+                (days,) if days else None
+            )
+            counts = {}
+            for dimension, value, count in cursor.fetchall():
+                counts.setdefault(dimension, []).append((value, count))
+            for values in counts.values():
+                values.sort(key=lambda item: (-item[1], item[0]))
+
+            return {
+                # Popular rewrite options
+                "popular_options": counts.get("rewrite_option", [])[:10],
+                # Popular format styles
+                "popular_formats": counts.get("format_style", []),
+                # Action counts by type
+                "action_counts": counts.get("action_type", []),
+                # Common topics from metadata
+                "common_topics": counts.get("topic", [])[:10],
+                # Sentiment distribution
+                "sentiment_distribution": counts.get("sentiment", [])
+            }
     except Exception as e:
         print(f"Error retrieving analytics: {e}")
         import traceback
         print(traceback.format_exc())
         return {}
-    finally:
-        if conn:
-            conn.close()
+
+def save_llm_call(call):
+    """Store one LLM call measurement (see llm_metrics.record_llm_call)"""
+    return save_llm_calls([call])
+
+def save_llm_calls(calls):
+    """Store a batch of LLM call measurements with one multi-row INSERT"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            psycopg2.extras.execute_values(
+                cursor,
+                """
+                INSERT INTO llm_calls (
+                    function_name, model, format_style, rewrite_options, prompt_version, prompt_tokens,
+                    completion_tokens, latency_ms, retries, status, cached, streamed, estimated_tokens, cost_usd, details,
+                    created_at
+                )
+                VALUES %s
+                """,
+                [
+                    (
+                        call["function_name"], call["model"], call["format_style"], call["rewrite_options"],
+                        call.get("prompt_version"),
+                        call["prompt_tokens"], call["completion_tokens"], call["latency_ms"], call["retries"],
+                        call["status"], call["cached"], call["streamed"], call["estimated_tokens"],
+                        call["cost_usd"], json.dumps(call["details"]), _age_seconds(call)
+                    )
+                    for call in calls
+                ],
+                template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, "
+                         "CURRENT_TIMESTAMP - make_interval(secs => %s::double precision))",
+                page_size=len(calls)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error logging LLM calls: {e}")
+        return False
+
+def get_llm_call_summary(days=None):
+    """
+    Get latency percentiles, token counts and cost of LLM calls,
+    optionally limited to the last days days.
+    Latency percentiles only include calls that reached the API (not cache hits).
+    """
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            since = "created_at > CURRENT_TIMESTAMP - make_interval(days => %s)" if days else "TRUE"
+            params = (days,) if days else ()
+
+            # Latency, tokens and cost per calling function and model
+            cursor.execute(f"""
+                SELECT
+                    function_name AS "Function",
+                    model AS "Model",
+                    COUNT(*) AS "Calls",
+                    COUNT(*) FILTER (WHERE cached) AS "Cache Hits",
+                    COUNT(*) FILTER (WHERE status <> 'ok') AS "Failures",
+                    COALESCE(SUM(retries), 0) AS "Retries",
+                    ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cached)) AS "p50 ms",
+                    ROUND(percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cached)) AS "p95 ms",
+                    ROUND(percentile_cont(0.99) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cached)) AS "p99 ms",
+                    ROUND(AVG(prompt_tokens) FILTER (WHERE NOT cached)) AS "Avg Prompt Tokens",
+                    ROUND(AVG(completion_tokens) FILTER (WHERE NOT cached)) AS "Avg Completion Tokens",
+                    ROUND(SUM(cost_usd), 4) AS "Cost USD"
+                FROM llm_calls
+                WHERE {since}
+                GROUP BY function_name, model
+                ORDER BY "Cost USD" DESC
+            """, params)
+            llm_call_stats = cursor.fetchall()
+
+            # Cost per formatting option combination
+            cursor.execute(f"""
+                SELECT
+                    COALESCE(format_style, '-') AS "Format",
+                    COALESCE(rewrite_options, '-') AS "Rewrite Options",
+                    COALESCE(prompt_version, '-') AS "Prompt Version",
+                    COUNT(*) AS "Calls",
+                    COALESCE(SUM(prompt_tokens + completion_tokens), 0) AS "Tokens",
+                    ROUND(percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cached)) AS "p95 ms",
+                    ROUND(SUM(cost_usd), 4) AS "Cost USD"
+                FROM llm_calls
+                WHERE {since} AND format_style IS NOT NULL
+                GROUP BY format_style, rewrite_options, prompt_version
+                ORDER BY "Cost USD" DESC
+                LIMIT 20
+            """, params)
+            llm_cost_by_options = cursor.fetchall()
+
+            # Overall totals
+            cursor.execute(f"""
+                SELECT
+                    COUNT(*),
+                    COALESCE(SUM(prompt_tokens), 0),
+                    COALESCE(SUM(completion_tokens), 0),
+                    COALESCE(ROUND(SUM(cost_usd), 4), 0),
+                    ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cached)),
+                    ROUND(percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cached)),
+                    ROUND(percentile_cont(0.99) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE NOT cached))
+                FROM llm_calls
+                WHERE {since}
+            """, params)
+            totals = cursor.fetchone()
+
+            return {
+                "llm_call_stats": llm_call_stats,
+                "llm_cost_by_options": llm_cost_by_options,
+                "llm_totals": {
+                    "calls": totals[0],
+                    "prompt_tokens": totals[1],
+                    "completion_tokens": totals[2],
+                    "cost_usd": totals[3],
+                    "p50_ms": totals[4],
+                    "p95_ms": totals[5],
+                    "p99_ms": totals[6],
+                }
+            }
+    except Exception as e:
+        print(f"Error retrieving LLM call summary: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return {}
+
+def get_cached_llm_response(cache_key, ttl_seconds):
+    """Return a cached LLM response if one exists and is younger than ttl_seconds"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            # Touch last_hit_at in the same round trip so size-based eviction keeps hot entries
+            cursor.execute(
+                """
+                UPDATE llm_cache SET last_hit_at = CURRENT_TIMESTAMP
+                WHERE cache_key = %s AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %s)
+                RETURNING response
+                """,
+                (cache_key, ttl_seconds)
+            )
+            result = cursor.fetchone()
+            conn.commit()
+            return result[0] if result else None
+    except Exception as e:
+        print(f"Error reading LLM cache: {e}")
+        return None
+
+def save_cached_llm_response(cache_key, model, response):
+    """Store an LLM response in the persistent cache"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO llm_cache (cache_key, model, response)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (cache_key) DO UPDATE
+                SET response = EXCLUDED.response,
+                    model = EXCLUDED.model,
+                    created_at = CURRENT_TIMESTAMP,
+                    last_hit_at = CURRENT_TIMESTAMP
+                """,
+                (cache_key, model, response)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error writing LLM cache: {e}")
+        return False
+
+def evict_llm_cache(ttl_seconds, max_rows):
+    """Delete expired cache rows and the least recently hit rows beyond max_rows"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM llm_cache WHERE created_at <= CURRENT_TIMESTAMP - make_interval(secs => %s)",
+                (ttl_seconds,)
+            )
+            expired = cursor.rowcount
+            cursor.execute(
+                """
+                DELETE FROM llm_cache WHERE cache_key IN (
+                    SELECT cache_key FROM llm_cache
+                    ORDER BY last_hit_at DESC
+                    OFFSET %s
+                )
+                """,
+                (max_rows,)
+            )
+            evicted = cursor.rowcount
+            conn.commit()
+            return expired + evicted
+    except Exception as e:
+        print(f"Error evicting LLM cache: {e}")
+        return 0
+
+def create_job(job_type, filename, payload, input_data):
+    """Queue a background job and return its id"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO jobs (job_type, filename, payload, input_data)
+                VALUES (%s, %s, %s, %s) RETURNING id
+                """,
+                (job_type, filename, json.dumps(payload), psycopg2.Binary(input_data))
+            )
+            job_id = cursor.fetchone()[0]
+            conn.commit()
+            return job_id
+    except Exception as e:
+        print(f"Error creating job: {e}")
+        return None
+
+def claim_next_job(stale_seconds=900, max_attempts=3):
+    """
+    Claim the oldest queued job for this worker.
+    FOR UPDATE SKIP LOCKED lets any number of workers poll the same table
+    without handing out a job twice. Running jobs whose worker has not sent
+    a heartbeat (touch_job) for stale_seconds are taken to be dead and picked up
+    again, or marked failed once they have used max_attempts.
+    """
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            # Stale jobs that already used their last attempt will not be claimed again, fail them
+            cursor.execute(
+                """
+                UPDATE jobs
+                SET status = 'failed', stage = 'failed', input_data = NULL,
+                    error = 'Worker lost after ' || attempts || ' attempts',
+                    finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND attempts >= %s
+                  AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                """,
+                (max_attempts, stale_seconds)
+            )
+            cursor.execute(
+                """
+                UPDATE jobs
+                SET status = 'running', stage = 'starting', attempts = attempts + 1,
+                    started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE attempts < %s AND (
+                        status = 'queued'
+                        OR (status = 'running' AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+                    )
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, job_type, filename, payload, input_data
+                """,
+                (max_attempts, stale_seconds)
+            )
+            result = cursor.fetchone()
+            conn.commit()
+            if not result:
+                return None
+            payload = result[3]
+            return {
+                "id": result[0],
+                "job_type": result[1],
+                "filename": result[2],
+                "payload": json.loads(payload) if isinstance(payload, str) else (payload or {}),
+                "input_data": bytes(result[4]) if result[4] is not None else b""
+            }
+    except Exception as e:
+        print(f"Error claiming job: {e}")
+        return None
+
+def update_job_stage(job_id, stage, progress):
+    """Record the stage a running job has reached"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE jobs SET stage = %s, progress = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (stage, progress, job_id)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error updating job stage: {e}")
+        return False
+
+def touch_job(job_id):
+    """Heartbeat for a running job, so it is not reclaimed as stale while a long stage runs"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE jobs SET updated_at = CURRENT_TIMESTAMP WHERE id = %s AND status = 'running'",
+                (job_id,)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error touching job: {e}")
+        return False
+
+def finish_job(job_id, status, result=None, error=None, transcript_id=None):
+    """Mark a job completed or failed; the input payload is dropped once it is done"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                UPDATE jobs
+                SET status = %s, stage = %s, progress = CASE WHEN %s = 'completed' THEN 100 ELSE progress END,
+                    result = %s, error = %s, transcript_id = %s, input_data = NULL,
+                    finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                """,
+                (status, status, status, json.dumps(result) if result is not None else None, error, transcript_id, job_id)
+            )
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error finishing job: {e}")
+        return False
+
+def get_job(job_id):
+    """Retrieve a job's status and result by ID"""
+    try:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT id, job_type, filename, status, stage, progress, result, error, transcript_id,
+                       attempts, created_at, started_at, finished_at
+                FROM jobs WHERE id = %s
+                """,
+                (job_id,)
+            )
+            result = cursor.fetchone()
+            if not result:
+                return None
+            job_result = result[6]
+            return {
+                "job_id": result[0],
+                "job_type": result[1],
+                "filename": result[2],
+                "status": result[3],
+                "stage": result[4],
+                "progress": result[5],
+                "result": json.loads(job_result) if isinstance(job_result, str) else job_result,
+                "error": result[7],
+                "transcript_id": result[8],
+                "attempts": result[9],
+                "created_at": result[10].isoformat() if result[10] else None,
+                "started_at": result[11].isoformat() if result[11] else None,
+                "finished_at": result[12].isoformat() if result[12] else None
+            }
+    except Exception as e:
+        print(f"Error retrieving job: {e}")
+        return None
 
 def ensure_tables_exist():
     """Create all required tables if they don't exist"""
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Create transcripts table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transcripts (
-                id SERIAL PRIMARY KEY,
-                filename VARCHAR(255) NOT NULL,
-                original_content TEXT NOT NULL,
-                processed_content TEXT NOT NULL,
-                format_style VARCHAR(50),
-                source_type VARCHAR(50) DEFAULT 'transcript',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        with connection() as conn:
+            cursor = conn.cursor()
         
-        # Check if source_type column exists, add if it doesn't
-        try:
+            # Create transcripts table
             cursor.execute("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name='transcripts' AND column_name='source_type'
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    id SERIAL PRIMARY KEY,
+                    filename VARCHAR(255) NOT NULL,
+                    original_content TEXT NOT NULL,
+                    processed_content TEXT NOT NULL,
+                    format_style VARCHAR(50),
+                    source_type VARCHAR(50) DEFAULT 'transcript',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
             """)
-            has_column = cursor.fetchone() is not None
+        
+            # Check if source_type column exists, add if it doesn't
+            try:
+                cursor.execute("""
+                    SELECT column_name 
+                    FROM information_schema.columns 
+                    WHERE table_name='transcripts' AND column_name='source_type'
+                """)
+                has_column = cursor.fetchone() is not None
             
-            if not has_column:
-                cursor.execute("ALTER TABLE transcripts ADD COLUMN source_type VARCHAR(50) DEFAULT 'transcript'")
-                conn.commit()
-                print("Added source_type column to transcripts table")
-        except Exception as e:
-            print(f"Error checking/adding source_type column: {e}")
-            conn.rollback()
+                if not has_column:
+                    cursor.execute("ALTER TABLE transcripts ADD COLUMN source_type VARCHAR(50) DEFAULT 'transcript'")
+                    conn.commit()
+                    print("Added source_type column to transcripts table")
+            except Exception as e:
+                print(f"Error checking/adding source_type column: {e}")
+                conn.rollback()
         
-        # Create post_ideas table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS post_ideas (
-                transcript_id INTEGER PRIMARY KEY REFERENCES transcripts(id) ON DELETE CASCADE,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+            # Create post_ideas table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS post_ideas (
+                    transcript_id INTEGER PRIMARY KEY REFERENCES transcripts(id) ON DELETE CASCADE,
+                    content TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
         
-        # Create rewrites table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS rewrites (
-                id SERIAL PRIMARY KEY,  -- This is the primary key, not transcript_id
-                transcript_id INTEGER REFERENCES transcripts(id) ON DELETE CASCADE,
-                content TEXT NOT NULL,
-                options TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+            # Create rewrites table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS rewrites (
+                    id SERIAL PRIMARY KEY,  -- This is the primary key, not transcript_id
+                    transcript_id INTEGER REFERENCES transcripts(id) ON DELETE CASCADE,
+                    content TEXT NOT NULL,
+                    options TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
         
-        # Create analytics table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS analytics (
-                id SERIAL PRIMARY KEY,
-                transcript_id INTEGER REFERENCES transcripts(id) ON DELETE CASCADE,
-                action_type VARCHAR(50) NOT NULL,
-                action_details JSONB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+            # Create cue timestamp index table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS transcript_timestamps (
+                    transcript_id INTEGER PRIMARY KEY REFERENCES transcripts(id) ON DELETE CASCADE,
+                    cue_count INTEGER NOT NULL,
+                    cue_text TEXT NOT NULL,
+                    index_data BYTEA NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Create per-chunk formatting table, used to reprocess only changed chunks
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS transcript_chunks (
+                    transcript_id INTEGER REFERENCES transcripts(id) ON DELETE CASCADE,
+                    chunk_key CHAR(64) NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    position VARCHAR(10) NOT NULL,
+                    input_text TEXT NOT NULL,
+                    output_text TEXT NOT NULL,
+                    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (transcript_id, chunk_key)
+                )
+            """)
+
+            # Create analytics table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS analytics (
+                    id SERIAL PRIMARY KEY,
+                    transcript_id INTEGER REFERENCES transcripts(id) ON DELETE CASCADE,
+                    action_type VARCHAR(50) NOT NULL,
+                    action_details JSONB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Create analytics rollup tables
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_rollups (
+                    day DATE NOT NULL,
+                    dimension VARCHAR(32) NOT NULL,
+                    value TEXT NOT NULL,
+                    count BIGINT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, dimension, value)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+                    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                    built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
         
-        # Create transcript_metadata table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transcript_metadata (
-                transcript_id INTEGER PRIMARY KEY REFERENCES transcripts(id) ON DELETE CASCADE,
-                topics JSONB,
-                keywords JSONB,
-                sentiment JSONB,
-                tags JSONB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+            # Create transcript_metadata table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS transcript_metadata (
+                    transcript_id INTEGER PRIMARY KEY REFERENCES transcripts(id) ON DELETE CASCADE,
+                    topics JSONB,
+                    keywords JSONB,
+                    sentiment JSONB,
+                    tags JSONB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
         
-        conn.commit()
-        print("All required tables created successfully")
-        return True
+            # Create llm_cache table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key CHAR(64) PRIMARY KEY,
+                    model VARCHAR(100),
+                    response TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_hit_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_hit_at ON llm_cache(last_hit_at)")
+
+            # Create LLM call measurements table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    id SERIAL PRIMARY KEY,
+                    function_name VARCHAR(100) NOT NULL,
+                    model VARCHAR(100),
+                    format_style VARCHAR(50),
+                    rewrite_options TEXT,
+                    prompt_version VARCHAR(16),
+                    prompt_tokens INTEGER DEFAULT 0,
+                    completion_tokens INTEGER DEFAULT 0,
+                    latency_ms INTEGER,
+                    retries INTEGER DEFAULT 0,
+                    status VARCHAR(20) DEFAULT 'ok',
+                    cached BOOLEAN DEFAULT FALSE,
+                    streamed BOOLEAN DEFAULT FALSE,
+                    estimated_tokens BOOLEAN DEFAULT FALSE,
+                    cost_usd NUMERIC(12, 6) DEFAULT 0,
+                    details JSONB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_created_at ON llm_calls(created_at)")
+        
+            # Create jobs table (background processing queue)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id SERIAL PRIMARY KEY,
+                    job_type VARCHAR(50) NOT NULL,
+                    filename VARCHAR(255),
+                    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                    stage VARCHAR(50) DEFAULT 'queued',
+                    progress INTEGER DEFAULT 0,
+                    payload JSONB,
+                    input_data BYTEA,
+                    result JSONB,
+                    error TEXT,
+                    transcript_id INTEGER REFERENCES transcripts(id) ON DELETE SET NULL,
+                    attempts INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created_at ON jobs(status, created_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_created_at_id ON transcripts(created_at, id)")
+        
+            conn.commit()
+            print("All required tables created successfully")
+            return True
     except Exception as e:
         print(f"Error creating tables: {e}")
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 def save_embedding(transcript_id, embedding):
-    conn = get_connection()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         # embedding should be a list or numpy array of floats
         cursor.execute(
@@ -606,12 +1627,9 @@ def save_embedding(transcript_id, embedding):
             (embedding, transcript_id)
         )
         conn.commit()
-    finally:
-        conn.close()
 
 def find_similar_transcripts(query_embedding, top_k=5):
-    conn = get_connection()
-    try:
+    with connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -623,6 +1641,4 @@ def find_similar_transcripts(query_embedding, top_k=5):
             """,
             (query_embedding, query_embedding, top_k)
         )
-        return cursor.fetchall()
-    finally:
-        conn.close()
\ No newline at end of file
+        return cursor.fetchall()
\ No newline at end of file
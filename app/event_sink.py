@@ -0,0 +1,189 @@
+import os
+import time
+import atexit
+import threading
+from collections import deque
+from dotenv import load_dotenv
+from app.database import save_analytics_events, save_llm_calls
+
+load_dotenv()
+
+# Rows written per batch; a full batch is flushed right away
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "200"))
+# Longest a buffered row waits before it is written
+EVENT_FLUSH_SECONDS = float(os.getenv("EVENT_FLUSH_SECONDS", "2.0"))
+# Most rows held in memory per sink; past it the overflow policy drops rows
+EVENT_BUFFER_MAX = int(os.getenv("EVENT_BUFFER_MAX", "10000"))
+# "drop_oldest" keeps the newest rows when the buffer is full, "drop_newest" rejects new ones
+EVENT_OVERFLOW = os.getenv("EVENT_OVERFLOW", "drop_oldest")
+
+class EventSink:
+    """
+    In-process buffer that writes rows in batches from a background thread.
+    write_batch(rows) stores a list of rows and returns True on success; failed
+    batches go back to the front of the buffer to be retried with the next flush.
+    The buffer holds at most max_buffered rows; past that rows are dropped
+    according to overflow and counted.
+    """
+
+    def __init__(self, name, write_batch, batch_size=EVENT_BATCH_SIZE, flush_seconds=EVENT_FLUSH_SECONDS,
+                 max_buffered=EVENT_BUFFER_MAX, overflow=EVENT_OVERFLOW):
+        self.name = name
+        self.write_batch = write_batch
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.max_buffered = max(self.batch_size, max_buffered)
+        self.overflow = overflow
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        # Held while a batch is written, so flush() waits for the background thread's batch
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._stats = {
+            "enqueued": 0,
+            "flushed": 0,
+            "dropped": 0,
+            "batches": 0,
+            "write_errors": 0,
+            "write_seconds": 0.0,
+        }
+
+    def add(self, row):
+        """Buffer a row; returns False when it was dropped"""
+        with self._cond:
+            if self._closed:
+                self._stats["dropped"] += 1
+                return False
+            self._stats["enqueued"] += 1
+            if len(self._buffer) >= self.max_buffered:
+                self._stats["dropped"] += 1
+                if self.overflow == "drop_newest":
+                    return False
+                self._buffer.popleft()
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+        self._ensure_thread()
+        return True
+
+    def _ensure_thread(self):
+        # Started on first use, and again in a forked child, where threads do not survive
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._closed or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-sink", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        failed = False
+        while True:
+            with self._cond:
+                if failed:
+                    # After a failed write wait a full interval before retrying, even with a full batch
+                    retry_at = time.monotonic() + self.flush_seconds
+                    while not self._closed and time.monotonic() < retry_at:
+                        self._cond.wait(retry_at - time.monotonic())
+                elif len(self._buffer) < self.batch_size and not self._closed:
+                    self._cond.wait(self.flush_seconds)
+                if self._closed:
+                    return
+            failed = not self.flush()
+
+    def _write(self, rows):
+        started = time.monotonic()
+        try:
+            ok = self.write_batch(rows)
+        except Exception as e:
+            print(f"Error writing {self.name} batch: {e}")
+            ok = False
+        with self._cond:
+            self._stats["write_seconds"] += time.monotonic() - started
+            if ok:
+                self._stats["batches"] += 1
+                self._stats["flushed"] += len(rows)
+                return True
+            self._stats["write_errors"] += 1
+            # Retry the batch later, dropping what no longer fits
+            room = self.max_buffered - len(self._buffer)
+            if room < len(rows):
+                self._stats["dropped"] += len(rows) - max(room, 0)
+                rows = rows[len(rows) - max(room, 0):]
+            self._buffer.extendleft(reversed(rows))
+            return False
+
+    def flush(self):
+        """Write everything buffered so far; stops at the first failed batch and returns False"""
+        with self._write_lock:
+            while True:
+                with self._cond:
+                    count = min(len(self._buffer), self.batch_size)
+                    rows = [self._buffer.popleft() for _ in range(count)]
+                if not rows:
+                    return True
+                if not self._write(rows):
+                    return False
+
+    def close(self):
+        """Stop the background thread and write the remaining rows"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_seconds + 5)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            buffered = len(self._buffer)
+        batches = stats["batches"]
+        return {
+            "buffered": buffered,
+            "max_buffered": self.max_buffered,
+            "overflow": self.overflow,
+            "enqueued": stats["enqueued"],
+            "flushed": stats["flushed"],
+            "dropped": stats["dropped"],
+            "batches": batches,
+            "write_errors": stats["write_errors"],
+            "avg_batch_size": round(stats["flushed"] / batches, 1) if batches else 0.0,
+            "avg_write_ms": round(stats["write_seconds"] * 1000 / (batches + stats["write_errors"]), 3)
+            if batches + stats["write_errors"] else 0.0,
+        }
+
+analytics_sink = EventSink("analytics", save_analytics_events)
+llm_call_sink = EventSink("llm_calls", save_llm_calls)
+_sinks = (analytics_sink, llm_call_sink)
+
+def record_event(transcript_id, action_type, details=None):
+    """
+    Buffer an analytics event (see database.log_analytics_event for the direct write).
+    The event keeps the time it was recorded, not the time its batch is written.
+    """
+    return analytics_sink.add({
+        "transcript_id": transcript_id,
+        "action_type": action_type,
+        "details": details or {},
+        "recorded_at": time.monotonic(),
+    })
+
+def flush_sinks():
+    """Write all buffered rows now"""
+    for sink in _sinks:
+        sink.flush()
+
+def close_sinks():
+    """Stop the sinks and write what is left, e.g. at shutdown"""
+    for sink in _sinks:
+        sink.close()
+
+def sink_stats():
+    """Buffered, flushed and dropped row counts per sink"""
+    return {sink.name: sink.stats() for sink in _sinks}
+
+# Scripts (python -m app.batch, python -m app.jobs) exit without a shutdown hook
+atexit.register(close_sinks)
@@ -0,0 +1,95 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pool used for CPU-bound stages (decoding, caption parsing, PDF extraction, markdown fixes):
+# "thread" or "process". Functions sent to a process pool must be importable module functions.
+CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", "thread")
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+
+_executor = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "in_flight": 0,
+    "busy_seconds": 0.0,
+}
+_started_at = time.monotonic()
+
+def _timed_call(fn, args, kwargs):
+    """Run fn in the pool and report how long it kept the worker busy"""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def get_executor():
+    """Return the shared CPU pool, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if CPU_EXECUTOR == "process":
+                _executor = ProcessPoolExecutor(max_workers=max(1, CPU_WORKERS))
+            else:
+                _executor = ThreadPoolExecutor(max_workers=max(1, CPU_WORKERS), thread_name_prefix="cpu")
+        return _executor
+
+def shutdown_executor():
+    """Stop the CPU pool, waiting for running tasks"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = None
+
+def _update(**changes):
+    with _stats_lock:
+        for name, delta in changes.items():
+            _stats[name] += delta
+
+async def run_cpu(fn, *args, **kwargs):
+    """
+    Run a CPU-bound function in the shared pool and await its result,
+    so the event loop keeps serving requests while it runs.
+    """
+    loop = asyncio.get_running_loop()
+    _update(submitted=1, in_flight=1)
+    try:
+        result, seconds = await loop.run_in_executor(get_executor(), _timed_call, fn, args, kwargs)
+    except BaseException:
+        _update(failed=1, in_flight=-1)
+        raise
+    _update(completed=1, in_flight=-1, busy_seconds=seconds)
+    return result
+
+def executor_stats():
+    """
+    Queue depth and utilization of the CPU pool.
+    utilization is the share of worker time spent on tasks since the process started;
+    current_utilization is the share of workers busy right now.
+    """
+    workers = max(1, CPU_WORKERS)
+    with _stats_lock:
+        stats = dict(_stats)
+    uptime = time.monotonic() - _started_at
+    running = min(stats["in_flight"], workers)
+    finished = stats["completed"]
+    return {
+        "mode": CPU_EXECUTOR,
+        "workers": workers,
+        "running": running,
+        "queue_depth": stats["in_flight"] - running,
+        "submitted": stats["submitted"],
+        "completed": finished,
+        "failed": stats["failed"],
+        "avg_task_seconds": round(stats["busy_seconds"] / finished, 4) if finished else 0.0,
+        "current_utilization": round(running / workers, 3),
+        "utilization": round(stats["busy_seconds"] / (workers * uptime), 4) if uptime > 0 else 0.0,
+    }
@@ -0,0 +1,114 @@
+import os
+import re
+import math
+from collections import Counter
+from dotenv import load_dotenv
+from app.chunking import estimate_tokens
+
+load_dotenv()
+
+# Token budget of the transcript sample sent for metadata analysis
+METADATA_SAMPLE_TOKENS = int(os.getenv("METADATA_SAMPLE_TOKENS", "2000"))
+# Sections the transcript is divided into; each contributes its best sentences to the sample
+METADATA_SAMPLE_SECTIONS = int(os.getenv("METADATA_SAMPLE_SECTIONS", "8"))
+
+# Caption text often has no punctuation; longer "sentences" are cut into runs of this many words
+_MAX_SENTENCE_WORDS = 40
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9'-]*[a-z0-9]|[a-z0-9]")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are aren't as at be because been before being
+below between both but by can can't could couldn't did didn't do does doesn't doing don't down during each
+even few for from further get gets getting go goes going gonna got had hadn't has hasn't have haven't having
+he he'd he'll he's her here here's hers herself him himself his how how's i i'd i'll i'm i've if in into is
+isn't it it's its itself just kind know let let's like lot made make many may me might more most much must
+mustn't my myself need no nor not now of off oh ok okay on once one only or other ought our ours ourselves
+out over own really right said say says see so some something still such sure than that that's the their
+theirs them themselves then there there's these they they'd they'll they're they've thing things think this
+those though through to too uh um under until up us very want was wasn't way we we'd we'll we're we've well
+were weren't what what's when when's where where's which while who who's whom why why's will with won't
+would wouldn't yeah yes you you'd you'll you're you've your yours yourself yourselves
+actually anyway anything back basically bit come comes coming day every everything first give good great
+guys last little look looking lots maybe mean means next pretty probably put quite start stuff take takes
+talk talking tell time times today use used using
+""".split())
+
+def words(text):
+    """Lowercased word tokens of text"""
+    return _WORD_RE.findall(text.lower())
+
+def content_words(text):
+    """Word tokens of text without stopwords and numbers"""
+    return [word for word in words(text) if word not in STOPWORDS and not word.isdigit()]
+
+def split_sentences(text):
+    """Split text into sentences, cutting unpunctuated runs into short word windows"""
+    sentences = []
+    for sentence in _SENTENCE_SPLIT.split(text):
+        sentence_words = sentence.split()
+        for start in range(0, len(sentence_words), _MAX_SENTENCE_WORDS):
+            sentences.append(" ".join(sentence_words[start:start + _MAX_SENTENCE_WORDS]))
+    return [sentence for sentence in sentences if sentence]
+
+def tfidf_sentence_scores(sentences):
+    """
+    Score each sentence by how representative it is of the whole text: the cosine
+    similarity of its TF-IDF vector (sentences as documents) to the document centroid
+    """
+    tokenized = [Counter(content_words(sentence)) for sentence in sentences]
+    document_frequency = Counter(term for terms in tokenized for term in terms)
+    count = len(sentences)
+    idf = {term: math.log((1 + count) / (1 + frequency)) + 1 for term, frequency in document_frequency.items()}
+
+    vectors = []
+    centroid = Counter()
+    for terms in tokenized:
+        vector = {term: (1 + math.log(frequency)) * idf[term] for term, frequency in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        vector = {term: weight / norm for term, weight in vector.items()} if norm else {}
+        vectors.append(vector)
+        centroid.update(vector)
+    centroid_norm = math.sqrt(sum(weight * weight for weight in centroid.values())) or 1.0
+    return [sum(weight * centroid[term] for term, weight in vector.items()) / centroid_norm for vector in vectors]
+
+def sample_text(text, token_budget=None, sections=None):
+    """
+    Select a representative sample of text within token_budget.
+    The text is divided into equal sections, each given an equal share of the
+    budget and filled with its highest scoring sentences, so the sample covers
+    the whole transcript rather than its opening. Sentences keep their original
+    order; gaps between them are marked with "...".
+
+    Returns (sample, sampled), where sampled is False when the text already fits.
+    """
+    token_budget = METADATA_SAMPLE_TOKENS if token_budget is None else token_budget
+    sections = METADATA_SAMPLE_SECTIONS if sections is None else sections
+    if estimate_tokens(text) <= token_budget:
+        return text, False
+
+    sentences = split_sentences(text)
+    scores = tfidf_sentence_scores(sentences)
+    sections = max(1, min(sections, len(sentences)))
+    section_budget = token_budget // sections
+    selected = set()
+    for section in range(sections):
+        start = section * len(sentences) // sections
+        end = (section + 1) * len(sentences) // sections
+        used = 0
+        for index in sorted(range(start, end), key=lambda i: scores[i], reverse=True):
+            # One extra token for the space or "..." joining it to the sample
+            tokens = estimate_tokens(sentences[index]) + 1
+            if used + tokens > section_budget:
+                continue
+            selected.add(index)
+            used += tokens
+
+    parts = []
+    previous = None
+    for index in sorted(selected):
+        if previous is not None and index != previous + 1:
+            parts.append("...")
+        parts.append(sentences[index])
+        previous = index
+    return " ".join(parts), True
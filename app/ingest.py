@@ -0,0 +1,103 @@
+import os
+import codecs
+import tempfile
+from dotenv import load_dotenv
+
+try:
+    # Installed with requests; only used when a file is neither UTF-8 nor marked with a BOM
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+
+load_dotenv()
+
+# Largest accepted upload, checked while the upload is read
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# Size of each read from the upload stream
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Uploads larger than this are spooled to disk instead of memory
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(5 * 1024 * 1024)))
+
+# Bytes looked at to pick the encoding of a text upload
+_SAMPLE_BYTES = 64 * 1024
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+class UploadTooLarge(Exception):
+    """An upload exceeded the configured maximum size"""
+
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds the maximum size of {max_bytes // (1024 * 1024)} MB")
+        self.max_bytes = max_bytes
+
+async def spool_upload(file, max_bytes=None):
+    """
+    Copy an UploadFile into a SpooledTemporaryFile chunk by chunk.
+    Raises UploadTooLarge as soon as more than max_bytes have been read.
+    Returns the spool, rewound to the start; the caller closes it.
+    """
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    if getattr(file, "size", None) and file.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+def detect_encoding(sample):
+    """Pick the encoding of text from its first bytes: BOM, then UTF-8, then a best guess"""
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # Not final: the sample may end part way through a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    if from_bytes is not None:
+        match = from_bytes(sample).best()
+        if match is not None:
+            return match.encoding
+    return "cp1252"
+
+def iter_decoded_chunks(spool, encoding=None):
+    """
+    Decode a spooled upload incrementally, one read at a time.
+    The encoding is detected from the first bytes when not given; undecodable
+    bytes are replaced rather than failing the upload.
+    """
+    spool.seek(0)
+    if encoding is None:
+        encoding = detect_encoding(spool.read(_SAMPLE_BYTES))
+        spool.seek(0)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    while True:
+        chunk = spool.read(UPLOAD_CHUNK_BYTES)
+        text = decoder.decode(chunk, final=not chunk)
+        if text:
+            yield text
+        if not chunk:
+            break
+
+def read_text(spool, encoding=None):
+    """Decode a spooled upload into a single string"""
+    return "".join(iter_decoded_chunks(spool, encoding))
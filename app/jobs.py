@@ -0,0 +1,111 @@
+import os
+import asyncio
+import traceback
+from dotenv import load_dotenv
+from app.database import create_job, claim_next_job, update_job_stage, touch_job, finish_job
+from app.pipeline import STAGE_PROGRESS, run_upload_pipeline
+from app.executor import run_cpu
+
+load_dotenv()
+
+# Background job settings
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "900"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+_worker_tasks = []
+_stop_event = None
+
+def enqueue_upload_job(content, filename, options, is_binary=False, source_type="transcript"):
+    """
+    Queue an upload for background processing and return the job id
+    content is stored as bytes; text content is decoded again by the worker.
+    """
+    input_data = content if is_binary else content.encode("utf-8")
+    payload = {
+        "options": options,
+        "is_binary": is_binary,
+        "source_type": source_type,
+    }
+    return create_job("upload", filename, payload, input_data)
+
+async def _heartbeat(job_id, interval):
+    """Touch the job every interval seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(touch_job, job_id)
+
+async def _run_job(job):
+    """Run one claimed job through the upload pipeline and record the outcome"""
+    job_id = job["id"]
+    payload = job["payload"]
+    is_binary = payload.get("is_binary", False)
+
+    progress = {"value": 0}
+
+    async def on_stage(stage):
+        # Stages overlap, so only ever move the reported progress forward
+        progress["value"] = max(progress["value"], STAGE_PROGRESS.get(stage, 0))
+        await asyncio.to_thread(update_job_stage, job_id, stage, progress["value"])
+
+    # A single stage can outlast JOB_STALE_SECONDS, keep the job from being reclaimed meanwhile
+    heartbeat = asyncio.create_task(_heartbeat(job_id, max(1.0, JOB_STALE_SECONDS / 3)))
+    try:
+        content = job["input_data"] if is_binary else await run_cpu(bytes.decode, job["input_data"], "utf-8")
+        result = await run_upload_pipeline(
+            content, job["filename"], payload.get("options"), is_binary=is_binary,
+            source_type=payload.get("source_type", "transcript"), on_stage=on_stage
+        )
+        if is_binary:
+            # Raw PDF bytes are not JSON serializable and not useful to the caller
+            result["original_content"] = None
+        await asyncio.to_thread(
+            finish_job, job_id, "completed", result=result, transcript_id=result["transcript_id"]
+        )
+    except Exception as e:
+        print(f"Error running job {job_id}: {e}")
+        print(traceback.format_exc())
+        await asyncio.to_thread(finish_job, job_id, "failed", error=str(e))
+    finally:
+        heartbeat.cancel()
+
+async def worker_loop(worker_id, stop_event):
+    """Poll the jobs table and run jobs until stop_event is set"""
+    print(f"Job worker {worker_id} started")
+    while not stop_event.is_set():
+        job = await asyncio.to_thread(claim_next_job, JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+        if job is None:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await _run_job(job)
+    print(f"Job worker {worker_id} stopped")
+
+def start_job_workers(count=JOB_WORKERS):
+    """Start count worker tasks on the running event loop"""
+    global _stop_event
+    _stop_event = asyncio.Event()
+    for worker_id in range(count):
+        _worker_tasks.append(asyncio.create_task(worker_loop(worker_id, _stop_event)))
+
+async def stop_job_workers():
+    """Signal the workers to stop and wait for their current jobs to finish"""
+    if _stop_event is None:
+        return
+    _stop_event.set()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+
+async def _run_workers(count):
+    start_job_workers(count)
+    try:
+        await asyncio.gather(*_worker_tasks)
+    finally:
+        await stop_job_workers()
+
+if __name__ == "__main__":
+    # Run a standalone worker pool: python -m app.jobs
+    asyncio.run(_run_workers(JOB_WORKERS))
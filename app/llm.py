@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+from dotenv import load_dotenv
+from app.chunking import estimate_tokens
+from app.llm_cache import LLM_CACHE_ENABLED, cache_key, response_cache
+from app.llm_scheduler import LLMCallError, run_with_retries, arun_with_retries
+from app.llm_metrics import record_llm_call, response_usage
+from app.llm_backends import get_backend
+
+load_dotenv()
+
+AI_MODEL = os.getenv("AI_MODEL", "gpt-4")
+
+def _completion_kwargs(messages, temperature, max_tokens, response_format, model):
+    """Build the keyword arguments shared by the sync and async calls"""
+    kwargs = {
+        "model": model or AI_MODEL,
+        "messages": messages,
+        "temperature": temperature,
+    }
+    if max_tokens is not None:
+        kwargs["max_tokens"] = max_tokens
+    if response_format is not None:
+        kwargs["response_format"] = response_format
+    return kwargs
+
+def _prompt_tokens(kwargs):
+    return sum(estimate_tokens(m["content"]) for m in kwargs["messages"])
+
+def _estimate_call_tokens(kwargs):
+    """Estimate prompt plus completion tokens for rate limiting"""
+    prompt_tokens = _prompt_tokens(kwargs)
+    # Formatting output is about as long as its input when no cap is given
+    completion_tokens = kwargs.get("max_tokens") or prompt_tokens
+    return prompt_tokens + completion_tokens
+
+def _response_content(response):
+    content = response["content"]
+    if content is None or not content.strip():
+        raise LLMCallError("LLM returned an empty response", status="invalid_response")
+    return content
+
+def model_label(model=None):
+    """
+    Model name used for caching and measurements; responses of other backends
+    are labelled with the backend name so they never mix with real OpenAI output
+    """
+    model = model or AI_MODEL
+    backend = get_backend()
+    return model if backend.name == "openai" else f"{backend.name}:{model}"
+
+def _model_label(kwargs):
+    return model_label(kwargs["model"])
+
+def _cache_key_for(kwargs, model_label, cache):
+    if not (cache and LLM_CACHE_ENABLED):
+        return None
+    return cache_key(
+        model_label, kwargs["messages"], kwargs["temperature"],
+        kwargs.get("max_tokens"), kwargs.get("response_format")
+    )
+
+def chat_completion(messages, temperature=0.3, max_tokens=None, response_format=None, model=None, cache=True,
+                    call_info=None):
+    """
+    Run a chat completion and return the content of the first choice
+    Identical requests are answered from the response cache unless cache is False.
+    Calls go through the shared rate limiter and are retried on rate limits and
+    server errors; LLMCallError is raised if the call ultimately fails.
+    call_info (see llm_metrics.call_info) labels the measurement recorded for the call.
+    """
+    started = time.monotonic()
+    kwargs = _completion_kwargs(messages, temperature, max_tokens, response_format, model)
+    model_label = _model_label(kwargs)
+    key = _cache_key_for(kwargs, model_label, cache)
+    if key:
+        cached = response_cache.get(key)
+        if cached is not None:
+            record_llm_call(call_info, model_label, started, cached=True)
+            return cached
+
+    stats = {}
+    try:
+        response = run_with_retries(
+            lambda: get_backend().complete(kwargs), _estimate_call_tokens(kwargs), stats
+        )
+        content = _response_content(response)
+    except LLMCallError as e:
+        record_llm_call(call_info, model_label, started, retries=stats.get("retries", 0), status=e.status)
+        raise
+    usage = response_usage(response) or (_prompt_tokens(kwargs), estimate_tokens(content))
+    record_llm_call(call_info, model_label, started, *usage, retries=stats.get("retries", 0))
+
+    if key:
+        response_cache.put(key, model_label, content)
+    return content
+
+async def achat_completion(messages, temperature=0.3, max_tokens=None, response_format=None, model=None, cache=True,
+                           call_info=None):
+    """
+    Async version of chat_completion.
+    Uses the non-blocking acreate call so the event loop keeps serving other
+    requests while the completion is in flight.
+    """
+    started = time.monotonic()
+    kwargs = _completion_kwargs(messages, temperature, max_tokens, response_format, model)
+    model_label = _model_label(kwargs)
+    key = _cache_key_for(kwargs, model_label, cache)
+    if key:
+        # The persistent tier is a blocking database lookup
+        cached = await asyncio.to_thread(response_cache.get, key)
+        if cached is not None:
+            record_llm_call(call_info, model_label, started, cached=True)
+            return cached
+
+    stats = {}
+    try:
+        response = await arun_with_retries(
+            lambda: get_backend().acomplete(kwargs), _estimate_call_tokens(kwargs), stats
+        )
+        content = _response_content(response)
+    except LLMCallError as e:
+        record_llm_call(call_info, model_label, started, retries=stats.get("retries", 0), status=e.status)
+        raise
+    usage = response_usage(response) or (_prompt_tokens(kwargs), estimate_tokens(content))
+    record_llm_call(call_info, model_label, started, *usage, retries=stats.get("retries", 0))
+
+    if key:
+        await asyncio.to_thread(response_cache.put, key, model_label, content)
+    return content
+
+async def astream_chat_completion(messages, temperature=0.3, max_tokens=None, response_format=None, model=None, cache=True,
+                                  call_info=None):
+    """
+    Stream a chat completion, yielding content deltas as the model produces them.
+    A cached response is yielded in one piece; a completed stream is cached.
+    Streams do not report usage, so the recorded token counts are estimates.
+    """
+    started = time.monotonic()
+    kwargs = _completion_kwargs(messages, temperature, max_tokens, response_format, model)
+    model_label = _model_label(kwargs)
+    key = _cache_key_for(kwargs, model_label, cache)
+    if key:
+        cached = await asyncio.to_thread(response_cache.get, key)
+        if cached is not None:
+            record_llm_call(call_info, model_label, started, cached=True, streamed=True)
+            yield cached
+            return
+
+    parts = []
+    stats = {}
+    try:
+        # Retries cover opening the stream; a failure part way through raises LLMCallError
+        deltas = await arun_with_retries(
+            lambda: get_backend().astream(kwargs), _estimate_call_tokens(kwargs), stats
+        )
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                yield delta
+        except Exception as e:
+            raise LLMCallError(f"LLM stream failed: {e}", status=getattr(e, "status", "failed")) from e
+        if not parts:
+            raise LLMCallError("LLM returned an empty response", status="invalid_response")
+    except LLMCallError as e:
+        record_llm_call(
+            call_info, model_label, started, retries=stats.get("retries", 0), status=e.status, streamed=True
+        )
+        raise
+
+    content = "".join(parts)
+    record_llm_call(
+        call_info, model_label, started, _prompt_tokens(kwargs), estimate_tokens(content),
+        retries=stats.get("retries", 0), streamed=True, estimated=True
+    )
+    if key:
+        await asyncio.to_thread(response_cache.put, key, model_label, content)
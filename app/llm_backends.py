@@ -0,0 +1,201 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+from collections import Counter
+from dotenv import load_dotenv
+from app.chunking import estimate_tokens
+
+load_dotenv()
+
+# Which backend serves chat completions: "openai" or "fake" (local, deterministic, free)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+# Base URL of an OpenAI-compatible server (e.g. a local model server), empty for api.openai.com
+LLM_API_BASE = os.getenv("LLM_API_BASE", "")
+# Fake backend simulation: time to first token, generation speed (0 for instant) and failure rate
+LLM_FAKE_LATENCY_MS = int(os.getenv("LLM_FAKE_LATENCY_MS", "200"))
+LLM_FAKE_TOKENS_PER_SECOND = float(os.getenv("LLM_FAKE_TOKENS_PER_SECOND", "50"))
+LLM_FAKE_ERROR_RATE = float(os.getenv("LLM_FAKE_ERROR_RATE", "0"))
+
+class BackendError(Exception):
+    """
+    A backend call failed.
+    retryable tells the scheduler whether to try again, status is "rate_limited",
+    "timeout" or "failed" and retry_after is the server's Retry-After in seconds.
+    """
+
+    def __init__(self, message, retryable=False, status="failed", retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status = status
+        self.retry_after = retry_after
+
+def _completion(content, prompt_tokens, completion_tokens):
+    """The normalized response every backend returns"""
+    return {
+        "content": content,
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+class OpenAIBackend:
+    """Chat completions through the openai 0.28 module API"""
+
+    name = "openai"
+
+    def __init__(self, api_key=None, api_base=LLM_API_BASE):
+        import openai  # Only needed when this backend is selected
+        self.openai = openai
+        self.openai.api_key = api_key or os.getenv("API_KEY")
+        if api_base:
+            self.openai.api_base = api_base
+
+    def _backend_error(self, error):
+        """Translate an openai error into a BackendError"""
+        errors = self.openai.error
+        headers = getattr(error, "headers", None) or {}
+        try:
+            retry_after = float(headers.get("retry-after") or headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            retry_after = None
+
+        if isinstance(error, errors.RateLimitError):
+            return BackendError(str(error), True, "rate_limited", retry_after)
+        if isinstance(error, errors.Timeout):
+            return BackendError(str(error), True, "timeout", retry_after)
+        if isinstance(error, (errors.APIConnectionError, errors.ServiceUnavailableError, errors.TryAgain)):
+            return BackendError(str(error), True, "failed", retry_after)
+        if isinstance(error, errors.APIError):
+            # Only retry server-side errors, not bad requests
+            status = getattr(error, "http_status", None)
+            return BackendError(str(error), status is None or status >= 500 or status == 429, "failed", retry_after)
+        return BackendError(str(error))
+
+    def _normalize(self, response):
+        usage = response.get("usage") or {}
+        return _completion(
+            response.choices[0].message["content"],
+            usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        )
+
+    def complete(self, kwargs):
+        try:
+            return self._normalize(self.openai.ChatCompletion.create(**kwargs))
+        except self.openai.error.OpenAIError as e:
+            raise self._backend_error(e) from e
+
+    async def acomplete(self, kwargs):
+        try:
+            return self._normalize(await self.openai.ChatCompletion.acreate(**kwargs))
+        except self.openai.error.OpenAIError as e:
+            raise self._backend_error(e) from e
+
+    async def astream(self, kwargs):
+        try:
+            response = await self.openai.ChatCompletion.acreate(stream=True, **kwargs)
+        except self.openai.error.OpenAIError as e:
+            raise self._backend_error(e) from e
+        return self._deltas(response)
+
+    async def _deltas(self, response):
+        try:
+            async for chunk in response:
+                delta = chunk.choices[0].delta.get("content") if chunk.choices else None
+                if delta:
+                    yield delta
+        except self.openai.error.OpenAIError as e:
+            raise self._backend_error(e) from e
+
+class FakeBackend:
+    """
+    Local stand-in for load tests and benchmarks, no network and no cost.
+    Formatting requests echo the user message back; JSON requests get metadata
+    built from the most frequent words. Output depends only on the request, and
+    latency is simulated as a fixed delay plus generation at tokens_per_second.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_ms=LLM_FAKE_LATENCY_MS, tokens_per_second=LLM_FAKE_TOKENS_PER_SECOND,
+                 error_rate=LLM_FAKE_ERROR_RATE):
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+
+    def _respond(self, kwargs):
+        """Return (content, prompt_tokens, completion_tokens) for a request"""
+        if self.error_rate and random.random() < self.error_rate:
+            raise BackendError("Simulated rate limit", True, "rate_limited", retry_after=1)
+        user_messages = [m["content"] for m in kwargs["messages"] if m["role"] == "user"]
+        text = user_messages[-1] if user_messages else ""
+        # Drop the instruction line ("Please format this transcript:") and any continuity context
+        body = text.rsplit(":\n\n", 1)[-1]
+
+        if (kwargs.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps(self._metadata(body))
+        else:
+            content = body
+        if kwargs.get("max_tokens"):
+            content = content[:kwargs["max_tokens"] * 4]
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in kwargs["messages"])
+        return content, prompt_tokens, estimate_tokens(content)
+
+    def _metadata(self, text):
+        words = re.findall(r"[a-z']{4,}", text.lower())
+        common = [word for word, count in Counter(words).most_common(10)]
+        return {
+            "topics": common[:3],
+            "keywords": common,
+            "sentiment": {"classification": "neutral", "score": 0.5},
+            "tags": common[:5],
+        }
+
+    def _generation_seconds(self, tokens):
+        return tokens / self.tokens_per_second if self.tokens_per_second else 0
+
+    def complete(self, kwargs):
+        content, prompt_tokens, completion_tokens = self._respond(kwargs)
+        time.sleep(self.latency_ms / 1000.0 + self._generation_seconds(completion_tokens))
+        return _completion(content, prompt_tokens, completion_tokens)
+
+    async def acomplete(self, kwargs):
+        content, prompt_tokens, completion_tokens = self._respond(kwargs)
+        await asyncio.sleep(self.latency_ms / 1000.0 + self._generation_seconds(completion_tokens))
+        return _completion(content, prompt_tokens, completion_tokens)
+
+    async def astream(self, kwargs):
+        content, _, _ = self._respond(kwargs)
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        return self._deltas(content)
+
+    async def _deltas(self, content):
+        # Emit whitespace-delimited pieces at the simulated token rate
+        for piece in re.findall(r"\S+\s*|\s+", content):
+            await asyncio.sleep(self._generation_seconds(estimate_tokens(piece)))
+            yield piece
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "fake": FakeBackend,
+}
+
+_backend = None
+
+def get_backend():
+    """Return the configured backend, created on first use"""
+    global _backend
+    if _backend is None:
+        if LLM_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown LLM_BACKEND {LLM_BACKEND!r}, expected one of {', '.join(BACKENDS)}")
+        _backend = BACKENDS[LLM_BACKEND]()
+    return _backend
+
+def set_backend(backend):
+    """Replace the backend, e.g. with a FakeBackend tuned for a benchmark"""
+    global _backend
+    _backend = backend
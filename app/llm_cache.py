@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from app.database import get_cached_llm_response, save_cached_llm_response, evict_llm_cache
+
+# LLM response cache settings
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PERSISTENT = os.getenv("LLM_CACHE_PERSISTENT", "true").lower() == "true"
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "256"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "10000"))
+# Run persistent eviction once every this many writes
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "100"))
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def cache_key(model, messages, temperature, max_tokens=None, response_format=None):
+    """
+    Build a content-addressed cache key for a chat completion.
+    The key covers the model, a hash of the system prompt, a hash of the
+    remaining (input) messages and the sampling options.
+    """
+    system_prompt = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    input_text = "\n".join(f"{m['role']}:{m['content']}" for m in messages if m["role"] != "system")
+    parts = {
+        "model": model,
+        "system": _sha256(system_prompt),
+        "input": _sha256(input_text),
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "response_format": response_format,
+    }
+    return _sha256(json.dumps(parts, sort_keys=True))
+
+class LLMResponseCache:
+    """
+    Two-tier cache for LLM responses:
+    an in-process LRU in front of the llm_cache table in Postgres.
+    Both tiers expire entries after ttl_seconds; the LRU holds at most
+    max_entries and the table is trimmed to max_rows least recently hit rows.
+    """
+
+    def __init__(self, max_entries=LLM_CACHE_MEMORY_SIZE, ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                 max_rows=LLM_CACHE_MAX_ROWS, persistent=LLM_CACHE_PERSISTENT):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self.persistent = persistent
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self.counters = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "memory_evictions": 0,
+            "persistent_evictions": 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _put_memory(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["memory_evictions"] += 1
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss"""
+        value = self._get_memory(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.persistent:
+            value = get_cached_llm_response(key, self.ttl_seconds)
+            if value is not None:
+                self._count("persistent_hits")
+                self._put_memory(key, value)
+                return value
+        self._count("misses")
+        return None
+
+    def put(self, key, model, value):
+        """Store a response in both tiers"""
+        if not value or not value.strip():
+            return
+        self._put_memory(key, value)
+        self._count("writes")
+        if not self.persistent:
+            return
+        save_cached_llm_response(key, model, value)
+        with self._lock:
+            self._writes_since_evict += 1
+            run_eviction = self._writes_since_evict >= LLM_CACHE_EVICT_EVERY
+            if run_eviction:
+                self._writes_since_evict = 0
+        if run_eviction:
+            self._count("persistent_evictions", evict_llm_cache(self.ttl_seconds, self.max_rows))
+
+    def clear(self):
+        """Drop the in-process tier (the persistent tier expires on its own)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the current in-process size"""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._entries)
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["persistent_hits"]) / lookups if lookups else 0.0
+        stats["enabled"] = LLM_CACHE_ENABLED
+        return stats
+
+response_cache = LLMResponseCache()
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+from dotenv import load_dotenv
+from app.event_sink import llm_call_sink
+
+load_dotenv()
+
+# Record a measurement row for every LLM call
+LLM_METRICS_ENABLED = os.getenv("LLM_METRICS_ENABLED", "true").lower() == "true"
+
+# USD per 1K (prompt, completion) tokens, matched on the longest model name prefix.
+# Override or extend with LLM_MODEL_PRICES='{"gpt-4": [0.03, 0.06]}'
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4-1106-preview": (0.01, 0.03),
+    "gpt-4-0125-preview": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+MODEL_PRICES.update({
+    model: tuple(prices) for model, prices in json.loads(os.getenv("LLM_MODEL_PRICES", "{}")).items()
+})
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost of a call, 0 for unknown models"""
+    matches = [name for name in MODEL_PRICES if (model or "").startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000.0
+
+def call_info(function_name, format_style=None, rewrite_options=None, prompt_version=None, **details):
+    """
+    Describe the caller of an LLM request, for the llm_calls table
+    prompt_version is the version of the prompt template used (see prompts.PromptTemplate)
+    """
+    return {
+        "function_name": function_name,
+        "format_style": format_style,
+        "rewrite_options": ",".join(rewrite_options) if rewrite_options else None,
+        "prompt_version": prompt_version,
+        "details": details,
+    }
+
+def response_usage(response):
+    """Return (prompt_tokens, completion_tokens) reported by the API, or None"""
+    usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+    if not usage:
+        return None
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+def record_llm_call(info, model, started, prompt_tokens=0, completion_tokens=0, retries=0,
+                    status="ok", cached=False, streamed=False, estimated=False):
+    """
+    Store one measurement in llm_calls, buffered and written in batches.
+    started is the time.monotonic() value taken before the call, so the
+    latency includes rate limiter waits and retries. Cached calls cost nothing.
+    """
+    if not LLM_METRICS_ENABLED:
+        return
+    info = info or call_info("unknown")
+    llm_call_sink.add({
+        "function_name": info["function_name"],
+        "model": model,
+        "format_style": info.get("format_style"),
+        "rewrite_options": info.get("rewrite_options"),
+        "prompt_version": info.get("prompt_version"),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_ms": int((time.monotonic() - started) * 1000),
+        "retries": retries,
+        "status": status,
+        "cached": cached,
+        "streamed": streamed,
+        "estimated_tokens": estimated,
+        "cost_usd": 0.0 if cached else call_cost(model, prompt_tokens, completion_tokens),
+        "details": info.get("details") or {},
+        "recorded_at": time.monotonic(),
+    })
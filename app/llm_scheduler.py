@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from app.llm_backends import BackendError
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on this platform, the limiter is per process
+    fcntl = None
+
+load_dotenv()
+
+# Shared OpenAI limits, 0 disables a limit
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "300000"))
+# State file shared by every worker process on this host, empty for per-process limits
+LLM_LIMITER_STATE_FILE = os.getenv("LLM_LIMITER_STATE_FILE", "/tmp/transcript-processor-llm-limiter.json")
+# Retry settings
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60.0"))
+
+class LLMCallError(Exception):
+    """
+    An LLM call failed after all retries.
+    status is "rate_limited", "timeout", "invalid_response" or "failed".
+    """
+
+    HTTP_STATUS = {"rate_limited": 503, "timeout": 504, "invalid_response": 502, "failed": 502}
+
+    def __init__(self, message, status="failed", retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def http_status(self):
+        return self.HTTP_STATUS.get(self.status, 502)
+
+class RateLimiter:
+    """
+    Token buckets for requests per minute and tokens per minute.
+    The bucket levels live in a small JSON file guarded by an exclusive file
+    lock, so every worker process on the host draws from the same budget.
+    A 429 with Retry-After pauses all processes until the given time.
+    """
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 state_file=LLM_LIMITER_STATE_FILE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.state_file = state_file if fcntl is not None else ""
+        self._thread_lock = threading.Lock()
+        self._local_state = {}
+
+    @contextmanager
+    def _locked_state(self):
+        with self._thread_lock:
+            if not self.state_file:
+                yield self._local_state
+                return
+            with open(self.state_file, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    raw = f.read()
+                    try:
+                        state = json.loads(raw) if raw else {}
+                    except ValueError:
+                        state = {}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state, now):
+        """Bring both buckets up to date; returns (request_level, token_level)"""
+        elapsed = max(0.0, now - state.get("updated", now))
+        requests = state.get("requests", self.requests_per_minute)
+        tokens = state.get("tokens", self.tokens_per_minute)
+        requests = min(self.requests_per_minute, requests + elapsed * self.requests_per_minute / 60.0)
+        tokens = min(self.tokens_per_minute, tokens + elapsed * self.tokens_per_minute / 60.0)
+        return requests, tokens
+
+    def try_acquire(self, tokens):
+        """
+        Take one request and tokens from the buckets if both have room.
+        Returns 0 when granted, otherwise the number of seconds to wait before trying again.
+        """
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return 0
+        with self._locked_state() as state:
+            now = time.time()
+            request_level, token_level = self._refill(state, now)
+            needed = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+            waits = [state.get("blocked_until", 0) - now]
+            if self.requests_per_minute and request_level < 1:
+                waits.append((1 - request_level) * 60.0 / self.requests_per_minute)
+            if self.tokens_per_minute and token_level < needed:
+                waits.append((needed - token_level) * 60.0 / self.tokens_per_minute)
+            wait = max(waits)
+            if wait <= 0:
+                request_level -= 1 if self.requests_per_minute else 0
+                token_level -= needed
+                wait = 0
+            state.update(requests=request_level, tokens=token_level, updated=now)
+            return wait
+
+    def acquire(self, tokens):
+        """Block until the request fits in both buckets"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, tokens):
+        """Async version of acquire; the state file is read in a worker thread, off the event loop"""
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def adjust(self, delta_tokens):
+        """Correct the token bucket once the real usage of a call is known"""
+        if not self.tokens_per_minute or not delta_tokens:
+            return
+        with self._locked_state() as state:
+            now = time.time()
+            request_level, token_level = self._refill(state, now)
+            state.update(requests=request_level, tokens=token_level - delta_tokens, updated=now)
+
+    def block_until(self, until):
+        """Pause every process sharing this limiter until the given time"""
+        with self._locked_state() as state:
+            state["blocked_until"] = max(state.get("blocked_until", 0), until)
+
+limiter = RateLimiter()
+
+def _retry_after(error):
+    """Retry-After (in seconds) reported with a backend error, if any"""
+    return error.retry_after if isinstance(error, BackendError) else None
+
+def _is_retryable(error):
+    return isinstance(error, BackendError) and error.retryable
+
+def _retry_delay(attempt, error):
+    """Exponential backoff with full jitter, never shorter than Retry-After"""
+    backoff = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    delay = random.uniform(0, backoff)
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        limiter.block_until(time.time() + retry_after)
+        delay = max(delay, retry_after)
+    return delay
+
+def _call_error(error):
+    """Wrap the final error of a call in an LLMCallError"""
+    status = error.status if isinstance(error, BackendError) else "failed"
+    return LLMCallError(f"LLM call failed: {error}", status=status, retry_after=_retry_after(error))
+
+def _response_tokens(response):
+    usage = getattr(response, "usage", None) or (response.get("usage") if isinstance(response, dict) else None)
+    if not usage:
+        return None
+    return usage.get("total_tokens")
+
+def run_with_retries(call, estimated_tokens, stats=None):
+    """
+    Run call() through the shared rate limiter, retrying rate limits and
+    server errors with backoff. Raises LLMCallError when the call cannot succeed.
+    If stats is a dict, stats["retries"] is kept at the number of retries made.
+    """
+    attempt = 0
+    while True:
+        if stats is not None:
+            stats["retries"] = attempt
+        limiter.acquire(estimated_tokens)
+        try:
+            response = call()
+        except Exception as e:
+            if attempt >= LLM_MAX_RETRIES or not _is_retryable(e):
+                raise _call_error(e) from e
+            delay = _retry_delay(attempt, e)
+            print(f"LLM call failed ({e}), retrying in {delay:.1f}s (attempt {attempt + 1}/{LLM_MAX_RETRIES})")
+            attempt += 1
+            time.sleep(delay)
+            continue
+        actual_tokens = _response_tokens(response)
+        if actual_tokens is not None:
+            limiter.adjust(actual_tokens - estimated_tokens)
+        return response
+
+async def arun_with_retries(acall, estimated_tokens, stats=None):
+    """Async version of run_with_retries, acall is a coroutine function"""
+    attempt = 0
+    while True:
+        if stats is not None:
+            stats["retries"] = attempt
+        await limiter.aacquire(estimated_tokens)
+        try:
+            response = await acall()
+        except Exception as e:
+            if attempt >= LLM_MAX_RETRIES or not _is_retryable(e):
+                raise _call_error(e) from e
+            # _retry_delay may write the shared state file (Retry-After), keep that off the loop
+            delay = await asyncio.to_thread(_retry_delay, attempt, e)
+            print(f"LLM call failed ({e}), retrying in {delay:.1f}s (attempt {attempt + 1}/{LLM_MAX_RETRIES})")
+            attempt += 1
+            await asyncio.sleep(delay)
+            continue
+        actual_tokens = _response_tokens(response)
+        if actual_tokens is not None:
+            await asyncio.to_thread(limiter.adjust, actual_tokens - estimated_tokens)
+        return response
@@ -0,0 +1,284 @@
+import os
+import re
+import sys
+import math
+import time
+import argparse
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+from app.extractive import STOPWORDS, words
+from app.database import (
+    get_metadata_term_counts, get_transcripts_for_metadata, save_transcript_metadata
+)
+
+load_dotenv()
+
+# How metadata is extracted: "local" (keyphrases, lexicon sentiment and library tags,
+# no network) or "llm" (a model call, slower and paid, used as an opt-in refinement)
+METADATA_MODE = os.getenv("METADATA_MODE", "local")
+# How often library-wide tag counts are refreshed from transcript_metadata
+METADATA_LIBRARY_REFRESH_SECONDS = int(os.getenv("METADATA_LIBRARY_REFRESH_SECONDS", "300"))
+
+_MAX_TOPICS = 5
+_MAX_KEYWORDS = 10
+_MAX_TAGS = 8
+# Longest keyphrase kept, in words
+_MAX_PHRASE_WORDS = 3
+# Tags used by more than this share of a large library say nothing about a transcript
+_GENERIC_TAG_SHARE = 0.6
+
+_CLAUSE_SPLIT = re.compile(r"[.,;:!?()\[\]{}\"\n–—]+|\s-\s")
+
+_POSITIVE = frozenset("""
+amazing awesome beautiful benefit benefits best better brilliant clear clever confident cool correct
+delight delighted easy effective efficient enjoy enjoyed excellent excited exciting fantastic fast favorite
+fine fun glad good great happy helpful ideal impressive improve improved improvement incredible interesting
+love loved lovely lucky nice perfect pleasant pleased positive powerful progress recommend reliable
+safe simple smart solid strong succeed success successful superb support thank thanks thrilled useful
+valuable win wins wonderful worth
+""".split())
+_NEGATIVE = frozenset("""
+afraid angry annoying anxious awful bad broken bug bugs confused confusing crash crisis damage dangerous
+difficult disappointed disappointing fail failed failing failure fear frustrated frustrating hate
+horrible hurt impossible issue issues lose loss lost mess mistake mistakes negative painful poor problem
+problems risk risky sad scared serious slow stuck struggle struggling terrible threat tough trouble ugly
+unfortunately unhappy upset useless weak worried worse worst wrong
+""".split())
+_NEGATORS = frozenset("not no never nothing cannot can't don't doesn't didn't isn't wasn't aren't won't".split())
+# Words after a negator whose sentiment is flipped
+_NEGATION_WINDOW = 3
+
+_library_lock = threading.Lock()
+_library = {"loaded_at": 0.0, "counts": {}, "size": 0}
+
+def _keyphrases(text):
+    """
+    RAKE keyphrases: candidate phrases are runs of content words between stopwords
+    and punctuation; each word scores degree / frequency and a phrase scores the sum
+    of its words. Returns (phrase, rank, count) triples, best first, where rank also
+    rewards phrases repeated through the transcript.
+    """
+    phrases = []
+    for clause in _CLAUSE_SPLIT.split(text.lower()):
+        current = []
+        for word in words(clause):
+            if word in STOPWORDS or word.isdigit() or len(word) < 3:
+                if current:
+                    phrases.append(tuple(current))
+                current = []
+            else:
+                current.append(word)
+        if current:
+            phrases.append(tuple(current))
+    phrases = [phrase for phrase in phrases if len(phrase) <= _MAX_PHRASE_WORDS]
+
+    frequency = Counter()
+    degree = Counter()
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] += 1
+            degree[word] += len(phrase)
+    phrase_counts = Counter(phrases)
+    ranked = [
+        (" ".join(phrase), sum(degree[w] / frequency[w] for w in phrase) * (1 + math.log(count)), count)
+        for phrase, count in phrase_counts.items()
+    ]
+    ranked.sort(key=lambda item: item[1], reverse=True)
+    return ranked
+
+def _pick_keywords(keyphrases, limit):
+    """Best keyphrases, skipping phrases whose words are all covered by better ones"""
+    keywords = []
+    covered = set()
+    for phrase, _, _ in keyphrases:
+        phrase_words = set(phrase.split())
+        if phrase_words <= covered:
+            continue
+        keywords.append(phrase)
+        covered |= phrase_words
+        if len(keywords) >= limit:
+            break
+    return keywords
+
+def _cluster_topics(keyphrases, limit, candidates=30):
+    """
+    Group the top keyphrases into topics: phrases sharing a word join one cluster,
+    labelled by its most repeated phrase; clusters are ordered by their total rank
+    """
+    clusters = []
+    for phrase, rank, count in keyphrases[:candidates]:
+        phrase_words = set(phrase.split())
+        for cluster in clusters:
+            if cluster["words"] & phrase_words:
+                cluster["words"] |= phrase_words
+                cluster["weight"] += rank
+                if count > cluster["count"]:
+                    cluster["label"], cluster["count"] = phrase, count
+                break
+        else:
+            clusters.append({"label": phrase, "count": count, "words": phrase_words, "weight": rank})
+    clusters.sort(key=lambda cluster: cluster["weight"], reverse=True)
+    return [" ".join(word.capitalize() for word in c["label"].split()) for c in clusters[:limit]]
+
+def _tag_candidates(text, keyphrases):
+    """Frequent content words and two-word keyphrases of text, with their counts"""
+    term_counts = Counter(
+        word for word in words(text) if word not in STOPWORDS and not word.isdigit() and len(word) > 2
+    )
+    # Count plurals with their singular when both occur
+    for term in [term for term in term_counts if term.endswith("s") and term[:-1] in term_counts]:
+        term_counts[term[:-1]] += term_counts.pop(term)
+    candidates = dict(term_counts.most_common(50))
+    lowered = text.lower()
+    for phrase, _, _ in keyphrases[:20]:
+        if len(phrase.split()) == 2:
+            candidates[phrase] = lowered.count(phrase)
+    return candidates
+
+def _pick_tags(candidates, library_counts, library_size, limit):
+    """
+    Tags are the tag candidates boosted when other transcripts in the library
+    already use them, so related transcripts converge on shared tags
+    (library-level topic clusters). Tags used by most of a large library are
+    skipped as too generic.
+    """
+    scored = []
+    for term, count in candidates.items():
+        used_by = library_counts.get(term, 0)
+        if library_size >= 10 and used_by > _GENERIC_TAG_SHARE * library_size:
+            continue
+        scored.append((term, count * (1 + math.log(1 + used_by))))
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return [term for term, _ in scored[:limit]]
+
+def lexicon_sentiment(text):
+    """
+    Coarse sentiment from positive and negative word counts, flipping words that
+    follow a negator. Returns the metadata sentiment dict: classification,
+    confidence and the polarity score in [-1, 1].
+    """
+    positive = negative = 0
+    negated_until = -1
+    tokens = words(text)
+    for position, word in enumerate(tokens):
+        if word in _NEGATORS:
+            negated_until = position + _NEGATION_WINDOW
+            continue
+        polarity = 1 if word in _POSITIVE else -1 if word in _NEGATIVE else 0
+        if polarity and position <= negated_until:
+            polarity = -polarity
+        if polarity > 0:
+            positive += 1
+        elif polarity < 0:
+            negative += 1
+
+    hits = positive + negative
+    score = (positive - negative) / hits if hits else 0.0
+    # More sentiment words make the reading more trustworthy, up to 10
+    evidence = min(1.0, hits / 10)
+    if score > 0.15:
+        classification, strength = "positive", abs(score)
+    elif score < -0.15:
+        classification, strength = "negative", abs(score)
+    else:
+        classification, strength = "neutral", 1 - abs(score) / 0.15
+    return {
+        "classification": classification,
+        "confidence": round(0.5 + 0.45 * strength * evidence, 2),
+        "score": round(score, 3),
+    }
+
+def library_terms(refresh=False):
+    """
+    Return (counts, size): how many transcripts use each keyword or tag, and the
+    number of transcripts with metadata. Cached for METADATA_LIBRARY_REFRESH_SECONDS.
+    """
+    with _library_lock:
+        fresh = time.monotonic() - _library["loaded_at"] < METADATA_LIBRARY_REFRESH_SECONDS
+        if fresh and not refresh:
+            return _library["counts"], _library["size"]
+    counts, size = get_metadata_term_counts()
+    with _library_lock:
+        _library.update({"loaded_at": time.monotonic(), "counts": counts, "size": size})
+    return counts, size
+
+def extract_metadata(text, library=None):
+    """
+    Extract metadata locally, without an LLM call: RAKE keyphrases as keywords,
+    clustered keyphrases as topics, library-aware tags and a lexicon sentiment.
+    library is the (counts, size) pair from library_terms; without it tags only
+    reflect this transcript.
+    Returns the same shape as the LLM analysis: topics, keywords, sentiment, tags.
+    """
+    return _extract(text, library)[0]
+
+def _extract(text, library=None):
+    library_counts, library_size = library or ({}, 0)
+    keyphrases = _keyphrases(text)
+    candidates = _tag_candidates(text, keyphrases)
+    metadata = {
+        "topics": _cluster_topics(keyphrases, _MAX_TOPICS),
+        "keywords": _pick_keywords(keyphrases, _MAX_KEYWORDS),
+        "sentiment": lexicon_sentiment(text),
+        "tags": _pick_tags(candidates, library_counts, library_size, _MAX_TAGS),
+    }
+    return metadata, candidates
+
+def backfill_metadata(overwrite=False, page_size=200, on_saved=None):
+    """
+    Extract local metadata for every stored transcript (only those without
+    metadata unless overwrite), reading the library in pages.
+    Tags are chosen against the library counts including the transcripts being
+    backfilled, so a first backfill already converges on shared tags.
+    on_saved is an optional callable invoked with each transcript id.
+    Returns a dict with the number of transcripts processed and saved.
+    """
+    # First pass: metadata and tag candidates of every transcript; only the
+    # candidates are kept, not the text
+    extracted = {}
+    if overwrite:
+        library_counts, library_size = Counter(), 0
+    else:
+        library_counts, library_size = library_terms(refresh=True)
+        library_counts = Counter(library_counts)
+    after_id = 0
+    while True:
+        page = get_transcripts_for_metadata(after_id, page_size, missing_only=not overwrite)
+        if not page:
+            break
+        for transcript_id, text in page:
+            metadata, candidates = _extract(text)
+            extracted[transcript_id] = (metadata, candidates)
+            library_counts.update(set(term.lower() for term in metadata["keywords"] + metadata["tags"]))
+        after_id = page[-1][0]
+    library_size += len(extracted)
+
+    # Second pass: library-aware tags, then save
+    saved = 0
+    for transcript_id, (metadata, candidates) in extracted.items():
+        metadata["tags"] = _pick_tags(candidates, library_counts, library_size, _MAX_TAGS)
+        if save_transcript_metadata(transcript_id, metadata):
+            saved += 1
+            if on_saved:
+                on_saved(transcript_id)
+    library_terms(refresh=True)
+    return {"processed": len(extracted), "saved": saved}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract metadata locally for stored transcripts")
+    parser.add_argument("--overwrite", action="store_true", help="Replace existing metadata, including LLM metadata")
+    parser.add_argument("--page-size", type=int, default=200, help="Transcripts read per query")
+    args = parser.parse_args(argv)
+
+    started = time.monotonic()
+    result = backfill_metadata(args.overwrite, args.page_size)
+    print(
+        f"Done: {result['saved']} of {result['processed']} transcripts saved "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+    return 0 if result["saved"] == result["processed"] else 1
+
+if __name__ == "__main__":
+    # python -m app.local_metadata
+    sys.exit(main())
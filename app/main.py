@@ -4,6 +4,8 @@ import os
 import plotly.express as px
 from datetime import datetime, timedelta
 import sys
+import json
+import time
 import requests
 
 # Ensure the app directory is in sys.path for module resolution in all environments
@@ -18,6 +20,20 @@ st.set_page_config(
 
 API_URL = os.getenv("API_URL", "http://api:8000")  # Or your API endpoint
 
+def iter_sse_events(response):
+    """Yield (event, data) pairs from a server-sent event response"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+        elif not line and data_lines:
+            yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+
 # Add this before you use st.session_state.user_role anywhere in your code
 # Preferably close to the top, after st.set_page_config
 if 'user_role' not in st.session_state:
@@ -30,6 +46,11 @@ if 'generating_ideas' not in st.session_state:
     st.session_state.generating_ideas = {}
 if 'post_ideas' not in st.session_state:
     st.session_state.post_ideas = {}
+# History: pages of the transcript list shown, and the transcripts opened to show in full
+if 'history_pages' not in st.session_state:
+    st.session_state.history_pages = 1
+if 'open_transcripts' not in st.session_state:
+    st.session_state.open_transcripts = set()
 
 # Configure the page with minimal padding
 # Enhanced CSS with stronger hiding rules for branding and subtle button styling
@@ -159,6 +180,15 @@ if st.session_state.user_role == "admin":
         # Add before the "analytic charts"
         st.info(f"Using AI model: {os.getenv('AI_MODEL', 'Not specified')} | API Key configured: {'Yes' if os.getenv('API_KEY') else 'No'}")
 
+        # Fill in topics, tags and sentiment for transcripts processed before metadata existed
+        if st.button("Backfill Missing Metadata", key="backfill_metadata"):
+            with st.spinner("Extracting metadata..."):
+                response = requests.post(f"{API_URL}/metadata/backfill/")
+            if response.ok:
+                st.success(f"Metadata saved for {response.json()['saved']} transcripts")
+            else:
+                st.error("Failed to backfill metadata.")
+
         response = requests.get(f"{API_URL}/analytics/")
         if response.ok:
             analytics = response.json()
@@ -236,12 +266,31 @@ if st.session_state.user_role == "admin":
             else:
                 st.info("No sentiment data available yet")
 
+        st.markdown("<h3>LLM Calls</h3>", unsafe_allow_html=True)
+        totals = analytics.get("llm_totals")
+        if totals and totals["calls"]:
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Calls", totals["calls"])
+            m2.metric("Tokens", totals["prompt_tokens"] + totals["completion_tokens"])
+            m3.metric("Cost (USD)", f"{float(totals['cost_usd']):.2f}")
+            m4.metric("p50 / p95 / p99 (ms)", f"{totals['p50_ms']} / {totals['p95_ms']} / {totals['p99_ms']}")
+            st.dataframe(pd.DataFrame(analytics["llm_call_stats"], columns=[
+                "Function", "Model", "Calls", "Cache Hits", "Failures", "Retries", "p50 ms", "p95 ms", "p99 ms",
+                "Avg Prompt Tokens", "Avg Completion Tokens", "Cost USD"
+            ]), use_container_width=True)
+            if analytics.get("llm_cost_by_options"):
+                st.dataframe(pd.DataFrame(analytics["llm_cost_by_options"], columns=[
+                    "Format", "Rewrite Options", "Prompt Version", "Calls", "Tokens", "p95 ms", "Cost USD"
+                ]), use_container_width=True)
+        else:
+            st.info("No LLM call data available yet")
+
 # Add two tabs: Upload File (default) and Paste Text
 tab_upload, tab_paste = st.tabs(["Upload File", "Paste Text"])
 
 with tab_upload:
     # Update the file uploader to accept PDF files
-    uploaded_file = st.file_uploader("Choose a file", type=["srt", "txt", "pdf"])
+    uploaded_file = st.file_uploader("Choose a file", type=["srt", "vtt", "txt", "pdf"])
 
     if uploaded_file is not None:
         # Read file content
@@ -256,14 +305,63 @@ with tab_upload:
                 "rewrite_options": rewrite_options,
                 "uniqueness_level": uniqueness_level
             }
-            response = requests.post(f"{API_URL}/upload/", files=files, data=data)
-            if response.ok:
-                result = response.json()
+            upload_key = (uploaded_file.name, uploaded_file.size)
+            last_upload = st.session_state.get("last_upload")
+            job = None
+            if last_upload and last_upload["key"] == upload_key and last_upload["options"] == data:
+                # Nothing changed since the last run (e.g. a button was clicked), keep the result
+                job = {"status": "completed", "result": last_upload["result"]}
+            elif (last_upload and last_upload["key"] == upload_key and last_upload["result"]["transcript_id"]
+                  and not uploaded_file.name.lower().endswith(".pdf")):
+                # Same file with different options: reformat only the chunks the change affects
+                # (PDFs are uploaded again, the API cannot reprocess them from the stored bytes)
+                with st.spinner("Reprocessing with the new options..."):
+                    response = requests.post(
+                        f"{API_URL}/transcript/{last_upload['result']['transcript_id']}/reprocess",
+                        json={
+                            "add_paragraphs": add_paragraphs,
+                            "add_headings": add_headings,
+                            "fix_grammar": fix_grammar,
+                            "highlight_key_points": highlight_key_points,
+                            "format_style": format_style,
+                            "rewrite_options": rewrite_options,
+                            "uniqueness_level": uniqueness_level
+                        }
+                    )
+                if response.ok:
+                    reprocessed = response.json()
+                    result = dict(last_upload["result"], processed_content=reprocessed["processed_content"])
+                    job = {"status": "completed", "result": result}
+                else:
+                    job = {"status": "failed", "error": response.text}
+            else:
+                # Queue the upload as a background job and poll it, so long files don't time out
+                response = requests.post(f"{API_URL}/upload/", files=files, data=dict(data, background="true"))
+                if response.ok:
+                    job_id = response.json()["job_id"]
+                    progress_bar = st.progress(0, text="Queued...")
+                    while True:
+                        job_response = requests.get(f"{API_URL}/jobs/{job_id}")
+                        if not job_response.ok:
+                            job = None
+                            break
+                        job = job_response.json()
+                        stage = (job.get("stage") or "queued").replace("_", " ").capitalize()
+                        progress_bar.progress(job.get("progress") or 0, text=f"{stage}...")
+                        if job["status"] in ("completed", "failed"):
+                            break
+                        time.sleep(1)
+                    progress_bar.empty()
+            if job and job["status"] == "completed":
+                result = job["result"]
+                st.session_state["last_upload"] = {"key": upload_key, "options": data, "result": result}
                 processed_content = result["processed_content"]
-                file_content = result["original_content"]
+                file_content = result.get("original_content") or "[PDF Uploaded]"
                 transcript_id = result["transcript_id"]
                 metadata = result.get("metadata", {})
                 st.success("Processing complete!")
+            elif job and job.get("error"):
+                st.error(f"API error: could not process file ({job['error']})")
             else:
                 st.error("API error: could not process file")
 
@@ -337,14 +435,27 @@ with tab_paste:
                     "rewrite_options": rewrite_options,
                     "uniqueness_level": uniqueness_level
                 }
-                response = requests.post(f"{API_URL}/process_text/", json=data)
+                # Stream the processed text so it appears as soon as the model starts writing
+                response = requests.post(f"{API_URL}/process_text/stream/", json=data, stream=True)
                 if response.ok:
-                    result = response.json()
-                    processed_content = result["processed_content"]
-                    transcript_id = result["transcript_id"]
-                    st.session_state["pasted_processed_content"] = processed_content
-                    st.session_state["pasted_original_content"] = pasted_text
-                    st.success("Processing complete!")
+                    preview = st.empty()
+                    processed_content = ""
+                    stream_error = None
+                    for event, payload in iter_sse_events(response):
+                        if event == "delta":
+                            processed_content += payload["text"]
+                            preview.markdown(processed_content)
+                        elif event == "done":
+                            transcript_id = payload["transcript_id"]
+                        elif event == "error":
+                            stream_error = payload.get("detail")
+                    preview.empty()
+                    if stream_error:
+                        st.error(f"API error: could not process text ({stream_error})")
+                    else:
+                        st.session_state["pasted_processed_content"] = processed_content
+                        st.session_state["pasted_original_content"] = pasted_text
+                        st.success("Processing complete!")
                 else:
                     st.error("API error: could not process text.")
 
@@ -392,30 +503,59 @@ with tab_paste:
 st.divider()
 st.subheader("Previously Processed Transcripts")
 
-response = requests.get(f"{API_URL}/transcripts/")
-if response.ok:
-    transcripts = response.json()
-else:
-    transcripts = []
+# The list only carries a preview of each transcript; bodies are loaded when opened
+HISTORY_PAGE_SIZE = 20
+transcripts = []
+history_total = 0
+next_cursor = None
+for page in range(st.session_state.history_pages):
+    if page and not next_cursor:
+        break
+    response = requests.get(
+        f"{API_URL}/transcripts/",
+        params={"limit": HISTORY_PAGE_SIZE, "cursor": next_cursor}
+    )
+    if not response.ok:
+        break
+    listing = response.json()
+    transcripts.extend(listing["items"])
+    history_total = listing["total"]
+    next_cursor = listing["next_cursor"]
+
+# Bodies, post ideas and metadata of the opened transcripts, in one request
+open_ids = [t['id'] for t in transcripts if t['id'] in st.session_state.open_transcripts]
+details = {}
+if open_ids:
+    response = requests.get(
+        f"{API_URL}/transcripts/details/",
+        params={"ids": ",".join(str(transcript_id) for transcript_id in open_ids)}
+    )
+    if response.ok:
+        details = {item["transcript"]["id"]: item for item in response.json()["items"]}
+    else:
+        st.error("Failed to load transcripts.")
 
 if transcripts:
+    st.caption(f"Showing {len(transcripts)} of {'about ' if listing['total_is_estimate'] else ''}{history_total} transcripts")
     for i, transcript in enumerate(transcripts):
         delete_key = f"delete_{transcript['id']}"
         ideas_key = f"ideas_{transcript['id']}"
         expander_label = f"**{transcript['filename']}** (ID: {transcript['id']})"
         
         with st.expander(expander_label):
+            detail = details.get(transcript['id'])
+            if detail is None:
+                st.caption(f"{transcript.get('format_style') or ''} · {transcript['size'] // 1024} KB · {(transcript.get('created_at') or '')[:16].replace('T', ' ')}")
+                st.write(transcript['preview'] + ("…" if len(transcript['preview'].encode("utf-8")) < transcript['size'] else ""))
+                if st.button("Open Transcript", key=f"open_{transcript['id']}"):
+                    st.session_state.open_transcripts.add(transcript['id'])
+                    st.rerun()
+                continue
+            transcript = {**transcript, **detail["transcript"]}
+
             # Initialize state for this transcript if needed
             if transcript['id'] not in st.session_state.show_ideas_tab:
-                # Check if post ideas exist for this transcript in the database
-                response = requests.get(f"{API_URL}/post_ideas/{transcript['id']}")
-                if response.ok:
-                    existing_ideas = response.json()
-                    # Fix: If API returns an object with 'post_ideas' key, extract it
-                    if isinstance(existing_ideas, dict) and "post_ideas" in existing_ideas:
-                        existing_ideas = existing_ideas["post_ideas"]
-                else:
-                    existing_ideas = None
+                existing_ideas = detail["post_ideas"]
 
                 st.session_state.show_ideas_tab[transcript['id']] = bool(existing_ideas)
                 st.session_state.generating_ideas[transcript['id']] = False
@@ -473,6 +613,7 @@ if transcripts:
                 if st.button("Delete Transcript", key=delete_key):
                     response = requests.delete(f"{API_URL}/transcript/{transcript['id']}")
                     if response.ok:
+                        st.session_state.open_transcripts.discard(transcript['id'])
                         st.success("Transcript deleted successfully!")
                         st.rerun()
                     else:
@@ -493,7 +634,7 @@ if transcripts:
                         with st.spinner("Generating post ideas..."):
                             response = requests.post(
                                 f"{API_URL}/generate_post_ideas/",
-                                json={"processed_content": transcript['processed_content']}
+                                json={"processed_content": transcript['processed_content'], "transcript_id": transcript['id']}
                             )
                             if response.ok:
                                 ideas_content = response.json()["post_ideas"]
@@ -554,9 +695,8 @@ if transcripts:
 
             if st.session_state.user_role == "admin" and "metadata_tab" in locals():
                 with metadata_tab:
-                    response = requests.get(f"{API_URL}/metadata/{transcript['id']}")
-                    if response.ok:
-                        metadata = response.json()
+                    metadata = detail["metadata"]
+                    if metadata:
                         col1, col2 = st.columns(2)
                         
                         with col1:
@@ -597,12 +737,16 @@ if transcripts:
                                 else:
                                     st.info(f"Neutral (Confidence: {confidence:.2f})")
                                     
-                        # Button to refresh metadata analysis
-                        if st.button("Refresh Metadata Analysis", key=f"refresh_metadata_{transcript['id']}"):
+                        # Button to refine the metadata with a model call
+                        if st.button("Refine Metadata with AI", key=f"refresh_metadata_{transcript['id']}"):
                             with st.spinner("Analyzing content..."):
                                 response = requests.post(
                                     f"{API_URL}/analyze_metadata/",
-                                    json={"processed_content": transcript['processed_content']}
+                                    json={
+                                        "processed_content": transcript['processed_content'],
+                                        "transcript_id": transcript['id'],
+                                        "mode": "llm"
+                                    }
                                 )
                                 if response.ok:
                                     metadata = response.json()
@@ -616,7 +760,7 @@ if transcripts:
                             with st.spinner("Analyzing content..."):
                                 response = requests.post(
                                     f"{API_URL}/analyze_metadata/",
-                                    json={"processed_content": transcript['processed_content']}
+                                    json={"processed_content": transcript['processed_content'], "transcript_id": transcript['id']}
                                 )
                                 if response.ok:
                                     metadata = response.json()
@@ -625,6 +769,9 @@ if transcripts:
                                 else:
                                     st.error("Failed to generate metadata.")
 
+    if next_cursor and st.button("Load More Transcripts"):
+        st.session_state.history_pages += 1
+        st.rerun()
 else:
     st.info("No transcripts have been processed yet.")
 
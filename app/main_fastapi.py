@@ -1,15 +1,140 @@
+from typing import List
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse
-from app.processor import detect_and_process, analyze_transcript_metadata, generate_post_ideas
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.processor import aanalyze_transcript_metadata, agenerate_post_ideas
+from app.pipeline import METADATA_SOURCE, run_upload_pipeline, run_reprocess_pipeline, stream_upload_pipeline
+from app.jobs import enqueue_upload_job, start_job_workers, stop_job_workers
+from app.batch import BATCH_CONCURRENCY, process_batch
+from app.cleanup import CLEANUP_ENABLED
+from app.pdf_extract import PDF_MAX_PAGES, extract_pdf
+from app.executor import run_cpu, executor_stats, shutdown_executor
+from app.ingest import UPLOAD_MAX_BYTES, UploadTooLarge, spool_upload, read_text
+from app.timestamps import index_cache, load_index, find_phrase
+from app.local_metadata import METADATA_MODE, backfill_metadata
+from app.event_sink import record_event, flush_sinks, close_sinks, sink_stats
 from app.database import (
-    save_transcript, get_all_transcripts, get_transcript, get_transcript_metadata, update_transcript,
-    delete_transcript, save_post_ideas, get_post_ideas, delete_post_ideas,
-    log_analytics_event, get_analytics_summary, save_transcript_metadata
+    list_transcripts, get_transcript, get_transcript_details, get_transcript_metadata,
+    update_transcript, delete_transcript, save_post_ideas, get_post_ideas, delete_post_ideas,
+    get_analytics_summary, rebuild_analytics_rollups, save_transcript_metadata, get_job,
+    get_llm_call_summary, get_pool, close_pool, pool_stats
 )
+from app.llm_cache import response_cache
+from app.llm_scheduler import LLMCallError
 import os
+import json
+import asyncio
 
 app = FastAPI()
 
+# Run the background job workers inside the API process (set to false when running python -m app.jobs separately)
+RUN_JOB_WORKERS = os.getenv("RUN_JOB_WORKERS", "true").lower() == "true"
+# Total request size accepted by /upload/batch/ (each file is also capped at UPLOAD_MAX_BYTES)
+UPLOAD_MAX_BATCH_BYTES = int(os.getenv("UPLOAD_MAX_BATCH_BYTES", str(10 * UPLOAD_MAX_BYTES)))
+
+@app.exception_handler(LLMCallError)
+async def llm_call_error_handler(request: Request, exc: LLMCallError):
+    # Report failed LLM calls explicitly instead of returning unprocessed text
+    headers = {"Retry-After": str(int(exc.retry_after))} if exc.retry_after else None
+    return JSONResponse(
+        {"detail": str(exc), "status": exc.status},
+        status_code=exc.http_status,
+        headers=headers
+    )
+
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large_handler(request: Request, exc: UploadTooLarge):
+    return JSONResponse({"detail": str(exc)}, status_code=413)
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Reject oversized uploads from their Content-Length before the body is read;
+    # uploads without one are still capped while they are spooled
+    length = request.headers.get("content-length")
+    if request.method == "POST" and length and length.isdigit():
+        max_bytes = UPLOAD_MAX_BATCH_BYTES if request.url.path.startswith("/upload/batch") else UPLOAD_MAX_BYTES
+        # Allow for the multipart framing and form fields around the file
+        if int(length) > max_bytes + 64 * 1024:
+            return JSONResponse({"detail": str(UploadTooLarge(max_bytes))}, status_code=413)
+    return await call_next(request)
+
+@app.on_event("startup")
+async def start_background_workers():
+    # Open the pool's minimum connections before the first request needs one
+    await asyncio.to_thread(get_pool)
+    if RUN_JOB_WORKERS:
+        start_job_workers()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await stop_job_workers()
+    await asyncio.to_thread(shutdown_executor)
+    # Write buffered analytics events and LLM call rows before the pool closes
+    await asyncio.to_thread(close_sinks)
+    await asyncio.to_thread(close_pool)
+
+async def _read_upload(file):
+    """
+    Read an uploaded file through a size-capped spool; returns (content, is_binary)
+    Text formats are decoded chunk by chunk with encoding detection, so the raw
+    bytes and the decoded text of a large upload are never both held in memory.
+    """
+    ext = os.path.splitext(file.filename)[1].lower()
+    is_binary = ext == ".pdf"
+    spool = await spool_upload(file)
+    try:
+        # The spool is a local file handle, so this runs in a thread rather than the CPU pool
+        if is_binary:
+            content = await asyncio.to_thread(spool.read)
+        else:
+            content = await asyncio.to_thread(read_text, spool)
+        return content, is_binary
+    finally:
+        spool.close()
+
+def _form_options(add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options, uniqueness_level, metadata_source="", cleanup=CLEANUP_ENABLED):
+    # Parse rewrite_options if sent as comma-separated string
+    rewrite_opts = [opt.strip() for opt in rewrite_options.split(",") if opt.strip()] if rewrite_options else []
+    return {
+        "add_paragraphs": add_paragraphs,
+        "add_headings": add_headings,
+        "fix_grammar": fix_grammar,
+        "highlight_key_points": highlight_key_points,
+        "format_style": format_style,
+        "rewrite_options": rewrite_opts,
+        "temperature": uniqueness_level,
+        "metadata_source": metadata_source or METADATA_SOURCE,
+        "cleanup": cleanup,
+    }
+
+def _json_options(data):
+    return {
+        "add_paragraphs": data.get("add_paragraphs", True),
+        "add_headings": data.get("add_headings", True),
+        "fix_grammar": data.get("fix_grammar", True),
+        "highlight_key_points": data.get("highlight_key_points", True),
+        "format_style": data.get("format_style", "Article"),
+        "rewrite_options": data.get("rewrite_options", []),
+        "temperature": data.get("uniqueness_level", 0.3),
+        "metadata_source": data.get("metadata_source") or METADATA_SOURCE,
+        "cleanup": data.get("cleanup", CLEANUP_ENABLED),
+    }
+
+def _sse_response(events):
+    """Wrap an async generator of (event, data) tuples as a server-sent event stream"""
+    async def event_stream():
+        try:
+            async for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            print(f"Error streaming response: {e}")
+            status = e.status if isinstance(e, LLMCallError) else "failed"
+            yield f"event: error\ndata: {json.dumps({'detail': str(e), 'status': status})}\n\n"
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/upload/")
 async def upload_file(
     file: UploadFile = File(...),
@@ -19,64 +144,138 @@ async def upload_file(
     highlight_key_points: bool = Form(True),
     format_style: str = Form("Article"),
     rewrite_options: str = Form(""),
-    uniqueness_level: float = Form(0.3)
+    uniqueness_level: float = Form(0.3),
+    metadata_source: str = Form(""),
+    cleanup: bool = Form(CLEANUP_ENABLED),
+    background: bool = Form(False)
 ):
     filename = file.filename
-    ext = os.path.splitext(filename)[1].lower()
-    content = await file.read()
-    is_binary = ext == ".pdf"
-    if not is_binary:
-        content = content.decode("utf-8")
-    # Parse rewrite_options if sent as comma-separated string
-    rewrite_opts = [opt.strip() for opt in rewrite_options.split(",") if opt.strip()] if rewrite_options else []
-    processed = detect_and_process(
-        content, filename, add_paragraphs, add_headings, fix_grammar, highlight_key_points,
-        format_style, is_binary=is_binary, rewrite_options=rewrite_opts, temperature=uniqueness_level
+    content, is_binary = await _read_upload(file)
+    options = _form_options(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options,
+        uniqueness_level, metadata_source, cleanup
     )
-    transcript_id = save_transcript(filename, content, processed, format_style)
-    metadata = analyze_transcript_metadata(processed)
-    save_transcript_metadata(transcript_id, metadata)
-    return JSONResponse({
-        "transcript_id": transcript_id,
-        "processed_content": processed,
-        "original_content": content,
-        "metadata": metadata
-    })
+    if background:
+        return await _queue_job(content, filename, options, is_binary)
+    result = await run_upload_pipeline(content, filename, options, is_binary=is_binary)
+    return JSONResponse(result)
+
+@app.post("/upload/stream/")
+async def upload_file_stream(
+    file: UploadFile = File(...),
+    add_paragraphs: bool = Form(True),
+    add_headings: bool = Form(True),
+    fix_grammar: bool = Form(True),
+    highlight_key_points: bool = Form(True),
+    format_style: str = Form("Article"),
+    rewrite_options: str = Form(""),
+    uniqueness_level: float = Form(0.3),
+    metadata_source: str = Form(""),
+    cleanup: bool = Form(CLEANUP_ENABLED)
+):
+    filename = file.filename
+    content, is_binary = await _read_upload(file)
+    options = _form_options(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options,
+        uniqueness_level, metadata_source, cleanup
+    )
+    return _sse_response(stream_upload_pipeline(content, filename, options, is_binary=is_binary))
+
+@app.post("/upload/batch/")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    add_paragraphs: bool = Form(True),
+    add_headings: bool = Form(True),
+    fix_grammar: bool = Form(True),
+    highlight_key_points: bool = Form(True),
+    format_style: str = Form("Article"),
+    rewrite_options: str = Form(""),
+    uniqueness_level: float = Form(0.3),
+    metadata_source: str = Form(""),
+    cleanup: bool = Form(CLEANUP_ENABLED),
+    concurrency: int = Form(BATCH_CONCURRENCY)
+):
+    options = _form_options(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options,
+        uniqueness_level, metadata_source, cleanup
+    )
+    # Cap the client-requested concurrency at the configured limit
+    concurrency = max(1, min(concurrency, BATCH_CONCURRENCY))
+    items = [(file.filename, lambda file=file: _read_upload(file)) for file in files]
+    results = await process_batch(items, options, concurrency)
+    completed = sum(1 for r in results if r["status"] == "completed")
+    return {"completed": completed, "failed": len(results) - completed, "files": results}
 
 @app.post("/process_text/")
 async def process_text(request: Request):
     data = await request.json()
     text = data.get("text", "")
     title = data.get("title", "Untitled")
-    add_paragraphs = data.get("add_paragraphs", True)
-    add_headings = data.get("add_headings", True)
-    fix_grammar = data.get("fix_grammar", True)
-    highlight_key_points = data.get("highlight_key_points", True)
-    format_style = data.get("format_style", "Article")
-    rewrite_options = data.get("rewrite_options", [])
-    uniqueness_level = data.get("uniqueness_level", 0.3)
-    processed = detect_and_process(
-        text, title, add_paragraphs, add_headings, fix_grammar, highlight_key_points,
-        format_style, is_binary=False, rewrite_options=rewrite_options, temperature=uniqueness_level
-    )
-    transcript_id = save_transcript(title, text, processed, format_style, source_type="pasted")
-    metadata = analyze_transcript_metadata(processed)
-    save_transcript_metadata(transcript_id, metadata)
+    options = _json_options(data)
+    if data.get("background", False):
+        return await _queue_job(text, title, options, False, source_type="pasted")
+    result = await run_upload_pipeline(text, title, options, is_binary=False, source_type="pasted")
     return JSONResponse({
-        "transcript_id": transcript_id,
-        "processed_content": processed,
-        "metadata": metadata
+        "transcript_id": result["transcript_id"],
+        "processed_content": result["processed_content"],
+        "metadata": result["metadata"],
+        "cleanup": result["cleanup"]
     })
 
+@app.post("/process_text/stream/")
+async def process_text_stream(request: Request):
+    data = await request.json()
+    text = data.get("text", "")
+    title = data.get("title", "Untitled")
+    options = _json_options(data)
+    return _sse_response(stream_upload_pipeline(text, title, options, is_binary=False, source_type="pasted"))
+
+async def _queue_job(content, filename, options, is_binary, source_type="transcript"):
+    job_id = await asyncio.to_thread(
+        enqueue_upload_job, content, filename, options, is_binary=is_binary, source_type=source_type
+    )
+    if job_id is None:
+        raise HTTPException(status_code=500, detail="Could not queue job")
+    return JSONResponse({"job_id": job_id, "status": "queued"}, status_code=202)
+
+# --- Background Job Endpoints ---
+@app.get("/jobs/{job_id}")
+def get_job_api(job_id: int):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/transcripts/")
-def list_transcripts():
-    return get_all_transcripts()
+def list_transcripts_api(limit: int = 50, cursor: str = None, fields: str = None, preview_chars: int = 200):
+    # One page of transcripts, newest first, without the transcript bodies;
+    # pass next_cursor back as cursor for the next page, fields as a comma-separated list
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    try:
+        return list_transcripts(max(1, min(limit, 200)), cursor, field_list, max(0, min(preview_chars, 2000)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Most transcripts accepted by one /transcripts/details/ request
+DETAILS_MAX_IDS = 200
+
+@app.get("/transcripts/details/")
+def get_transcript_details_api(ids: str, include_bodies: bool = True):
+    # Transcripts with metadata, post ideas and rewrite for a comma-separated list of ids,
+    # in the order requested; unknown ids are left out
+    try:
+        id_list = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if len(id_list) > DETAILS_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {DETAILS_MAX_IDS} ids per request")
+    details = get_transcript_details(id_list, include_bodies)
+    return {"items": [details[transcript_id] for transcript_id in dict.fromkeys(id_list) if transcript_id in details]}
 
 @app.get("/transcript/{transcript_id}")
 def get_transcript_detail(transcript_id: int):
-    transcript = get_transcript(transcript_id)
-    metadata = get_transcript_metadata(transcript_id)
-    return {"transcript": transcript, "metadata": metadata}
+    detail = get_transcript_details([transcript_id]).get(transcript_id)
+    return detail or {"transcript": None, "metadata": None, "post_ideas": None, "rewrite": None}
 
 @app.patch("/transcript/{transcript_id}")
 async def update_transcript_content(transcript_id: int, request: Request):
@@ -90,11 +289,56 @@ async def update_transcript_content(transcript_id: int, request: Request):
     update_transcript(transcript_id, processed_content)
     return {"success": True}
 
+@app.post("/transcript/{transcript_id}/reprocess")
+async def reprocess_transcript(transcript_id: int, request: Request):
+    """
+    Reformat a stored transcript with new options and optionally an edited source
+    ("content"); only the chunks affected by the change are sent to the model.
+    PDF transcripts need "content", their stored original is the raw PDF.
+    """
+    data = await request.json()
+    transcript = await asyncio.to_thread(get_transcript, transcript_id)
+    if not transcript:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    content = data.get("content")
+    if content is None and transcript["filename"].lower().endswith(".pdf"):
+        # The stored original of a PDF is its raw bytes, not text the model can read
+        raise HTTPException(status_code=400, detail="PDF transcripts can only be reprocessed with edited text content")
+    result = await run_reprocess_pipeline(transcript, _json_options(data), content=content)
+    if result["transcript_id"] is None:
+        raise HTTPException(status_code=500, detail="Could not save reprocessed transcript")
+    if content is not None:
+        index_cache.discard(transcript_id)
+    return JSONResponse(result)
+
 @app.delete("/transcript/{transcript_id}")
 def delete_transcript_api(transcript_id: int):
     ok = delete_transcript(transcript_id)
+    index_cache.discard(transcript_id)
     return {"success": ok}
 
+@app.get("/transcript/{transcript_id}/timestamps")
+def timestamp_lookup_api(transcript_id: int, offset: int = None, end_offset: int = None, phrase: str = None):
+    """
+    Map a character offset range of the source cue text, or a phrase (e.g. from a
+    formatted paragraph or search hit), to the time range it was spoken in
+    """
+    loaded = load_index(transcript_id)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="No timestamp index for this transcript")
+    index, cue_text = loaded
+    if phrase:
+        return {"matches": find_phrase(index, cue_text, phrase)}
+    if offset is None:
+        return {"cue_count": len(index), "text_length": len(cue_text)}
+    try:
+        result = index.lookup(offset, end_offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Offset is outside the transcript")
+    return result
+
 # --- Post Ideas Endpoints ---
 @app.get("/post_ideas/{transcript_id}")
 def get_post_ideas_api(transcript_id: int):
@@ -117,7 +361,10 @@ def delete_post_ideas_api(transcript_id: int):
 async def generate_post_ideas_api(request: Request):
     data = await request.json()
     processed_content = data.get("processed_content", "")
-    ideas = generate_post_ideas(processed_content)
+    ideas = await agenerate_post_ideas(processed_content)
+    transcript_id = data.get("transcript_id")
+    if transcript_id is not None:
+        record_event(transcript_id, "post_ideas")
     return {"post_ideas": ideas}
 
 # --- Metadata Endpoints ---
@@ -128,12 +375,71 @@ def get_metadata_api(transcript_id: int):
 
 @app.post("/analyze_metadata/")
 async def analyze_metadata_api(request: Request):
+    """
+    Analyze content with mode "local" or "llm" (default METADATA_MODE);
+    the result is saved when a transcript_id is given
+    """
     data = await request.json()
     processed_content = data.get("processed_content", "")
-    metadata = analyze_transcript_metadata(processed_content)
+    metadata = await aanalyze_transcript_metadata(processed_content, data.get("mode"))
+    transcript_id = data.get("transcript_id")
+    if transcript_id is not None:
+        await asyncio.to_thread(save_transcript_metadata, transcript_id, metadata)
+        record_event(transcript_id, "metadata", {"mode": data.get("mode") or METADATA_MODE})
     return metadata
 
+@app.post("/metadata/backfill/")
+async def backfill_metadata_api(overwrite: bool = False):
+    """Extract local metadata for all transcripts without metadata (or all of them with overwrite)"""
+    return await asyncio.to_thread(backfill_metadata, overwrite)
+
 # --- Analytics Endpoint ---
 @app.get("/analytics/")
-def analytics_api():
-    return get_analytics_summary()
+def analytics_api(days: int = None):
+    # Event and metadata counts from the analytics rollups, and LLM call latency and cost,
+    # optionally limited to the last days days
+    # Buffered events are written first so the summary includes them
+    flush_sinks()
+    summary = get_analytics_summary(days)
+    summary.update(get_llm_call_summary(days))
+    return summary
+
+@app.post("/analytics/rollups/rebuild/")
+def rebuild_analytics_rollups_api():
+    # Recompute the analytics rollups from the event and metadata tables
+    return {"success": rebuild_analytics_rollups()}
+
+@app.get("/llm_cache/stats/")
+def llm_cache_stats_api():
+    return response_cache.stats()
+
+@app.get("/executor/stats/")
+def executor_stats_api():
+    # Queue depth and utilization of the CPU pool used for parsing and extraction
+    return executor_stats()
+
+@app.get("/events/stats/")
+def event_sink_stats_api():
+    # Buffered, flushed and dropped analytics events and LLM call rows
+    return sink_stats()
+
+@app.get("/db/pool/stats/")
+def db_pool_stats_api():
+    # Connection pool size, checkout wait times and utilization
+    return pool_stats()
+
+@app.post("/pdf/inspect/")
+async def inspect_pdf(file: UploadFile = File(...), max_pages: int = Form(PDF_MAX_PAGES)):
+    # Per-page extraction timings, to spot PDFs that are slow to process
+    spool = await spool_upload(file)
+    try:
+        content = await asyncio.to_thread(spool.read)
+    finally:
+        spool.close()
+    try:
+        report = await run_cpu(extract_pdf, content, max_pages)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read PDF: {e}")
+    text = report.pop("text")
+    slowest = sorted(report["page_seconds"].items(), key=lambda item: item[1], reverse=True)[:10]
+    return {**report, "text_length": len(text), "slowest_pages": slowest}
@@ -14,6 +14,7 @@ def index():
     filename = None
     metadata = None
     transcript_id = None
+    job = None
 
     if request.method == "POST" and "file" in request.files:
         file = request.files["file"]
@@ -39,17 +40,27 @@ def index():
                 "fix_grammar": str(fix_grammar).lower(),
                 "highlight_key_points": str(highlight_key_points).lower(),
                 "format_style": format_style,
+                "background": "true",
             },
         )
         if resp.ok:
-            data = resp.json()
-            processed_content = data.get("processed_content")
-            transcript_id = data.get("transcript_id")
-            metadata = data.get("metadata")
-            original_content = content if not is_binary else "[PDF Uploaded]"
-            flash("Processing complete!", "success")
+            # Processing runs as a background job; the page polls it until it finishes
+            return redirect(url_for("index", job_id=resp.json().get("job_id")))
         else:
             flash("API error: could not process file", "danger")
+    elif request.method == "GET" and request.args.get("job_id"):
+        job_id = int(request.args.get("job_id"))
+        resp = requests.get(f"{API_URL}/jobs/{job_id}")
+        if resp.ok:
+            job = resp.json()
+            if job.get("status") == "completed":
+                flash("Processing complete!", "success")
+                return redirect(url_for("index", transcript_id=job.get("transcript_id")))
+            if job.get("status") == "failed":
+                flash(f"API error: could not process file ({job.get('error')})", "danger")
+                job = None
+        else:
+            flash("Job not found.", "danger")
     elif request.method == "GET" and request.args.get("transcript_id"):
         transcript_id = int(request.args.get("transcript_id"))
         resp = requests.get(f"{API_URL}/transcript/{transcript_id}")
@@ -62,9 +73,9 @@ def index():
             metadata = data.get("metadata")
         else:
             flash("Transcript not found.", "danger")
-    # List all transcripts
-    resp = requests.get(f"{API_URL}/transcripts/")
-    transcripts = resp.json() if resp.ok else []
+    # List the most recent transcripts (id and filename only)
+    resp = requests.get(f"{API_URL}/transcripts/", params={"limit": 100, "fields": "id,filename"})
+    transcripts = resp.json()["items"] if resp.ok else []
     return render_template(
         "index.html",
         processed_content=processed_content,
@@ -72,7 +83,8 @@ def index():
         filename=filename,
         metadata=metadata,
         transcripts=transcripts,
-        transcript_id=transcript_id
+        transcript_id=transcript_id,
+        job=job
     )
 
 @app.route("/save_processed/<int:transcript_id>", methods=["POST"])
@@ -0,0 +1,172 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Processes used to extract large PDFs
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+# PDFs with fewer pages to extract than this are handled in the calling process
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+# Only extract the first PDF_MAX_PAGES pages, 0 for all of them
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "0"))
+# Extracted pages kept in memory, keyed by document hash and page number
+PDF_PAGE_CACHE_SIZE = int(os.getenv("PDF_PAGE_CACHE_SIZE", "2000"))
+# Pages slower than this are logged
+PDF_SLOW_PAGE_SECONDS = float(os.getenv("PDF_SLOW_PAGE_SECONDS", "2.0"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_page_cache = OrderedDict()
+_page_counts = OrderedDict()
+
+def _extract_ranges(source, ranges):
+    """
+    Extract the pages in the given (start, end) ranges of a PDF, parsing it once.
+    source is the PDF bytes or, in a worker process, the path of a temp copy.
+    Returns a list of (page_number, text, seconds).
+    """
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(source if isinstance(source, str) else BytesIO(source))
+    pages = []
+    for start, end in ranges:
+        for page_number in range(start, end):
+            started = time.perf_counter()
+            page_text = reader.pages[page_number].extract_text() or ""
+            pages.append((page_number, page_text, time.perf_counter() - started))
+    return pages
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max(1, PDF_WORKERS))
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _page_count(doc_hash, pdf_content):
+    with _cache_lock:
+        if doc_hash in _page_counts:
+            _page_counts.move_to_end(doc_hash)
+            return _page_counts[doc_hash]
+    import PyPDF2
+
+    count = len(PyPDF2.PdfReader(BytesIO(pdf_content)).pages)
+    with _cache_lock:
+        _page_counts[doc_hash] = count
+        while len(_page_counts) > PDF_PAGE_CACHE_SIZE:
+            _page_counts.popitem(last=False)
+    return count
+
+def _cached_pages(doc_hash, page_numbers):
+    found = {}
+    with _cache_lock:
+        for page_number in page_numbers:
+            key = (doc_hash, page_number)
+            if key in _page_cache:
+                _page_cache.move_to_end(key)
+                found[page_number] = _page_cache[key]
+    return found
+
+def _cache_pages(doc_hash, pages):
+    with _cache_lock:
+        for page_number, page_text, _ in pages:
+            _page_cache[(doc_hash, page_number)] = page_text
+        while len(_page_cache) > PDF_PAGE_CACHE_SIZE:
+            _page_cache.popitem(last=False)
+
+def _ranges(page_numbers):
+    """Group sorted page numbers into contiguous (start, end) ranges"""
+    ranges = []
+    for page_number in page_numbers:
+        if ranges and ranges[-1][1] == page_number:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([page_number, page_number + 1])
+    return [tuple(r) for r in ranges]
+
+def _split(page_numbers, parts):
+    """Split sorted page numbers into at most parts consecutive blocks of about equal size"""
+    size = -(-len(page_numbers) // parts)
+    return [page_numbers[i:i + size] for i in range(0, len(page_numbers), size)]
+
+def _extract_pages(pdf_content, page_numbers):
+    """
+    Extract the given pages, splitting larger jobs into one block per worker process.
+    Workers read the PDF from a temp file, so it is not pickled per task and
+    each worker parses the document once.
+    """
+    if len(page_numbers) < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS <= 1:
+        return _extract_ranges(pdf_content, _ranges(page_numbers))
+    blocks = [_ranges(block) for block in _split(page_numbers, PDF_WORKERS)]
+    path = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            path = f.name
+            f.write(pdf_content)
+        pool = _get_pool()
+        futures = [pool.submit(_extract_ranges, path, block) for block in blocks]
+        return [page for future in futures for page in future.result()]
+    except Exception as e:
+        # A crashed worker breaks the whole pool; start a fresh one next time
+        print(f"Parallel PDF extraction failed ({e}), extracting in process")
+        _reset_pool()
+        return _extract_ranges(pdf_content, _ranges(page_numbers))
+    finally:
+        if path is not None:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+def extract_pdf(pdf_content, max_pages=None):
+    """
+    Extract the text of a PDF page by page.
+    Pages are cached by document hash, so re-uploads and retries skip the work.
+    max_pages limits extraction to the first pages (default PDF_MAX_PAGES, 0 for all).
+
+    Returns a dict with the text, page_count, pages_extracted, cached_pages,
+    truncated, and page_seconds (extraction time per freshly extracted page,
+    keyed by 1-based page number).
+    """
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    doc_hash = hashlib.sha256(pdf_content).hexdigest()
+    page_count = _page_count(doc_hash, pdf_content)
+    limit = min(page_count, max_pages) if max_pages else page_count
+
+    page_numbers = range(limit)
+    texts = _cached_pages(doc_hash, page_numbers)
+    missing = [page_number for page_number in page_numbers if page_number not in texts]
+    pages = _extract_pages(pdf_content, missing) if missing else []
+    _cache_pages(doc_hash, pages)
+
+    page_seconds = {}
+    for page_number, page_text, seconds in pages:
+        texts[page_number] = page_text
+        page_seconds[page_number + 1] = round(seconds, 4)
+        if seconds > PDF_SLOW_PAGE_SECONDS:
+            print(f"Slow PDF page {page_number + 1}: {seconds:.1f}s")
+
+    text = "\n\n".join(texts[page_number] for page_number in page_numbers if texts[page_number])
+    return {
+        "text": text.strip(),
+        "page_count": page_count,
+        "pages_extracted": limit,
+        "cached_pages": limit - len(missing),
+        "truncated": limit < page_count,
+        "page_seconds": page_seconds,
+    }
@@ -0,0 +1,368 @@
+import os
+import asyncio
+from dotenv import load_dotenv
+from app.processor import (
+    prepare_content_indexed, clean_content, aformat_text_incremental, astream_format_text,
+    aanalyze_transcript_metadata, adjust_markdown_headings, aadjust_markdown_headings_stream
+)
+from app.cleanup import CLEANUP_ENABLED
+from app.executor import run_cpu
+from app.event_sink import record_event
+from app.prompts import canonical_rewrite_options
+from app.database import (
+    save_transcript, save_transcript_metadata, save_timestamp_index, update_transcript_source,
+    get_transcript_chunks, save_transcript_chunks
+)
+from app.llm_scheduler import LLMCallError
+
+load_dotenv()
+
+# Which text metadata is extracted from: "source" (the cleaned input, analyzed
+# while formatting runs) or "processed" (the formatted output, analyzed afterwards)
+METADATA_SOURCE = os.getenv("METADATA_SOURCE", "source")
+# Formatted chunks kept per transcript for reprocessing, across edits and option
+# combinations; the least recently used are dropped first
+CHUNK_STORE_MAX_PER_TRANSCRIPT = int(os.getenv("CHUNK_STORE_MAX_PER_TRANSCRIPT", "400"))
+
+# Default formatting options, matching the /upload/ form defaults
+DEFAULT_OPTIONS = {
+    "add_paragraphs": True,
+    "add_headings": True,
+    "fix_grammar": True,
+    "highlight_key_points": True,
+    "format_style": "Article",
+    "rewrite_options": [],
+    "temperature": 0.3,
+    "metadata_source": METADATA_SOURCE,
+    "cleanup": CLEANUP_ENABLED,
+}
+
+# Rough share of the total work done when each stage starts, for progress reporting
+STAGE_PROGRESS = {
+    "queued": 0,
+    "starting": 5,
+    "extracting": 10,
+    "cleaning": 15,
+    "formatting": 20,
+    "analyzing_metadata": 25,
+    "saving": 70,
+    "saving_metadata": 90,
+    "saving_index": 95,
+    "saving_chunks": 95,
+    "completed": 100,
+}
+
+def _merge_options(options):
+    opts = dict(DEFAULT_OPTIONS)
+    opts.update(options or {})
+    return opts
+
+async def run_stage_graph(stages, on_stage=None):
+    """
+    Run a small graph of async stages.
+
+    stages maps a stage name to (dependencies, fn), where fn is a coroutine
+    function receiving the dict of finished stage results. Each stage starts
+    as soon as all of its dependencies have finished, so independent stages
+    run concurrently. on_stage is an optional coroutine function called with
+    each stage name as it starts.
+
+    Returns the dict of stage results. If a stage fails the remaining stages
+    are cancelled and the exception is raised.
+    """
+    results = {}
+    tasks = {}
+
+    async def run(name):
+        dependencies, fn = stages[name]
+        for dependency in dependencies:
+            await tasks[dependency]
+        if on_stage:
+            await on_stage(name)
+        results[name] = await fn(results)
+        return results[name]
+
+    for name in stages:
+        tasks[name] = asyncio.ensure_future(run(name))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return results
+
+async def _analyze_metadata(text):
+    """
+    Analyze metadata, returning (metadata, error).
+    A failed analysis leaves metadata unset instead of failing the upload,
+    so the transcript is still saved but no placeholder metadata is stored.
+    """
+    try:
+        return await aanalyze_transcript_metadata(text), None
+    except LLMCallError as e:
+        print(f"Error analyzing transcript metadata: {e}")
+        return None, str(e)
+
+async def _save_index(transcript_id, extracted):
+    """Store the cue timestamp index of a caption upload with its transcript"""
+    text, _, _, index = extracted
+    if transcript_id is not None and index is not None:
+        await asyncio.to_thread(save_timestamp_index, transcript_id, text, index.to_bytes(), len(index))
+
+async def _save_chunks(transcript_id, chunks):
+    """Store the formatted chunks of a transcript so a later reprocess can reuse them"""
+    if transcript_id is not None and chunks:
+        await asyncio.to_thread(save_transcript_chunks, transcript_id, chunks, CHUNK_STORE_MAX_PER_TRANSCRIPT)
+
+def _record_formatting(transcript_id, opts, source_type, reprocess=False):
+    """Buffer the analytics events of a saved formatting run"""
+    if transcript_id is None:
+        return
+    record_event(transcript_id, "format", {
+        "format_style": opts["format_style"], "source_type": source_type, "reprocess": reprocess
+    })
+    rewrite_options = canonical_rewrite_options(opts["rewrite_options"])
+    if rewrite_options:
+        record_event(transcript_id, "rewrite", {"options": ",".join(rewrite_options)})
+
+async def _format_incremental(cleaned, opts, stored=None):
+    """Format cleaned content, reusing stored chunk outputs; returns (processed, chunks, report)"""
+    text, segments, joiner, _ = cleaned
+    processed, chunks, report = await aformat_text_incremental(
+        text, opts["add_paragraphs"], opts["add_headings"], opts["fix_grammar"],
+        opts["highlight_key_points"], opts["format_style"], opts["rewrite_options"],
+        opts["temperature"], chunked=None, segments=segments, joiner=joiner, stored=stored
+    )
+    return await run_cpu(adjust_markdown_headings, processed), chunks, report
+
+def _upload_stages(content, filename, opts, is_binary, source_type):
+    """
+    Build the stage graph for one upload:
+
+        extracting -> cleaning -> formatting -> saving ----------> saving_metadata
+                              \\-> analyzing_metadata -----------/
+
+    saving_index and saving_chunks store the caption timestamp index and the
+    formatted chunks once saving has finished.
+    With metadata_source "processed", analyzing_metadata waits for formatting instead.
+    """
+    async def extract(results):
+        return await run_cpu(prepare_content_indexed, content, filename, is_binary)
+
+    async def clean(results):
+        text, segments, joiner, _ = results["extracting"]
+        return await run_cpu(clean_content, text, segments, joiner, opts["cleanup"])
+
+    async def format_content(results):
+        return await _format_incremental(results["cleaning"], opts)
+
+    async def analyze(results):
+        text = results["formatting"][0] if opts["metadata_source"] == "processed" else results["cleaning"][0]
+        return await _analyze_metadata(text)
+
+    async def save(results):
+        transcript_id = await asyncio.to_thread(
+            save_transcript, filename, content, results["formatting"][0], opts["format_style"], source_type
+        )
+        _record_formatting(transcript_id, opts, source_type)
+        return transcript_id
+
+    async def save_metadata(results):
+        transcript_id = results["saving"]
+        metadata, metadata_error = results["analyzing_metadata"]
+        if transcript_id is not None and metadata is not None:
+            await asyncio.to_thread(save_transcript_metadata, transcript_id, metadata)
+
+    async def save_index(results):
+        await _save_index(results["saving"], results["extracting"])
+
+    async def save_chunks(results):
+        await _save_chunks(results["saving"], results["formatting"][1])
+
+    analyze_after = ("formatting",) if opts["metadata_source"] == "processed" else ("cleaning",)
+    return {
+        "extracting": ((), extract),
+        "cleaning": (("extracting",), clean),
+        "formatting": (("cleaning",), format_content),
+        "analyzing_metadata": (analyze_after, analyze),
+        "saving": (("formatting",), save),
+        "saving_metadata": (("saving", "analyzing_metadata"), save_metadata),
+        "saving_index": (("saving",), save_index),
+        "saving_chunks": (("saving",), save_chunks),
+    }
+
+async def run_upload_pipeline(content, filename, options=None, is_binary=False, source_type="transcript", on_stage=None):
+    """
+    Run the full processing pipeline for one upload:
+    extract the content, then format it and analyze its metadata concurrently,
+    saving the transcript and its metadata as each becomes available.
+
+    options holds the formatting options (see DEFAULT_OPTIONS).
+    on_stage is an optional coroutine function called with each stage name.
+
+    Returns a dict with transcript_id, processed_content, original_content, metadata,
+    metadata_error (set when metadata analysis failed and metadata is None) and
+    cleanup (token counts before and after the pre-LLM cleanup, None when disabled).
+    Raises LLMCallError if formatting fails; nothing is saved in that case.
+    """
+    opts = _merge_options(options)
+    results = await run_stage_graph(_upload_stages(content, filename, opts, is_binary, source_type), on_stage)
+    metadata, metadata_error = results["analyzing_metadata"]
+    return {
+        "transcript_id": results["saving"],
+        "processed_content": results["formatting"][0],
+        "original_content": content,
+        "metadata": metadata,
+        "metadata_error": metadata_error,
+        "cleanup": results["cleaning"][3]
+    }
+
+def _reprocess_stages(transcript, content, opts):
+    """
+    Build the stage graph for reprocessing a stored transcript:
+
+        extracting -> cleaning -> formatting -> saving -> saving_chunks
+        loading_chunks ----------/
+
+    When the source content changed, its metadata and timestamp index are
+    refreshed as in an upload.
+    """
+    transcript_id = transcript["id"]
+    filename = transcript["filename"]
+    source_changed = content != transcript["original_content"]
+
+    async def load_chunks(results):
+        return await asyncio.to_thread(get_transcript_chunks, transcript_id)
+
+    async def extract(results):
+        return await run_cpu(prepare_content_indexed, content, filename, False)
+
+    async def clean(results):
+        text, segments, joiner, _ = results["extracting"]
+        return await run_cpu(clean_content, text, segments, joiner, opts["cleanup"])
+
+    async def format_content(results):
+        return await _format_incremental(results["cleaning"], opts, results["loading_chunks"])
+
+    async def save(results):
+        saved = await asyncio.to_thread(
+            update_transcript_source, transcript_id, content, results["formatting"][0], opts["format_style"]
+        )
+        if not saved:
+            return None
+        _record_formatting(transcript_id, opts, transcript.get("source_type"), reprocess=True)
+        return transcript_id
+
+    async def save_chunks(results):
+        await _save_chunks(results["saving"], results["formatting"][1])
+
+    stages = {
+        "loading_chunks": ((), load_chunks),
+        "extracting": ((), extract),
+        "cleaning": (("extracting",), clean),
+        "formatting": (("cleaning", "loading_chunks"), format_content),
+        "saving": (("formatting",), save),
+        "saving_chunks": (("saving",), save_chunks),
+    }
+    if not source_changed:
+        return stages
+
+    async def analyze(results):
+        text = results["formatting"][0] if opts["metadata_source"] == "processed" else results["cleaning"][0]
+        return await _analyze_metadata(text)
+
+    async def save_metadata(results):
+        metadata, _ = results["analyzing_metadata"]
+        if results["saving"] is not None and metadata is not None:
+            await asyncio.to_thread(save_transcript_metadata, transcript_id, metadata)
+
+    async def save_index(results):
+        await _save_index(results["saving"], results["extracting"])
+
+    analyze_after = ("formatting",) if opts["metadata_source"] == "processed" else ("cleaning",)
+    stages.update({
+        "analyzing_metadata": (analyze_after, analyze),
+        "saving_metadata": (("saving", "analyzing_metadata"), save_metadata),
+        "saving_index": (("saving",), save_index),
+    })
+    return stages
+
+async def run_reprocess_pipeline(transcript, options=None, content=None, on_stage=None):
+    """
+    Reformat a stored transcript with new options or an edited source.
+    Chunks are cut on content-defined boundaries and only those whose text,
+    context or options changed are sent to the model; the rest reuse the outputs
+    stored by earlier runs (see aformat_text_incremental).
+
+    transcript is the stored transcript (see database.get_transcript); content
+    replaces its original content when given.
+
+    Returns a dict with transcript_id, processed_content, chunks (counts of
+    reused and regenerated chunks), cleanup, and metadata / metadata_error when
+    the source changed and its metadata was analyzed again.
+    """
+    opts = _merge_options(options)
+    content = transcript["original_content"] if content is None else content
+    results = await run_stage_graph(_reprocess_stages(transcript, content, opts), on_stage)
+    metadata, metadata_error = results.get("analyzing_metadata", (None, None))
+    return {
+        "transcript_id": results["saving"],
+        "processed_content": results["formatting"][0],
+        "chunks": results["formatting"][2],
+        "cleanup": results["cleaning"][3],
+        "metadata": metadata,
+        "metadata_error": metadata_error,
+    }
+
+async def stream_upload_pipeline(content, filename, options=None, is_binary=False, source_type="transcript"):
+    """
+    Streaming version of run_upload_pipeline.
+    Yields (event, data) tuples: a "cleanup" event with the token counts saved
+    by the pre-LLM cleanup (when enabled), a "delta" event for each piece of processed
+    content as it is generated, then a "done" event with the transcript_id and
+    metadata once the final text has been saved and analyzed.
+    Metadata analysis of the source text runs while the output streams.
+    """
+    opts = _merge_options(options)
+    extracted = await run_cpu(prepare_content_indexed, content, filename, is_binary)
+    text, segments, joiner, _ = extracted
+    text, segments, joiner, report = await run_cpu(clean_content, text, segments, joiner, opts["cleanup"])
+    if report:
+        yield "cleanup", report
+
+    metadata_task = None
+    if opts["metadata_source"] != "processed":
+        metadata_task = asyncio.ensure_future(_analyze_metadata(text))
+
+    try:
+        pieces = []
+        stream = astream_format_text(
+            text, opts["add_paragraphs"], opts["add_headings"], opts["fix_grammar"],
+            opts["highlight_key_points"], opts["format_style"], opts["rewrite_options"],
+            opts["temperature"], chunked=None, segments=segments, joiner=joiner
+        )
+        async for piece in aadjust_markdown_headings_stream(stream):
+            pieces.append(piece)
+            yield "delta", {"text": piece}
+
+        processed = "".join(pieces)
+        yield "stage", {"stage": "saving"}
+        transcript_id = await asyncio.to_thread(
+            save_transcript, filename, content, processed, opts["format_style"], source_type
+        )
+        _record_formatting(transcript_id, opts, source_type)
+        await _save_index(transcript_id, extracted)
+
+        yield "stage", {"stage": "analyzing_metadata"}
+        if metadata_task is None:
+            metadata, metadata_error = await _analyze_metadata(processed)
+        else:
+            metadata, metadata_error = await metadata_task
+        if transcript_id is not None and metadata is not None:
+            await asyncio.to_thread(save_transcript_metadata, transcript_id, metadata)
+
+        yield "done", {"transcript_id": transcript_id, "metadata": metadata, "metadata_error": metadata_error}
+    finally:
+        if metadata_task is not None and not metadata_task.done():
+            metadata_task.cancel()
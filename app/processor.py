@@ -1,186 +1,487 @@
 import os
-import re
-import pysrt
-from dotenv import load_dotenv
-import openai  # Import the module, not the class
-import streamlit as st
+import asyncio
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from app.captions import CAPTION_EXTENSIONS, iter_cues_from_string
+from app.cleanup import CLEANUP_ENABLED, clean_transcript
+from app.pdf_extract import extract_pdf
+from app.executor import run_cpu
+from app.timestamps import TimestampIndex
+from app.chunking import (
+    CHUNK_MAX_WORKERS, should_chunk, split_segments, pack_chunks, stitch_chunks,
+    last_heading, strip_repeated_heading
+)
+from app.llm import model_label, chat_completion, achat_completion, astream_chat_completion
+from app.llm_scheduler import LLMCallError
+from app.llm_metrics import call_info
+from app.prompts import format_template, rewrite_template
+from app.extractive import sample_text
+from app.local_metadata import METADATA_MODE, extract_metadata, library_terms
 
-load_dotenv()
+def _prepare_srt(content):
+    """Return (text, segments, joiner) for caption content, falling back to the raw content"""
+    return _prepare_captions(content)[:3]
 
-# Configure OpenAI with the older style
-openai.api_key = os.getenv("API_KEY")
-AI_MODEL = os.getenv("AI_MODEL", "gpt-4")
+def _prepare_captions(content):
+    """
+    Parse caption content once into (text, segments, joiner, index), where index
+    is the TimestampIndex of the cues in text; falls back to the raw content
+    """
+    cues = list(iter_cues_from_string(content))
+    if not cues:
+        print("No caption cues found, treating content as plain text")
+        return content, None, None, None
+    segments = [cue.text for cue in cues]
+    return ' '.join(segments), segments, " ", TimestampIndex.from_cues(cues, " ")
 
-def process_srt(content, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True, format_style="Article", rewrite_options=None):
-    """Process SRT file content"""
-    try:
-        # Parse SRT content
-        subs = pysrt.from_string(content)
-        
-        # Extract text without timestamps
-        text = ' '.join([sub.text for sub in subs])
-        
-        # Remove HTML tags if any
-        text = re.sub(r'<.*?>', '', text)
-        
-        return format_text(text, add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options)
-    except Exception as e:
-        print(f"SRT processing error: {e}")
-        # If SRT parsing fails, treat as plain text
-        return format_text(content, add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options)
+def process_srt(content, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True, format_style="Article", rewrite_options=None, temperature=0.3, chunked=None):
+    """
+    Process SRT or WebVTT file content
+    If chunked is None, long files are formatted in chunks cut on cue boundaries.
+    """
+    text, segments, joiner = _prepare_srt(content)
+    return format_text(
+        text, add_paragraphs, add_headings, fix_grammar, highlight_key_points,
+        format_style, rewrite_options, temperature, chunked, segments=segments, joiner=joiner
+    )
 
-def process_text(content, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True, format_style="Article", rewrite_options=None):
+async def aprocess_srt(content, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True, format_style="Article", rewrite_options=None, temperature=0.3, chunked=None):
+    """Async version of process_srt"""
+    text, segments, joiner = _prepare_srt(content)
+    return await aformat_text(
+        text, add_paragraphs, add_headings, fix_grammar, highlight_key_points,
+        format_style, rewrite_options, temperature, chunked, segments=segments, joiner=joiner
+    )
+
+def process_text(content, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True, format_style="Article", rewrite_options=None, temperature=0.3, chunked=None):
     """Process plain text file content"""
-    return format_text(content, add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options)
+    return format_text(content, add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options, temperature, chunked)
+
+async def aprocess_text(content, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True, format_style="Article", rewrite_options=None, temperature=0.3, chunked=None):
+    """Async version of process_text"""
+    return await aformat_text(content, add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options, temperature, chunked)
+
+def build_format_prompt(
+    add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", rewrite_options=None
+):
+    """Build the formatting system prompt from the selected options (see prompts.format_template)"""
+    return format_template(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options
+    ).text
+
+def _format_call_info(function_name, template, format_style, **details):
+    """call_info for a formatting call, with the canonical rewrite options and prompt version"""
+    return call_info(function_name, format_style, template.key[-1], prompt_version=template.version, **details)
+
+def _format_messages(template, text):
+    """Build the messages for a single-request formatting call"""
+    return [
+        {"role": "system", "content": template.text},
+        {"role": "user", "content": f"Please format this transcript:\n\n{text}"}
+    ]
 
 def format_text(
     text, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
-    format_style="Article", rewrite_options=None, temperature=0.3
+    format_style="Article", rewrite_options=None, temperature=0.3, chunked=False, segments=None, joiner=None
 ):
-    """Format text using OpenAI API"""
+    """
+    Format text using OpenAI API
+    If chunked is True the text is split and formatted in parallel chunks,
+    if chunked is None the mode is picked from the size of the text.
+    """
+    if chunked is None:
+        chunked = should_chunk(text)
+    if chunked:
+        return format_text_chunked(
+            text, add_paragraphs, add_headings, fix_grammar, highlight_key_points,
+            format_style, rewrite_options, temperature, segments=segments, joiner=joiner
+        )
+
+    template = format_template(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options
+    )
     
-    # Build the system prompt based on formatting options
-    system_instructions = [
-        "You are an expert transcript formatter and editor.",
-        "Your task is to improve the readability of transcripts while maintaining their original meaning."
+    # LLMCallError propagates so a failed call is never mistaken for formatted output
+    return chat_completion(
+        _format_messages(template, text), temperature=temperature,
+        call_info=_format_call_info("format_text", template, format_style)
+    )
+
+async def aformat_text(
+    text, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", rewrite_options=None, temperature=0.3, chunked=False, segments=None, joiner=None
+):
+    """Async version of format_text"""
+    if chunked is None:
+        chunked = should_chunk(text)
+    if chunked:
+        return await aformat_text_chunked(
+            text, add_paragraphs, add_headings, fix_grammar, highlight_key_points,
+            format_style, rewrite_options, temperature, segments=segments, joiner=joiner
+        )
+
+    template = format_template(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options
+    )
+
+    return await achat_completion(
+        _format_messages(template, text), temperature=temperature,
+        call_info=_format_call_info("format_text", template, format_style)
+    )
+
+def _chunk_messages(template, chunk, index, total):
+    """
+    Build the messages for one chunk of a chunked formatting run.
+    The part instructions follow the template, so all chunks share its prefix.
+    """
+    part_instructions = [
+        template.text,
+        f"You are formatting part {index + 1} of {total} of a longer transcript.",
+        "Only format the section you are given; other sections are formatted separately and joined afterwards.",
     ]
-    
-    # Add specific formatting instructions based on user selections
-    if add_paragraphs:
-        system_instructions.append("Organize the content into clear, logical paragraphs based on topic changes or natural breaks in conversation.")
-    
-    if add_headings:
-        system_instructions.append("Insert appropriate section headings (using markdown # syntax) to highlight main topics and improve document structure.")
-    else:
-        # Explicitly instruct the model NOT to add headings
-        system_instructions.append("Do not add any headings or section titles. Do not use markdown # syntax or similar heading formatting. Only use plain text or paragraphs.")
+    if index > 0:
+        part_instructions.append("Do not add a document title or introduction; continue the document from where the previous section ended.")
+    if index < total - 1:
+        part_instructions.append("Do not add a conclusion or summary; the document continues after this section.")
 
-    if fix_grammar:
-        system_instructions.append("Fix grammar, punctuation, and sentence structure while preserving the original meaning.")
-    else:
-        system_instructions.append("Maintain the original grammar and sentence structure.")
-    
-    if highlight_key_points:
-        system_instructions.append("Highlight key points, important concepts, or conclusions using **bold** markdown formatting.")
-    
-    # Add style-specific formatting instructions
-    if format_style == "Article":
-        system_instructions.append("Format the text as a polished article with a clear introduction, body, and conclusion.")
-        system_instructions.append("Use a professional, journalistic tone.")
-    elif format_style == "Transcript":
-        system_instructions.append("Maintain the conversational back-and-forth nature of the transcript.")
-        system_instructions.append("Clearly indicate speaker changes with bold formatting (e.g., **Speaker 1:**).")
-    elif format_style == "Meeting Notes":
-        system_instructions.append("Format as concise meeting notes with clear action items and decisions.")
-        system_instructions.append("Use bullet points for lists and action items.")
-        system_instructions.append("Summarize discussions rather than including all dialogue.")
-    elif format_style == "Academic":
-        system_instructions.append("Format with a formal academic style, using appropriate scholarly language.")
-        system_instructions.append("Organize with clear thesis statements and supporting evidence.")
-        system_instructions.append("Use numbered sections for different topics or arguments.")
-    
-    # Add rewrite options to system prompt
-    if rewrite_options:
-        for opt in rewrite_options:
-            opt_lc = opt.lower().replace(" ", "_")
-            if opt_lc == "clear_&_simple" or opt_lc == "clear_simple":
-                system_instructions.append("Use clear, confident language suitable for an 8th-grade reading level. Be authoritative but avoid overly complex vocabulary or jargon.")
-            elif opt_lc == "professional":
-                system_instructions.append("Use a balanced, measured tone appropriate for business contexts. Be precise and thoughtful, avoiding filler language.")
-            elif opt_lc == "storytelling":
-                system_instructions.append("Reshape the content into a narrative flow with a clear beginning, middle, and end. Use descriptive language and transitional phrases.")
-            elif opt_lc == "youtube_script":
-                system_instructions.append("Structure the content as an engaging video script with clear sections. Use conversational cues and format with intro, body, and conclusion.")
-            elif opt_lc == "educational":
-                system_instructions.append("Present information in a structured, easy-to-follow format that facilitates learning. Include examples and analogies.")
-            elif opt_lc == "balanced":
-                system_instructions.append("Use a mature but approachable tone that connects with the reader. Balance friendliness with substance.")
-            elif opt_lc == "shorter":
-                system_instructions.append("Reduce the word count by approximately 25% while preserving all key information. Focus on concise phrasing.")
-            elif opt_lc == "longer":
-                system_instructions.append("Expand the content by approximately 25% with additional context, examples, and detail.")
-    
-    system_prompt = "\n".join(system_instructions)
-    
-    try:
-        response = openai.ChatCompletion.create(
-            model=AI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Please format this transcript:\n\n{text}"}
-            ],
-            temperature=temperature  # Use passed-in temperature
+    user_content = ""
+    if chunk["context"]:
+        user_content += (
+            "The previous section ended with the following text. It is provided for continuity only, "
+            f"do not include it in your output:\n\n{chunk['context']}\n\n"
         )
-        
-        formatted_text = response.choices[0].message["content"]
-        return formatted_text
-    except Exception as e:
-        print(f"Error formatting text: {e}")
-        return text  # Return original text if formatting fails
+    user_content += f"Please format this transcript section:\n\n{chunk['text']}"
 
-def detect_and_process(
-    content, filename, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
-    format_style="Article", is_binary=False, rewrite_options=None, temperature=0.3
+    return [
+        {"role": "system", "content": "\n".join(part_instructions)},
+        {"role": "user", "content": user_content}
+    ]
+
+def _plan_chunks(text, segments, joiner):
+    """Split text (or pre-split segments such as SRT cues) into chunks"""
+    if segments is None:
+        segments, default_joiner = split_segments(text)
+        joiner = joiner or default_joiner
+    return pack_chunks(segments, joiner=joiner or " ")
+
+def format_text_chunked(
+    text, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", rewrite_options=None, temperature=0.3, segments=None, joiner=None
 ):
     """
-    Detect file type and process accordingly
-    If is_binary is True, content is treated as binary data (for PDF files)
+    Format a long transcript as a map-reduce over token-bounded chunks.
+    Chunks are cut on SRT cue or paragraph boundaries (segments), formatted
+    concurrently with a short overlap of the previous chunk for continuity,
+    and stitched back together in order.
+    """
+    chunks = _plan_chunks(text, segments, joiner)
+    if len(chunks) <= 1:
+        return format_text(
+            text, add_paragraphs, add_headings, fix_grammar, highlight_key_points,
+            format_style, rewrite_options, temperature
+        )
+
+    template = format_template(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options
+    )
+
+    def format_chunk(index):
+        return chat_completion(
+            _chunk_messages(template, chunks[index], index, len(chunks)), temperature=temperature,
+            call_info=_format_call_info(
+                "format_text_chunked", template, format_style, chunk_index=index, chunk_count=len(chunks)
+            )
+        )
+
+    with ThreadPoolExecutor(max_workers=CHUNK_MAX_WORKERS) as executor:
+        outputs = list(executor.map(format_chunk, range(len(chunks))))
+
+    return stitch_chunks(outputs)
+
+async def aformat_text_chunked(
+    text, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", rewrite_options=None, temperature=0.3, segments=None, joiner=None
+):
+    """Async version of format_text_chunked, at most CHUNK_MAX_WORKERS chunks in flight"""
+    chunks = _plan_chunks(text, segments, joiner)
+    if len(chunks) <= 1:
+        return await aformat_text(
+            text, add_paragraphs, add_headings, fix_grammar, highlight_key_points,
+            format_style, rewrite_options, temperature
+        )
+
+    template = format_template(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options
+    )
+    semaphore = asyncio.Semaphore(CHUNK_MAX_WORKERS)
+    outputs = await asyncio.gather(*(
+        _aformat_chunk(template, chunks, i, temperature, semaphore, format_style)
+        for i in range(len(chunks))
+    ))
+    return stitch_chunks(outputs)
+
+async def _aformat_chunk(template, chunks, index, temperature, semaphore, format_style=None):
+    """Format one chunk, holding a semaphore slot while the request is in flight"""
+    async with semaphore:
+        return await achat_completion(
+            _chunk_messages(template, chunks[index], index, len(chunks)), temperature=temperature,
+            call_info=_format_call_info(
+                "format_text_chunked", template, format_style, chunk_index=index, chunk_count=len(chunks)
+            )
+        )
+
+def _chunk_position(index, total):
+    if total == 1:
+        return "whole"
+    if index == 0:
+        return "first"
+    return "last" if index == total - 1 else "middle"
+
+def chunk_key(template, chunk, position, temperature):
+    """
+    Identify the formatting request for one chunk.
+    The key covers the prompt version, the chunk and its context, but only the chunk's
+    position class (first, middle, last or whole) rather than its index, so an
+    output stays reusable when chunks are added or removed elsewhere.
+    """
+    parts = {
+        "model": model_label(),
+        "prompt_version": template.version,
+        "position": position,
+        "context": chunk["context"],
+        "text": chunk["text"],
+        "temperature": temperature,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+async def aformat_text_incremental(
+    text, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", rewrite_options=None, temperature=0.3, chunked=None, segments=None, joiner=None,
+    stored=None
+):
+    """
+    Format text chunk by chunk, reusing the outputs of earlier runs.
+    stored maps chunk keys (see chunk_key) to previously formatted outputs;
+    only chunks whose key is missing, because their text, neighbour context or
+    the options changed, are sent to the model.
+
+    Returns (processed, chunks, report): chunks lists the key, position, input
+    and output of every chunk for storing, report counts reused and regenerated chunks.
+    """
+    stored = stored or {}
+    template = format_template(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options
+    )
+    if chunked is None:
+        chunked = should_chunk(text)
+    planned = _plan_chunks(text, segments, joiner) if chunked else []
+    if len(planned) <= 1:
+        planned = [{"text": text, "context": ""}]
+    total = len(planned)
+    positions = [_chunk_position(i, total) for i in range(total)]
+    keys = [chunk_key(template, planned[i], positions[i], temperature) for i in range(total)]
+    semaphore = asyncio.Semaphore(CHUNK_MAX_WORKERS)
+
+    async def output_for(index):
+        if keys[index] in stored:
+            return stored[keys[index]]
+        if total == 1:
+            return await achat_completion(
+                _format_messages(template, text), temperature=temperature,
+                call_info=_format_call_info("format_text", template, format_style)
+            )
+        return await _aformat_chunk(template, planned, index, temperature, semaphore, format_style)
+
+    outputs = await asyncio.gather(*(output_for(i) for i in range(total)))
+    chunks = [
+        {"key": keys[i], "position": positions[i], "input": planned[i]["text"], "output": outputs[i]}
+        for i in range(total)
+    ]
+    reused = sum(1 for key in keys if key in stored)
+    report = {"chunks": total, "reused": reused, "regenerated": total - reused}
+    processed = stitch_chunks(outputs) if total > 1 else outputs[0]
+    return processed, chunks, report
+
+async def astream_format_text(
+    text, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", rewrite_options=None, temperature=0.3, chunked=None, segments=None, joiner=None
+):
+    """
+    Stream formatted text as the model produces it.
+    In chunked mode the first chunk is streamed token by token while the
+    remaining chunks are formatted concurrently in the background; each is
+    emitted, in order, as soon as the chunks before it have been sent.
+    """
+    template = format_template(
+        add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options
+    )
+    if chunked is None:
+        chunked = should_chunk(text)
+    chunks = _plan_chunks(text, segments, joiner) if chunked else []
+    if len(chunks) <= 1:
+        async for delta in astream_chat_completion(
+            _format_messages(template, text), temperature=temperature,
+            call_info=_format_call_info("astream_format_text", template, format_style)
+        ):
+            yield delta
+        return
+
+    # Leave one slot free for the streamed first chunk
+    semaphore = asyncio.Semaphore(max(1, CHUNK_MAX_WORKERS - 1))
+    tasks = [
+        asyncio.create_task(
+            _aformat_chunk(template, chunks, i, temperature, semaphore, format_style)
+        )
+        for i in range(1, len(chunks))
+    ]
+    try:
+        streamed = []
+        first_messages = _chunk_messages(template, chunks[0], 0, len(chunks))
+        async for delta in astream_chat_completion(
+            first_messages, temperature=temperature,
+            call_info=_format_call_info(
+                "astream_format_text", template, format_style, chunk_index=0, chunk_count=len(chunks)
+            )
+        ):
+            streamed.append(delta)
+            yield delta
+        previous_heading = last_heading("".join(streamed))
+        for task in tasks:
+            output = strip_repeated_heading(await task, previous_heading)
+            if output:
+                yield "\n\n" + output
+                previous_heading = last_heading(output) or previous_heading
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def prepare_content(content, filename, is_binary):
+    """
+    Turn uploaded content into text ready for formatting
+    Returns (text, segments, joiner); segments are the caption cues when available
+    """
+    return prepare_content_indexed(content, filename, is_binary)[:3]
+
+def prepare_content_indexed(content, filename, is_binary):
+    """
+    Like prepare_content, but returns (text, segments, joiner, index) where index is
+    the TimestampIndex linking offsets in text to cue times (None for non-caption files)
     """
-    import os
-    
     file_extension = os.path.splitext(filename)[1].lower()
-    processed_content = ""
-    
+
     # Handle PDF files
     if file_extension == '.pdf' and is_binary:
-        # Extract text from PDF
-        content = extract_text_from_pdf(content)
-        # Process the extracted text
-        processed_content = format_text(
-            content, 
-            add_paragraphs=add_paragraphs,
-            add_headings=add_headings,
-            fix_grammar=fix_grammar,
-            highlight_key_points=highlight_key_points,
-            format_style=format_style,
-            rewrite_options=rewrite_options,
-            temperature=temperature
-        )
-    # Process SRT files
-    elif file_extension == '.srt':
-        # Process the SRT file directly - process_srt already calls format_text internally
-        processed_content = process_srt(
-            content,
-            add_paragraphs=add_paragraphs,
-            add_headings=add_headings,
-            fix_grammar=fix_grammar,
-            highlight_key_points=highlight_key_points,
-            format_style=format_style,
-            rewrite_options=rewrite_options
-        )
+        return extract_text_from_pdf(content), None, None, None
+    # Process SRT and WebVTT caption files
+    if file_extension in CAPTION_EXTENSIONS:
+        return _prepare_captions(content)
     # Process other text files
-    else:
-        # Process plain text
-        processed_content = format_text(
-            content, 
-            add_paragraphs=add_paragraphs,
-            add_headings=add_headings,
-            fix_grammar=fix_grammar,
-            highlight_key_points=highlight_key_points,
-            format_style=format_style,
-            rewrite_options=rewrite_options,
-            temperature=temperature
-        )
+    return content, None, None, None
+
+def clean_content(text, segments=None, joiner=None, cleanup=None):
+    """
+    Run the deterministic pre-LLM cleanup (caption dedup, filler removal, whitespace)
+    Returns (text, segments, joiner, report); report is None when cleanup is off
+    If cleanup is None, CLEANUP_ENABLED decides.
+    """
+    if cleanup is None:
+        cleanup = CLEANUP_ENABLED
+    if not cleanup:
+        return text, segments, joiner, None
+    text, segments, joiner, report = clean_transcript(text, segments, joiner)
+    print(
+        f"Cleanup: {report['tokens_before']} -> {report['tokens_after']} tokens "
+        f"({report['reduction_pct']}% fewer)"
+    )
+    return text, segments, joiner, report
+
+def detect_and_process(
+    content, filename, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", is_binary=False, rewrite_options=None, temperature=0.3, chunked=None, cleanup=None
+):
+    """
+    Detect file type and process accordingly
+    If is_binary is True, content is treated as binary data (for PDF files)
+    If chunked is None, content above CHUNKED_THRESHOLD_TOKENS is formatted in chunks
+    If cleanup is None, the pre-LLM cleanup runs when CLEANUP_ENABLED is set
+    """
+    text, segments, joiner = prepare_content(content, filename, is_binary)
+    text, segments, joiner, _ = clean_content(text, segments, joiner, cleanup)
+    processed_content = format_text(
+        text,
+        add_paragraphs=add_paragraphs,
+        add_headings=add_headings,
+        fix_grammar=fix_grammar,
+        highlight_key_points=highlight_key_points,
+        format_style=format_style,
+        rewrite_options=rewrite_options,
+        temperature=temperature,
+        chunked=chunked,
+        segments=segments,
+        joiner=joiner
+    )
     
     # Adjust heading sizes as the final step
     processed_content = adjust_markdown_headings(processed_content)
     
     return processed_content
 
-def generate_post_ideas(transcript_content):
-    """Generate content ideas for social media posts based on a transcript"""
-    try:
-        system_prompt = """You are an expert content creator specializing in helping creators repurpose their content across platforms. 
+async def adetect_and_process(
+    content, filename, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", is_binary=False, rewrite_options=None, temperature=0.3, chunked=None,
+    on_stage=None, cleanup=None
+):
+    """
+    Async version of detect_and_process, awaits the LLM calls instead of blocking
+    on_stage is an optional coroutine function called with each stage name
+    """
+    if on_stage:
+        await on_stage("extracting")
+    text, segments, joiner = await run_cpu(prepare_content, content, filename, is_binary)
+    if on_stage:
+        await on_stage("cleaning")
+    text, segments, joiner, _ = await run_cpu(clean_content, text, segments, joiner, cleanup)
+    if on_stage:
+        await on_stage("formatting")
+    processed_content = await aformat_text(
+        text,
+        add_paragraphs=add_paragraphs,
+        add_headings=add_headings,
+        fix_grammar=fix_grammar,
+        highlight_key_points=highlight_key_points,
+        format_style=format_style,
+        rewrite_options=rewrite_options,
+        temperature=temperature,
+        chunked=chunked,
+        segments=segments,
+        joiner=joiner
+    )
+
+    # Adjust heading sizes as the final step
+    return await run_cpu(adjust_markdown_headings, processed_content)
+
+async def astream_detect_and_process(
+    content, filename, add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", is_binary=False, rewrite_options=None, temperature=0.3, chunked=None, cleanup=None
+):
+    """
+    Streaming version of detect_and_process
+    Yields pieces of the processed content, with headings adjusted on each complete line
+    """
+    text, segments, joiner = await run_cpu(prepare_content, content, filename, is_binary)
+    text, segments, joiner, _ = await run_cpu(clean_content, text, segments, joiner, cleanup)
+    pieces = astream_format_text(
+        text, add_paragraphs, add_headings, fix_grammar, highlight_key_points,
+        format_style, rewrite_options, temperature, chunked, segments=segments, joiner=joiner
+    )
+    async for piece in aadjust_markdown_headings_stream(pieces):
+        yield piece
+
+def _post_ideas_messages(transcript_content):
+    """Build the messages for a post ideas request"""
+    system_prompt = """You are an expert content creator specializing in helping creators repurpose their content across platforms. 
         Your task is to analyze a transcript and generate creative ideas for social media posts and videos.
 
         Based on the provided transcript, generate the following:
@@ -198,40 +499,47 @@ def generate_post_ideas(transcript_content):
         Format your answer with clear headings using markdown.
         """
 
-        # Check length of transcript to determine how many ideas to generate
-        is_short = len(transcript_content.split()) < 300  # Arbitrary threshold for "short" transcript
-        
-        user_prompt = f"The following is a transcript of content. Please analyze it and generate content ideas:\n\n{transcript_content}"
-        if is_short:
-            user_prompt += "\n\nThis transcript is relatively short, so please generate at least 3 ideas for each category."
-        else:
-            user_prompt += "\n\nThis transcript is substantial, so please generate at least 5 ideas for each category."
-
-        # Call OpenAI API
-        response = openai.ChatCompletion.create(
-            model=AI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            # Higher temperature for more creativity
-            temperature=0.7,
-            max_tokens=2048
-        )
-        
-        # Extract the response content
-        ideas = response.choices[0].message["content"]
-        
-        if not ideas.strip():
-            raise ValueError("AI returned empty response")
-            
-        return ideas
-        
-    except Exception as e:
-        error_message = f"❌ POST IDEAS GENERATION ERROR: {str(e)}"
-        print(error_message)
-        st.error(error_message)
-        return f"Error generating post ideas: {str(e)}"
+    # Check length of transcript to determine how many ideas to generate
+    is_short = len(transcript_content.split()) < 300  # Arbitrary threshold for "short" transcript
+    
+    user_prompt = f"The following is a transcript of content. Please analyze it and generate content ideas:\n\n{transcript_content}"
+    if is_short:
+        user_prompt += "\n\nThis transcript is relatively short, so please generate at least 3 ideas for each category."
+    else:
+        user_prompt += "\n\nThis transcript is substantial, so please generate at least 5 ideas for each category."
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def generate_post_ideas(transcript_content):
+    """
+    Generate content ideas for social media posts based on a transcript
+    Raises LLMCallError if the ideas could not be generated
+    """
+    # Higher temperature for more creativity
+    return chat_completion(
+        _post_ideas_messages(transcript_content), temperature=0.7, max_tokens=2048,
+        call_info=call_info("generate_post_ideas")
+    )
+
+async def agenerate_post_ideas(transcript_content):
+    """Async version of generate_post_ideas"""
+    return await achat_completion(
+        _post_ideas_messages(transcript_content), temperature=0.7, max_tokens=2048,
+        call_info=call_info("generate_post_ideas")
+    )
+
+def build_rewrite_prompt(options):
+    """Build the rewrite system prompt for the selected style options (see prompts.rewrite_template)"""
+    return rewrite_template(options).text
+
+def _rewrite_messages(content, template):
+    return [
+        {"role": "system", "content": template.text},
+        {"role": "user", "content": f"Please rewrite this transcript according to the style instructions:\n\n{content}"}
+    ]
 
 def rewrite_transcript(content, options):
     """
@@ -251,129 +559,34 @@ def rewrite_transcript(content, options):
     
     Returns:
         str: The rewritten transcript
+
+    Raises:
+        LLMCallError: if the rewrite call fails
     """
     
     # Validate options
-    if "shorter" in options and "longer" in options:
+    template = rewrite_template(options)
+    if "shorter" in template.key and "longer" in template.key:
         return "ERROR: Cannot select both 'Shorter' and 'Longer' options. Please choose only one."
     
-    # Word and phrase blacklist
-    blacklisted_terms = [
-        "realm",
-        "delve", 
-        "dive deep",
-        "dive into",
-        "dive in",
-        "journey",
-        "explore",  
-        "Let's explore",         
-        "What if I told you",
-        "What if I said",
-        "What if I shared",
-        "Today, we're exploring a fascinating concept",
-        "Today, we're diving into a fascinating concept",
-        "Today, we're delving into a fascinating concept",          
-        "Welcome to our exploration",   
-        "Welcome to our journey",
-        "Welcome to our deep dive", 
-        "Welcome to our realm",
-        "Welcome to our discussion",
-        "Welcome to our analysis",
-        "Welcome to our exploration",
-        "Welcome to our analysis",        
-        "In conclusion",        
-        "In summary",
-        "In closing",
-        "profound"
-    ]
-    
-    # Build the system prompt based on selected options
-    system_instructions = [
-        "You are an expert content editor specializing in rewriting and reformatting transcripts.",
-        "Your task is to rewrite the provided transcript according to the specified style options while preserving the original meaning and information.",
-        "",
-        "IMPORTANT: You must NEVER use the following words or phrases in your rewrite:",
-    ]
-    
-    # Add blacklisted terms to instructions
-    for term in blacklisted_terms:
-        system_instructions.append(f"- \"{term}\"")
-    
-    system_instructions.append("")
-    system_instructions.append("If you feel tempted to use any of these terms, find alternative expressions instead.")
-    
-    # Add specific style instructions based on user selections
-    if "clear_simple" in options:
-        system_instructions.append("Use clear, confident language suitable for an 8th-grade reading level.")
-        system_instructions.append("Be authoritative but avoid overly complex vocabulary or jargon.")
-        system_instructions.append("Explain complex ideas in simple terms while maintaining accuracy.")
-    
-    if "professional" in options:
-        system_instructions.append("Use a balanced, measured tone appropriate for business contexts.")
-        system_instructions.append("Be precise and thoughtful, avoiding filler language.")
-        system_instructions.append("Maintain a warm yet professional distance - neither overly formal nor casual.")
-    
-    if "storytelling" in options:
-        system_instructions.append("Reshape the content into a narrative flow with a clear beginning, middle, and end.")
-        system_instructions.append("Use descriptive language and transitional phrases to guide the reader.")
-        system_instructions.append("Create a sense of progression and purpose throughout the text.")
-    
-    if "youtube_script" in options:
-        system_instructions.append("Structure the content as an engaging video script with clear sections.")
-        system_instructions.append("Use conversational cues like 'as you can see' or 'let's explore' where appropriate.")
-        system_instructions.append("Format with clear intro, body sections, and conclusion with call to action.")
-        system_instructions.append("Include natural transitions between topics.")
-    
-    if "educational" in options:
-        system_instructions.append("Present information in a structured, easy-to-follow format that facilitates learning.")
-        system_instructions.append("Include examples and analogies to illustrate complex points.")
-        system_instructions.append("Define key terms and concepts clearly.")
-        system_instructions.append("Use a progressive structure that builds understanding from basic to more complex ideas.")
-    
-    if "balanced" in options:
-        system_instructions.append("Use a mature but approachable tone that connects with the reader.")
-        system_instructions.append("Balance friendliness with substance - be conversational but not casual.")
-        system_instructions.append("Write as if speaking to an intelligent peer in a thoughtful discussion.")
-        system_instructions.append("Use natural language without being overly informal or using slang.")
-    
-    if "shorter" in options:
-        system_instructions.append("Reduce the word count by approximately 25% while preserving all key information.")
-        system_instructions.append("Focus on concise phrasing and removing redundancies.")
-        system_instructions.append("Prioritize the most important points and concepts from the original.")
-    
-    if "longer" in options:
-        system_instructions.append("Expand the content by approximately 25% with additional context, examples, and detail.")
-        system_instructions.append("Elaborate on key concepts to provide deeper understanding.")
-        system_instructions.append("Add relevant background information or explanations where helpful.")
-        system_instructions.append("Include additional context or implications of the content.")
-    
-    # Create a cohesive system prompt
-    system_prompt = "\n".join(system_instructions)
-    
-    try:
-        response = openai.ChatCompletion.create(
-            model=AI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Please rewrite this transcript according to the style instructions:\n\n{content}"}
-            ],
-            temperature=0.4  # Moderate temperature for creativity while maintaining consistency
-        )
-        
-        rewritten_text = response.choices[0].message["content"]
-        return rewritten_text
-    except Exception as e:
-        error_message = f"❌ REWRITE ERROR: {str(e)}"
-        print(error_message)
-        st.error(error_message)
-        return f"Error rewriting transcript: {str(e)}"
+    # Moderate temperature for creativity while maintaining consistency
+    return chat_completion(
+        _rewrite_messages(content, template), temperature=0.4,
+        call_info=call_info("rewrite_transcript", rewrite_options=template.key, prompt_version=template.version)
+    )
 
-def analyze_transcript_metadata(content):
-    """
-    Generate metadata about transcript content including topics, keywords, and sentiment
-    """
-    try:
-        system_prompt = """You are an AI specializing in content analysis. 
+async def arewrite_transcript(content, options):
+    """Async version of rewrite_transcript"""
+    template = rewrite_template(options)
+    if "shorter" in template.key and "longer" in template.key:
+        return "ERROR: Cannot select both 'Shorter' and 'Longer' options. Please choose only one."
+
+    return await achat_completion(
+        _rewrite_messages(content, template), temperature=0.4,
+        call_info=call_info("rewrite_transcript", rewrite_options=template.key, prompt_version=template.version)
+    )
+
+METADATA_SYSTEM_PROMPT = """You are an AI specializing in content analysis. 
         Analyze the provided transcript and extract the following metadata:
         
         1. Topics: Main subjects discussed in the content (max 5)
@@ -384,62 +597,67 @@ def analyze_transcript_metadata(content):
         Format your response as a JSON object with these keys: topics, keywords, sentiment, tags.
         For sentiment, include both the classification and a confidence score between 0 and 1.
         """
-        
-        # Call OpenAI API
-        response = openai.ChatCompletion.create(
-            model=AI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Analyze this transcript:\n\n{content[:8000]}"}
-            ],
-            temperature=0.1,  # Low temperature for consistent analysis
-            response_format={"type": "json_object"}  # <-- Force JSON output
-        )
-        
-        # Extract and parse JSON response
-        metadata_json = response.choices[0].message["content"]
-        if not metadata_json.strip():
-            print("OpenAI returned empty metadata response:", metadata_json)
-            raise ValueError("AI returned empty metadata response")
-        import json
+
+def _metadata_messages(sample):
+    """Build the metadata messages for a (text, sampled) pair from extractive.sample_text"""
+    text, sampled = sample
+    if sampled:
+        intro = "Analyze this transcript. The text below is a sample of representative sentences taken from across the whole transcript, in order:"
+    else:
+        intro = "Analyze this transcript:"
+    return [
+        {"role": "system", "content": METADATA_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{intro}\n\n{text}"}
+    ]
+
+def _metadata_kwargs():
+    return {
+        "temperature": 0.1,  # Low temperature for consistent analysis
+        "response_format": {"type": "json_object"},  # <-- Force JSON output
+        "call_info": call_info("analyze_transcript_metadata")
+    }
+
+def _parse_metadata(metadata_json):
+    """Parse the JSON metadata response from the model"""
+    try:
         metadata = json.loads(metadata_json)
-        return metadata
-    except Exception as e:
-        print(f"Error analyzing transcript metadata: {e}")
-        # Optionally print the raw response for debugging
-        try:
-            print("Raw OpenAI response:", metadata_json)
-        except Exception:
-            pass
-        return {
-            "topics": [],
-            "keywords": [],
-            "sentiment": {"classification": "neutral", "confidence": 0.5},
-            "tags": []
-        }
-
-def extract_text_from_pdf(pdf_content):
+    except ValueError as e:
+        # Print the raw response for debugging
+        print("Raw OpenAI response:", metadata_json)
+        raise LLMCallError(f"AI returned invalid metadata JSON: {e}", status="invalid_response") from e
+    if not isinstance(metadata, dict):
+        raise LLMCallError("AI returned metadata that is not a JSON object", status="invalid_response")
+    return metadata
+
+def analyze_transcript_metadata(content, mode=None):
+    """
+    Generate metadata about transcript content including topics, keywords, and sentiment
+    mode "local" extracts it without a model call (see local_metadata), "llm" asks
+    the model; None uses METADATA_MODE.
+    Long transcripts are sent to the model as an extractive sample of METADATA_SAMPLE_TOKENS
+    drawn from the whole text, so the metadata covers all of it at a fixed prompt size.
+    Raises LLMCallError if the analysis fails, rather than returning empty defaults
+    """
+    if (mode or METADATA_MODE) == "local":
+        return extract_metadata(content, library_terms())
+    messages = _metadata_messages(sample_text(content))
+    return _parse_metadata(chat_completion(messages, **_metadata_kwargs()))
+
+async def aanalyze_transcript_metadata(content, mode=None):
+    """Async version of analyze_transcript_metadata"""
+    if (mode or METADATA_MODE) == "local":
+        library = await asyncio.to_thread(library_terms)
+        return await run_cpu(extract_metadata, content, library)
+    messages = _metadata_messages(await run_cpu(sample_text, content))
+    return _parse_metadata(await achat_completion(messages, **_metadata_kwargs()))
+
+def extract_text_from_pdf(pdf_content, max_pages=None):
     """
     Extract text from a PDF file
+    Large PDFs are split into page ranges extracted in parallel worker processes
     """
     try:
-        from io import BytesIO
-        import PyPDF2
-        
-        # Create a file-like object from the PDF content
-        pdf_file = BytesIO(pdf_content)
-        
-        # Create a PDF reader object
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        # Extract text from all pages
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:  # Check if text extraction was successful
-                text += page_text + "\n\n"
-        
-        return text.strip()
+        return extract_pdf(pdf_content, max_pages)["text"]
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
         return f"Error extracting text from PDF: {str(e)}"
@@ -464,4 +682,19 @@ def adjust_markdown_headings(markdown_text):
         else:
             adjusted_lines.append(line)
             
-    return '\n'.join(adjusted_lines)
\ No newline at end of file
+    return '\n'.join(adjusted_lines)
+
+async def aadjust_markdown_headings_stream(pieces):
+    """
+    Apply adjust_markdown_headings to an async stream of text pieces.
+    Text is held back only until its line is complete, so a heading marker
+    split across pieces is still rewritten.
+    """
+    buffer = ""
+    async for piece in pieces:
+        buffer += piece
+        if "\n" in buffer:
+            complete, buffer = buffer.rsplit("\n", 1)
+            yield "\n".join(adjust_markdown_headings(line) for line in complete.split("\n")) + "\n"
+    if buffer:
+        yield adjust_markdown_headings(buffer)
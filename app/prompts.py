@@ -0,0 +1,211 @@
+import re
+import hashlib
+from collections import namedtuple
+from functools import lru_cache
+
+# A compiled system prompt: name ("format" or "rewrite"), the canonical option key it was
+# built from, its text, and a short hash of the text used in cache keys and llm_calls
+PromptTemplate = namedtuple("PromptTemplate", ["name", "key", "text", "version"])
+
+FORMAT_STYLES = ("Article", "Transcript", "Meeting Notes", "Academic")
+# Canonical order of the rewrite options; templates always list them in this order
+REWRITE_OPTIONS = (
+    "clear_simple", "professional", "storytelling", "youtube_script",
+    "educational", "balanced", "shorter", "longer",
+)
+
+# --- Formatting prompt fragments ---
+# The shared block comes first so every formatting prompt starts with the same text,
+# followed by the option-dependent instructions in a fixed order
+_FORMAT_SHARED = (
+    "You are an expert transcript formatter and editor.",
+    "Your task is to improve the readability of transcripts while maintaining their original meaning.",
+)
+_FORMAT_PARAGRAPHS = "Organize the content into clear, logical paragraphs based on topic changes or natural breaks in conversation."
+_FORMAT_HEADINGS = {
+    True: "Insert appropriate section headings (using markdown # syntax) to highlight main topics and improve document structure.",
+    # Explicitly instruct the model NOT to add headings
+    False: "Do not add any headings or section titles. Do not use markdown # syntax or similar heading formatting. Only use plain text or paragraphs.",
+}
+_FORMAT_GRAMMAR = {
+    True: "Fix grammar, punctuation, and sentence structure while preserving the original meaning.",
+    False: "Maintain the original grammar and sentence structure.",
+}
+_FORMAT_KEY_POINTS = "Highlight key points, important concepts, or conclusions using **bold** markdown formatting."
+_FORMAT_STYLE_INSTRUCTIONS = {
+    "Article": (
+        "Format the text as a polished article with a clear introduction, body, and conclusion.",
+        "Use a professional, journalistic tone.",
+    ),
+    "Transcript": (
+        "Maintain the conversational back-and-forth nature of the transcript.",
+        "Clearly indicate speaker changes with bold formatting (e.g., **Speaker 1:**).",
+    ),
+    "Meeting Notes": (
+        "Format as concise meeting notes with clear action items and decisions.",
+        "Use bullet points for lists and action items.",
+        "Summarize discussions rather than including all dialogue.",
+    ),
+    "Academic": (
+        "Format with a formal academic style, using appropriate scholarly language.",
+        "Organize with clear thesis statements and supporting evidence.",
+        "Use numbered sections for different topics or arguments.",
+    ),
+}
+_FORMAT_REWRITE_INSTRUCTIONS = {
+    "clear_simple": "Use clear, confident language suitable for an 8th-grade reading level. Be authoritative but avoid overly complex vocabulary or jargon.",
+    "professional": "Use a balanced, measured tone appropriate for business contexts. Be precise and thoughtful, avoiding filler language.",
+    "storytelling": "Reshape the content into a narrative flow with a clear beginning, middle, and end. Use descriptive language and transitional phrases.",
+    "youtube_script": "Structure the content as an engaging video script with clear sections. Use conversational cues and format with intro, body, and conclusion.",
+    "educational": "Present information in a structured, easy-to-follow format that facilitates learning. Include examples and analogies.",
+    "balanced": "Use a mature but approachable tone that connects with the reader. Balance friendliness with substance.",
+    "shorter": "Reduce the word count by approximately 25% while preserving all key information. Focus on concise phrasing.",
+    "longer": "Expand the content by approximately 25% with additional context, examples, and detail.",
+}
+
+# --- Rewrite prompt fragments ---
+# Word and phrase blacklist
+_REWRITE_BLACKLIST = (
+    "realm",
+    "delve",
+    "dive deep",
+    "dive into",
+    "dive in",
+    "journey",
+    "explore",
+    "Let's explore",
+    "What if I told you",
+    "What if I said",
+    "What if I shared",
+    "Today, we're exploring a fascinating concept",
+    "Today, we're diving into a fascinating concept",
+    "Today, we're delving into a fascinating concept",
+    "Welcome to our exploration",
+    "Welcome to our journey",
+    "Welcome to our deep dive",
+    "Welcome to our realm",
+    "Welcome to our discussion",
+    "Welcome to our analysis",
+    "Welcome to our exploration",
+    "Welcome to our analysis",
+    "In conclusion",
+    "In summary",
+    "In closing",
+    "profound",
+)
+_REWRITE_SHARED = (
+    "You are an expert content editor specializing in rewriting and reformatting transcripts.",
+    "Your task is to rewrite the provided transcript according to the specified style options while preserving the original meaning and information.",
+    "",
+    "IMPORTANT: You must NEVER use the following words or phrases in your rewrite:",
+) + tuple(f"- \"{term}\"" for term in _REWRITE_BLACKLIST) + (
+    "",
+    "If you feel tempted to use any of these terms, find alternative expressions instead.",
+)
+_REWRITE_STYLE_INSTRUCTIONS = {
+    "clear_simple": (
+        "Use clear, confident language suitable for an 8th-grade reading level.",
+        "Be authoritative but avoid overly complex vocabulary or jargon.",
+        "Explain complex ideas in simple terms while maintaining accuracy.",
+    ),
+    "professional": (
+        "Use a balanced, measured tone appropriate for business contexts.",
+        "Be precise and thoughtful, avoiding filler language.",
+        "Maintain a warm yet professional distance - neither overly formal nor casual.",
+    ),
+    "storytelling": (
+        "Reshape the content into a narrative flow with a clear beginning, middle, and end.",
+        "Use descriptive language and transitional phrases to guide the reader.",
+        "Create a sense of progression and purpose throughout the text.",
+    ),
+    "youtube_script": (
+        "Structure the content as an engaging video script with clear sections.",
+        "Use conversational cues like 'as you can see' or 'let's explore' where appropriate.",
+        "Format with clear intro, body sections, and conclusion with call to action.",
+        "Include natural transitions between topics.",
+    ),
+    "educational": (
+        "Present information in a structured, easy-to-follow format that facilitates learning.",
+        "Include examples and analogies to illustrate complex points.",
+        "Define key terms and concepts clearly.",
+        "Use a progressive structure that builds understanding from basic to more complex ideas.",
+    ),
+    "balanced": (
+        "Use a mature but approachable tone that connects with the reader.",
+        "Balance friendliness with substance - be conversational but not casual.",
+        "Write as if speaking to an intelligent peer in a thoughtful discussion.",
+        "Use natural language without being overly informal or using slang.",
+    ),
+    "shorter": (
+        "Reduce the word count by approximately 25% while preserving all key information.",
+        "Focus on concise phrasing and removing redundancies.",
+        "Prioritize the most important points and concepts from the original.",
+    ),
+    "longer": (
+        "Expand the content by approximately 25% with additional context, examples, and detail.",
+        "Elaborate on key concepts to provide deeper understanding.",
+        "Add relevant background information or explanations where helpful.",
+        "Include additional context or implications of the content.",
+    ),
+}
+
+def canonical_rewrite_options(options):
+    """
+    Normalize rewrite options ("Clear & Simple", "clear_simple", ...) to a tuple of
+    known option ids in REWRITE_OPTIONS order, without duplicates
+    """
+    selected = {re.sub(r"[^a-z0-9]+", "_", option.lower()).strip("_") for option in options or ()}
+    return tuple(option for option in REWRITE_OPTIONS if option in selected)
+
+def _template(name, key, lines):
+    text = "\n".join(lines)
+    version = hashlib.sha256(f"{name}\n{text}".encode("utf-8")).hexdigest()[:12]
+    return PromptTemplate(name, key, text, version)
+
+@lru_cache(maxsize=None)
+def _compile_format(key):
+    add_paragraphs, add_headings, fix_grammar, highlight_key_points, format_style, rewrite_options = key
+    lines = list(_FORMAT_SHARED)
+    if add_paragraphs:
+        lines.append(_FORMAT_PARAGRAPHS)
+    lines.append(_FORMAT_HEADINGS[add_headings])
+    lines.append(_FORMAT_GRAMMAR[fix_grammar])
+    if highlight_key_points:
+        lines.append(_FORMAT_KEY_POINTS)
+    lines.extend(_FORMAT_STYLE_INSTRUCTIONS.get(format_style, ()))
+    lines.extend(_FORMAT_REWRITE_INSTRUCTIONS[option] for option in rewrite_options)
+    return _template("format", key, lines)
+
+@lru_cache(maxsize=None)
+def _compile_rewrite(key):
+    lines = list(_REWRITE_SHARED)
+    for option in key:
+        lines.extend(_REWRITE_STYLE_INSTRUCTIONS[option])
+    return _template("rewrite", key, lines)
+
+def format_template(
+    add_paragraphs=True, add_headings=True, fix_grammar=True, highlight_key_points=True,
+    format_style="Article", rewrite_options=None
+):
+    """
+    Return the formatting prompt for an option combination.
+    Options are reduced to a canonical key first, so equivalent selections (in any
+    order, with any option spelling) share one compiled template and its version.
+    """
+    key = (
+        bool(add_paragraphs), bool(add_headings), bool(fix_grammar), bool(highlight_key_points),
+        format_style if format_style in FORMAT_STYLES else None,
+        canonical_rewrite_options(rewrite_options),
+    )
+    return _compile_format(key)
+
+def rewrite_template(options):
+    """Return the rewrite prompt for a set of rewrite options (see format_template)"""
+    return _compile_rewrite(canonical_rewrite_options(options))
+
+def registry_stats():
+    """Number of templates compiled so far, per prompt"""
+    return {
+        "format_templates": _compile_format.cache_info().currsize,
+        "rewrite_templates": _compile_rewrite.cache_info().currsize,
+    }
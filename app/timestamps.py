@@ -0,0 +1,165 @@
+import re
+import sys
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from app.database import get_timestamp_index
+
+# Serialized layout: magic, cue count, text length, then the offsets, starts and ends arrays as little-endian int32
+_MAGIC = b"TSI1"
+_HEADER = struct.Struct("<4sII")
+# Loaded indexes kept in memory, by transcript id
+_CACHE_SIZE = 64
+
+class TimestampIndex:
+    """
+    Cue timings for a caption transcript, as three parallel int arrays:
+    offsets (character offset of each cue in the joined cue text), starts and
+    ends (milliseconds, -1 when a cue's timing could not be read).
+    length is the length of the cue text; offsets at or past it are out of range.
+    Lookups are binary searches over offsets.
+    """
+
+    def __init__(self, offsets=None, starts=None, ends=None, length=0):
+        self.offsets = offsets if offsets is not None else array("i")
+        self.starts = starts if starts is not None else array("i")
+        self.ends = ends if ends is not None else array("i")
+        self.length = length
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def from_cues(cls, cues, joiner=" "):
+        """Build the index for the text produced by joiner.join(cue.text for cue in cues)"""
+        index = cls()
+        offset = 0
+        for cue in cues:
+            index.offsets.append(offset)
+            index.starts.append(-1 if cue.start_ms is None else cue.start_ms)
+            index.ends.append(-1 if cue.end_ms is None else cue.end_ms)
+            offset += len(cue.text) + len(joiner)
+        index.length = max(0, offset - len(joiner))
+        return index
+
+    def to_bytes(self):
+        parts = [_HEADER.pack(_MAGIC, len(self), self.length)]
+        for values in (self.offsets, self.starts, self.ends):
+            if sys.byteorder == "big":
+                values = array("i", values)
+                values.byteswap()
+            parts.append(values.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, count, length = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a timestamp index")
+        position = _HEADER.size
+        arrays = []
+        for _ in range(3):
+            values = array("i")
+            values.frombytes(data[position:position + count * values.itemsize])
+            if sys.byteorder == "big":
+                values.byteswap()
+            arrays.append(values)
+            position += count * values.itemsize
+        return cls(*arrays, length=length)
+
+    def cue_at(self, offset):
+        """Return the position of the cue containing a character offset, None if out of range"""
+        if offset < 0 or offset >= self.length:
+            return None
+        position = bisect_right(self.offsets, offset) - 1
+        return position if position >= 0 and len(self) else None
+
+    def _time(self, values, position):
+        value = values[position]
+        return None if value < 0 else value
+
+    def lookup(self, start_offset, end_offset=None):
+        """
+        Map a character range of the cue text to a time range.
+        Returns a dict with start_ms, end_ms and the cue numbers, or None when the
+        range is outside the text. Raises ValueError when end_offset < start_offset.
+        """
+        if end_offset is not None and end_offset < start_offset:
+            raise ValueError("end_offset is before offset")
+        first = self.cue_at(start_offset)
+        if first is None:
+            return None
+        last = self.cue_at(end_offset if end_offset is not None else start_offset)
+        if last is None:
+            return None
+        return {
+            "start_ms": self._time(self.starts, first),
+            "end_ms": self._time(self.ends, last),
+            "first_cue": first + 1,
+            "last_cue": last + 1,
+        }
+
+def phrase_pattern(phrase):
+    """
+    Regex matching the words of a phrase in order, ignoring case and punctuation and
+    allowing up to two extra words in between (fillers and stutters removed before formatting)
+    """
+    words = re.findall(r"\w+", phrase)
+    if not words:
+        return None
+    return re.compile(r"\W+(?:\w+\W+){0,2}?".join(re.escape(word) for word in words), re.IGNORECASE)
+
+def find_phrase(index, cue_text, phrase, limit=10):
+    """Return the time ranges of up to limit occurrences of phrase in the cue text"""
+    pattern = phrase_pattern(phrase)
+    if pattern is None:
+        return []
+    matches = []
+    for match in pattern.finditer(cue_text):
+        result = index.lookup(match.start(), max(match.start(), match.end() - 1))
+        if result:
+            matches.append({**result, "offset": match.start(), "text": match.group(0)})
+        if len(matches) >= limit:
+            break
+    return matches
+
+class TimestampIndexCache:
+    """Small LRU of (index, cue_text) pairs so lookups do not reload the index each request"""
+
+    def __init__(self, size=_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, transcript_id, load):
+        """Return the cached entry, calling load(transcript_id) on a miss"""
+        with self._lock:
+            if transcript_id in self._entries:
+                self._entries.move_to_end(transcript_id)
+                return self._entries[transcript_id]
+        entry = load(transcript_id)
+        if entry is not None:
+            with self._lock:
+                self._entries[transcript_id] = entry
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def discard(self, transcript_id):
+        with self._lock:
+            self._entries.pop(transcript_id, None)
+
+index_cache = TimestampIndexCache()
+
+def _load_index(transcript_id):
+    stored = get_timestamp_index(transcript_id)
+    if stored is None:
+        return None
+    cue_text, index_data = stored
+    return TimestampIndex.from_bytes(index_data), cue_text
+
+def load_index(transcript_id):
+    """Return (index, cue_text) for a transcript from the cache or database, None if it has none"""
+    return index_cache.get(transcript_id, _load_index)
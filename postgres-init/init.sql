@@ -41,6 +41,27 @@ CREATE TABLE IF NOT EXISTS transcript_metadata (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Add cue timestamp index table (parallel int32 arrays of cue offsets, start and end times)
+CREATE TABLE IF NOT EXISTS transcript_timestamps (
+    transcript_id INTEGER PRIMARY KEY REFERENCES transcripts(id) ON DELETE CASCADE,
+    cue_count INTEGER NOT NULL,
+    cue_text TEXT NOT NULL,
+    index_data BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Add per-chunk formatting inputs and outputs, used to reprocess only changed chunks
+CREATE TABLE IF NOT EXISTS transcript_chunks (
+    transcript_id INTEGER REFERENCES transcripts(id) ON DELETE CASCADE,
+    chunk_key CHAR(64) NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    position VARCHAR(10) NOT NULL,
+    input_text TEXT NOT NULL,
+    output_text TEXT NOT NULL,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (transcript_id, chunk_key)
+);
+
 -- Add analytics table
 CREATE TABLE IF NOT EXISTS analytics (
     id SERIAL PRIMARY KEY,
@@ -50,12 +71,81 @@ CREATE TABLE IF NOT EXISTS analytics (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Analytics rollups: event and metadata counts per day and dimension, kept current on write
+CREATE TABLE IF NOT EXISTS analytics_rollups (
+    day DATE NOT NULL,
+    dimension VARCHAR(32) NOT NULL,
+    value TEXT NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, dimension, value)
+);
+
+-- Single row recording when the rollups were last rebuilt from the source tables
+CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Add LLM response cache table
+CREATE TABLE IF NOT EXISTS llm_cache (
+    cache_key CHAR(64) PRIMARY KEY,
+    model VARCHAR(100),
+    response TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_hit_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Add LLM call measurements table
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id SERIAL PRIMARY KEY,
+    function_name VARCHAR(100) NOT NULL,
+    model VARCHAR(100),
+    format_style VARCHAR(50),
+    rewrite_options TEXT,
+    prompt_version VARCHAR(16),
+    prompt_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    latency_ms INTEGER,
+    retries INTEGER DEFAULT 0,
+    status VARCHAR(20) DEFAULT 'ok',
+    cached BOOLEAN DEFAULT FALSE,
+    streamed BOOLEAN DEFAULT FALSE,
+    estimated_tokens BOOLEAN DEFAULT FALSE,
+    cost_usd NUMERIC(12, 6) DEFAULT 0,
+    details JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Add background job queue table
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    filename VARCHAR(255),
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    stage VARCHAR(50) DEFAULT 'queued',
+    progress INTEGER DEFAULT 0,
+    payload JSONB,
+    input_data BYTEA,
+    result JSONB,
+    error TEXT,
+    transcript_id INTEGER REFERENCES transcripts(id) ON DELETE SET NULL,
+    attempts INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
 -- Add indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_transcripts_created_at ON transcripts(created_at);
+CREATE INDEX IF NOT EXISTS idx_transcripts_created_at_id ON transcripts(created_at, id);
 CREATE INDEX IF NOT EXISTS idx_post_ideas_transcript_id ON post_ideas(transcript_id);
 CREATE INDEX IF NOT EXISTS idx_rewrites_transcript_id ON rewrites(transcript_id);
 CREATE INDEX IF NOT EXISTS idx_topics ON transcript_metadata USING gin (topics);
 CREATE INDEX IF NOT EXISTS idx_keywords ON transcript_metadata USING gin (keywords);
 CREATE INDEX IF NOT EXISTS idx_tags ON transcript_metadata USING gin (tags);
 CREATE INDEX IF NOT EXISTS idx_analytics_transcript_id ON analytics(transcript_id);
-CREATE INDEX IF NOT EXISTS idx_analytics_action_type ON analytics(action_type);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_analytics_action_type ON analytics(action_type);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_hit_at ON llm_cache(last_hit_at);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_created_at ON llm_calls(created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created_at ON jobs(status, created_at);
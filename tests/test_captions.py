@@ -0,0 +1,44 @@
+from app.captions import iter_cues, iter_cues_from_string
+
+def _cues(content):
+    return list(iter_cues_from_string(content))
+
+def test_srt():
+    cues = _cues("1\n00:00:01,000 --> 00:00:02,500\nHello\nthere\n\n2\n00:01:02,000 --> 01:00:00,000\nBye\n")
+    assert [(c.index, c.start_ms, c.end_ms, c.text) for c in cues] == [
+        (1, 1000, 2500, "Hello there"),
+        (2, 62000, 3600000, "Bye"),
+    ]
+
+def test_webvtt_header_note_and_style_blocks_are_skipped():
+    content = (
+        "﻿WEBVTT Kind: captions\n\n"
+        "NOTE this is\na comment\n\n"
+        "STYLE\n::cue { color: red }\n\n"
+        "00:01.000 --> 00:02.000 align:start\n<c.yellow>Hi</c> <i>you</i> &amp; me\n"
+    )
+    cues = _cues(content)
+    assert [(c.start_ms, c.end_ms, c.text) for c in cues] == [(1000, 2000, "Hi you & me")]
+
+def test_missing_blank_line_between_cues():
+    cues = _cues("1\n00:00:01,000 --> 00:00:02,000\nFirst\n2\n00:00:02,000 --> 00:00:03,000\nSecond\n")
+    assert [c.text for c in cues] == ["First", "Second"]
+
+def test_number_inside_cue_text_is_kept():
+    cues = _cues("1\n00:00:01,000 --> 00:00:02,000\nThe answer is\n42\n\n")
+    assert cues[0].text == "The answer is 42"
+
+def test_garbled_timing_keeps_the_cue_without_times():
+    cues = _cues("1\n00:0x:01 --> soon\nStill here\n")
+    assert [(c.start_ms, c.end_ms, c.text) for c in cues] == [(None, None, "Still here")]
+
+def test_stray_text_and_empty_cues_are_skipped():
+    cues = _cues("junk before\n\n1\n00:00:01,000 --> 00:00:02,000\n\n2\n00:00:02,000 --> 00:00:03,000\n{\\an8}Top\n")
+    assert [(c.index, c.text) for c in cues] == [(1, "Top")]
+
+def test_crlf_lines_from_a_file():
+    lines = ["1\r\n", "00:00:01,000 --> 00:00:02,000\r\n", "Windows\r\n", "\r\n"]
+    assert [c.text for c in iter_cues(lines)] == ["Windows"]
+
+def test_plain_text_has_no_cues():
+    assert _cues("Just a paragraph of text.\n\nAnd another.") == []
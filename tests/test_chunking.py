@@ -0,0 +1,49 @@
+from app.chunking import estimate_tokens, pack_chunks, split_segments, stitch_chunks
+
+def _sentences(count):
+    return [f"Sentence number {i} talks about topic {i % 7} in some detail." for i in range(count)]
+
+def test_split_segments_prefers_paragraphs():
+    assert split_segments("One.\n\nTwo. Three.") == (["One.", "Two. Three."], "\n\n")
+    assert split_segments("One. Two! Three?") == (["One.", "Two!", "Three?"], " ")
+
+def test_chunks_stay_within_budget_and_keep_segments_whole():
+    segments = _sentences(200)
+    chunks = pack_chunks(segments, token_budget=200, overlap_tokens=20, joiner=" ")
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk["text"]) <= 200 for chunk in chunks)
+    assert " ".join(chunk["text"] for chunk in chunks) == " ".join(segments)
+
+def test_context_is_the_tail_of_the_previous_chunk():
+    chunks = pack_chunks(_sentences(100), token_budget=200, overlap_tokens=20, joiner=" ")
+    assert chunks[0]["context"] == ""
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["context"]
+        assert previous["text"].endswith(chunk["context"])
+
+def test_oversized_segment_is_split():
+    segment = " ".join(f"word{i}" for i in range(2000))
+    chunks = pack_chunks([segment], token_budget=100, overlap_tokens=0, content_defined=False)
+    assert len(chunks) > 1
+    assert " ".join(chunk["text"] for chunk in chunks) == segment
+
+def test_content_defined_boundaries_survive_an_edit():
+    segments = _sentences(400)
+    before = [c["text"] for c in pack_chunks(segments, token_budget=200, overlap_tokens=0, joiner=" ")]
+    edited = list(segments)
+    edited[300] = "An entirely rewritten sentence that replaces the original one."
+    after = [c["text"] for c in pack_chunks(edited, token_budget=200, overlap_tokens=0, joiner=" ")]
+    changed = [i for i, text in enumerate(after) if text not in before]
+    # Only a few chunks around the edit change; boundaries resynchronize after them
+    assert 1 <= len(changed) <= 4
+    assert changed == list(range(changed[0], changed[-1] + 1))
+    assert after[:changed[0]] == before[:changed[0]]
+    remaining = len(after) - changed[-1] - 1
+    assert after[len(after) - remaining:] == before[len(before) - remaining:]
+
+def test_blank_segments_are_ignored():
+    assert pack_chunks(["", "  ", "Text."], token_budget=50) == [{"text": "Text.", "context": ""}]
+
+def test_stitch_drops_heading_repeated_across_chunks():
+    outputs = ["## Intro\n\nFirst part.", "## Intro\n\nSecond part.", "## Next\n\nThird."]
+    assert stitch_chunks(outputs) == "## Intro\n\nFirst part.\n\nSecond part.\n\n## Next\n\nThird."
@@ -0,0 +1,77 @@
+from app.captions import iter_cues_from_string
+from app.cleanup import clean_transcript, dedup_rolling_captions, is_rolling, remove_fillers
+
+NORMAL_SRT = """1
+00:00:01,000 --> 00:00:03,000
+We went to the store
+
+2
+00:00:03,000 --> 00:00:05,000
+the store was closed.
+
+3
+00:00:05,000 --> 00:00:07,000
+So we went home, and that it is
+
+4
+00:00:07,000 --> 00:00:09,000
+it is what it is, I suppose.
+
+5
+00:00:09,000 --> 00:00:11,000
+Tomorrow we try again.
+"""
+
+ROLLING_CUES = [
+    "hello and welcome to",
+    "welcome to the show today",
+    "the show today we talk",
+    "we talk about cats and",
+    "cats and dogs",
+]
+
+def _segments(content):
+    return [cue.text for cue in iter_cues_from_string(content)]
+
+def test_normal_srt_passes_through_unchanged():
+    segments = _segments(NORMAL_SRT)
+    text, cleaned, joiner, _ = clean_transcript(" ".join(segments), segments, " ")
+    assert cleaned == segments
+    assert text == " ".join(segments)
+
+def test_normal_srt_is_not_rolling():
+    assert not is_rolling(_segments(NORMAL_SRT))
+
+def test_two_cues_sharing_words_are_kept():
+    segments = ["we went to the store", "the store was closed"]
+    assert clean_transcript(" ".join(segments), segments, " ")[1] == segments
+
+def test_rolling_captions_are_deduplicated():
+    assert is_rolling(ROLLING_CUES)
+    text = clean_transcript(" ".join(ROLLING_CUES), ROLLING_CUES, " ")[0]
+    assert text == "hello and welcome to the show today we talk about cats and dogs"
+
+def test_dedup_drops_cues_that_add_nothing():
+    assert dedup_rolling_captions(["one two three", "two three", "two three four"]) == ["one two three", "four"]
+
+def test_filler_keeps_sentence_punctuation():
+    assert remove_fillers("I said um. Then we left.") == "I said. Then we left."
+
+def test_filler_at_sentence_start_is_dropped_with_its_comma():
+    assert remove_fillers("Hmm, OK.") == "OK."
+    assert remove_fillers("Wait. Um. So we") == "Wait. So we"
+
+def test_filler_between_words():
+    assert remove_fillers("so um we go") == "so we go"
+    assert remove_fillers("we, um, went") == "we, went"
+
+def test_uppercase_acronym_is_not_a_filler():
+    assert remove_fillers("UM is a school") == "UM is a school"
+
+def test_units_and_grammatical_repeats_survive():
+    text = "I knew that that was 5 mm wide. Hmm, OK.\n\nEnd\n\nend of story"
+    assert remove_fillers(text) == "I knew that that was 5 mm wide. OK.\n\nEnd\n\nend of story"
+
+def test_stutters_are_collapsed_on_one_line_only():
+    assert remove_fillers("I I I think the the point") == "I think the point"
+    assert remove_fillers("the\nthe point") == "the\nthe point"
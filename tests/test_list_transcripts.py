@@ -0,0 +1,88 @@
+import datetime
+from contextlib import contextmanager
+import pytest
+from app import database
+from app.database import decode_list_cursor, encode_list_cursor, list_transcripts
+
+class FakeCursor:
+    def __init__(self, rows, table_rows):
+        self.rows = rows
+        self.table_rows = table_rows
+        self.executed = []
+        self._result = None
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        if "FROM pg_class" in sql:
+            self._result = [(self.table_rows,)]
+        elif "count(*)" in sql:
+            self._result = [(len(self.rows),)]
+        else:
+            rows = self.rows
+            if params.get("after_id") is not None:
+                after = (params["after_created_at"], params["after_id"])
+                rows = [row for row in rows if (row[0], row[1]) < after]
+            self._result = rows[:params["limit"]]
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0]
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    start = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    # Newest first, with two rows sharing a created_at to exercise the id tie-break
+    rows = []
+    for transcript_id in range(5, 0, -1):
+        created_at = start + datetime.timedelta(minutes=min(transcript_id, 4))
+        rows.append((created_at, transcript_id, transcript_id, f"file{transcript_id}.srt"))
+    cursor = FakeCursor(rows, table_rows=5)
+
+    class FakeConnection:
+        def cursor(self):
+            return cursor
+
+    @contextmanager
+    def connection():
+        yield FakeConnection()
+
+    monkeypatch.setattr(database, "connection", connection)
+    return cursor
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2024, 5, 6, 7, 8, 9, 123456)
+    assert decode_list_cursor(encode_list_cursor(created_at, 42)) == (created_at, 42)
+
+@pytest.mark.parametrize("value", ["", "nonsense", "2024-01-01T00:00:00~x", "~5", "2024-13-01T00:00:00~1"])
+def test_malformed_cursor_raises_value_error(value):
+    with pytest.raises(ValueError):
+        decode_list_cursor(value)
+
+def test_unknown_field_raises_value_error():
+    with pytest.raises(ValueError):
+        list_transcripts(fields=["id", "password"])
+
+def test_pages_cover_every_row_once(fake_db):
+    seen = []
+    after = None
+    while True:
+        page = list_transcripts(limit=2, after=after, fields=["id", "filename"])
+        seen += [item["id"] for item in page["items"]]
+        after = page["next_cursor"]
+        if after is None:
+            break
+    assert seen == [5, 4, 3, 2, 1]
+
+def test_last_page_has_no_cursor_and_exact_total(fake_db):
+    page = list_transcripts(limit=10, fields=["id", "filename"])
+    assert page["next_cursor"] is None
+    assert page["total"] == 5
+    assert page["total_is_estimate"] is False
+
+def test_first_page_has_no_where_clause(fake_db):
+    list_transcripts(limit=2, fields=["id"])
+    sql, params = fake_db.executed[0]
+    assert "WHERE" not in sql
+    assert params["limit"] == 3
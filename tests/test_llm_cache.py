@@ -0,0 +1,45 @@
+from app import llm_cache
+from app.llm_cache import LLMResponseCache, cache_key
+
+MESSAGES = [{"role": "system", "content": "Format this."}, {"role": "user", "content": "some text"}]
+
+def test_cache_key_depends_on_every_option():
+    base = cache_key("gpt", MESSAGES, 0.3)
+    assert cache_key("gpt", list(MESSAGES), 0.3) == base
+    assert cache_key("other", MESSAGES, 0.3) != base
+    assert cache_key("gpt", MESSAGES, 0.7) != base
+    assert cache_key("gpt", MESSAGES, 0.3, max_tokens=100) != base
+    assert cache_key("gpt", MESSAGES[:1] + [{"role": "user", "content": "other"}], 0.3) != base
+
+def test_memory_tier_is_lru():
+    cache = LLMResponseCache(max_entries=2, persistent=False)
+    cache.put("a", "gpt", "A")
+    cache.put("b", "gpt", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "gpt", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.stats()["memory_evictions"] == 1
+
+def test_entries_expire(monkeypatch):
+    cache = LLMResponseCache(ttl_seconds=10, persistent=False)
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache.put("a", "gpt", "A")
+    now[0] += 11
+    assert cache.get("a") is None
+
+def test_empty_responses_are_not_cached():
+    cache = LLMResponseCache(persistent=False)
+    cache.put("a", "gpt", "  ")
+    assert cache.get("a") is None
+
+def test_persistent_hit_fills_memory(monkeypatch):
+    stored = {"k": "from db"}
+    monkeypatch.setattr(llm_cache, "get_cached_llm_response", lambda key, ttl: stored.get(key))
+    cache = LLMResponseCache(persistent=True)
+    assert cache.get("k") == "from db"
+    stored.clear()
+    assert cache.get("k") == "from db"
+    stats = cache.stats()
+    assert (stats["persistent_hits"], stats["memory_hits"]) == (1, 1)
@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+from app import llm_scheduler
+from app.llm_backends import BackendError
+from app.llm_scheduler import LLMCallError, RateLimiter, arun_with_retries, run_with_retries
+
+@pytest.fixture
+def limiter(monkeypatch, tmp_path):
+    shared = RateLimiter(requests_per_minute=60, tokens_per_minute=600, state_file=str(tmp_path / "limiter.json"))
+    monkeypatch.setattr(llm_scheduler, "limiter", shared)
+    monkeypatch.setattr(llm_scheduler, "LLM_BACKOFF_BASE_SECONDS", 0.0)
+    return shared
+
+def test_requests_bucket_runs_dry(tmp_path):
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=0, state_file=str(tmp_path / "state.json"))
+    assert limiter.try_acquire(10) == 0
+    assert limiter.try_acquire(10) == 0
+    assert limiter.try_acquire(10) > 0
+
+def test_tokens_bucket_wait_is_proportional(tmp_path):
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=600, state_file=str(tmp_path / "state.json"))
+    assert limiter.try_acquire(600) == 0
+    assert limiter.try_acquire(60) == pytest.approx(6.0, abs=0.5)
+
+def test_adjust_charges_real_usage(tmp_path):
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=600, state_file=str(tmp_path / "state.json"))
+    assert limiter.try_acquire(100) == 0
+    limiter.adjust(500)
+    assert limiter.try_acquire(10) > 0
+
+def test_state_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "state.json")
+    first = RateLimiter(requests_per_minute=1, tokens_per_minute=0, state_file=path)
+    second = RateLimiter(requests_per_minute=1, tokens_per_minute=0, state_file=path)
+    assert first.try_acquire(1) == 0
+    assert second.try_acquire(1) > 0
+
+def test_block_until_pauses_everyone(tmp_path):
+    limiter = RateLimiter(state_file=str(tmp_path / "state.json"))
+    limiter.block_until(llm_scheduler.time.time() + 30)
+    assert limiter.try_acquire(1) == pytest.approx(30, abs=1)
+
+def test_retryable_errors_are_retried(limiter):
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) < 3:
+            raise BackendError("busy", retryable=True, status="rate_limited")
+        return {"usage": {"total_tokens": 5}}
+
+    stats = {}
+    assert run_with_retries(call, 5, stats) == {"usage": {"total_tokens": 5}}
+    assert stats["retries"] == 2
+
+def test_non_retryable_error_raises_immediately(limiter):
+    def call():
+        raise BackendError("bad request", status="failed")
+
+    with pytest.raises(LLMCallError) as raised:
+        run_with_retries(call, 5)
+    assert raised.value.http_status == 502
+
+def test_async_retries(limiter):
+    calls = []
+
+    async def acall():
+        calls.append(1)
+        if len(calls) == 1:
+            raise BackendError("timeout", retryable=True, status="timeout")
+        return {"usage": {"total_tokens": 5}}
+
+    assert asyncio.run(arun_with_retries(acall, 5)) == {"usage": {"total_tokens": 5}}
+    assert len(calls) == 2
@@ -0,0 +1,68 @@
+import pytest
+from app.captions import iter_cues_from_string
+from app.timestamps import TimestampIndex, find_phrase
+
+SRT = """1
+00:00:01,000 --> 00:00:02,500
+hello there
+
+2
+00:00:02,500 --> 00:00:04,000
+general kenobi
+
+3
+00:0a:04 --> later
+you are a bold one
+"""
+
+def _index():
+    cues = list(iter_cues_from_string(SRT.replace("00:0a:04 --> later", "00:00:04,000 --> 00:00:06,000")))
+    text = " ".join(cue.text for cue in cues)
+    return TimestampIndex.from_cues(cues, " "), text
+
+def test_length_is_the_joined_text_length():
+    index, text = _index()
+    assert index.length == len(text)
+    assert TimestampIndex.from_cues([]).length == 0
+
+def test_round_trip_keeps_arrays_and_length():
+    index, _ = _index()
+    loaded = TimestampIndex.from_bytes(index.to_bytes())
+    assert list(loaded.offsets) == list(index.offsets)
+    assert list(loaded.starts) == list(index.starts)
+    assert list(loaded.ends) == list(index.ends)
+    assert loaded.length == index.length
+
+def test_from_bytes_rejects_other_data():
+    with pytest.raises(ValueError):
+        TimestampIndex.from_bytes(b"NOPE" + b"\0" * 8)
+
+def test_lookup_maps_offsets_to_cues():
+    index, text = _index()
+    assert index.lookup(0) == {"start_ms": 1000, "end_ms": 2500, "first_cue": 1, "last_cue": 1}
+    assert index.lookup(text.index("kenobi"), len(text) - 1) == {
+        "start_ms": 2500, "end_ms": 6000, "first_cue": 2, "last_cue": 3
+    }
+
+def test_offsets_outside_the_text_are_not_found():
+    index, text = _index()
+    assert index.lookup(-1) is None
+    assert index.lookup(len(text)) is None
+    assert index.lookup(10_000) is None
+    assert index.lookup(0, len(text)) is None
+
+def test_inverted_range_is_rejected():
+    index, _ = _index()
+    with pytest.raises(ValueError):
+        index.lookup(10, 5)
+
+def test_unknown_timings_are_none():
+    cues = list(iter_cues_from_string(SRT))
+    index = TimestampIndex.from_cues(cues, " ")
+    assert index.lookup(index.length - 1)["start_ms"] is None
+
+def test_find_phrase_ignores_case_and_punctuation():
+    index, text = _index()
+    matches = find_phrase(index, text, "General, Kenobi!")
+    assert [(m["first_cue"], m["start_ms"]) for m in matches] == [(2, 2500)]
+    assert find_phrase(index, text, "...") == []